@@ -11,8 +11,16 @@ from PIL import Image, ImageTk, ImageOps
 import threading
 import random
 import time
+import io
 import os
+import queue
+import re
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from aruco_generador import crear_aruco
+from gcode_cache import cache_global
+from estimador_gcode import estimar_tiempo, leer_ajustes_grbl, formatear_duracion
+from grbl_link import enlace, CMD_TIMEOUT
 
 # Importar funcionalidades del láser
 try:
@@ -89,24 +97,29 @@ def open_serial(port: str, baud: int = 115200, timeout: float = 1.0):
     ser.reset_input_buffer()
     return ser
 
-def _readline(ser):
-    """Lee una línea del puerto serial"""
-    raw = ser.readline()
-    return raw.decode(errors="ignore").strip() if raw else ""
-
-def send_cmd(ser, cmd: str) -> str:
-    """Envía una línea y espera 'ok' / 'error' / 'ALARM'."""
-    cmd = cmd.strip()
-    if not cmd:
-        return "ok"
-    ser.write((cmd + "\n").encode())
+def _wait_response(fut, cancel=None, timeout=None) -> str:
+    """Espera la respuesta de una línea enviada con GrblLink.send.
+
+    Devuelve 'ok' / 'error:N' / 'ALARM:N' / 'reset', o 'cancel' si se activa
+    cancel; lanza TimeoutError si pasan 'timeout' segundos sin respuesta.
+    """
+    limite = None if timeout is None else time.monotonic() + timeout
     while True:
-        line = _readline(ser)
-        if not line:
-            continue
-        L = line.lower()
-        if line == "ok" or L.startswith("error") or line.upper().startswith("ALARM"):
-            return line
+        if cancel is not None and cancel.is_set():
+            return "cancel"
+        espera = 0.1 if cancel is not None else None
+        if limite is not None:
+            restante = max(0.0, limite - time.monotonic())
+            espera = restante if espera is None else min(espera, restante)
+        try:
+            return fut.result(espera)
+        except FutureTimeoutError:
+            if limite is not None and time.monotonic() >= limite:
+                raise TimeoutError(f"GRBL no respondió a '{fut.linea}' en {timeout} s")
+
+def send_cmd(ser, cmd: str, timeout: float = CMD_TIMEOUT) -> str:
+    """Envía una línea y espera 'ok' / 'error' / 'ALARM' como mucho 'timeout' segundos."""
+    return _wait_response(enlace(ser).send(cmd), timeout=timeout)
 
 def mm_per_pixel(ppmm: float) -> float:
     """Convierte píxeles por mm a mm por píxel"""
@@ -245,28 +258,387 @@ def raster_to_gcode(img: Image.Image, *, ppmm: float, origin, f_engrave: float,
     yield "M5"
     yield ";; --- END ---"
 
-def stream_to_grbl(ser, gcode_text: str) -> int:
-    """Envía G-code a GRBL"""
-    send_cmd(ser, "$X")
-    send_cmd(ser, "G21")
-    send_cmd(ser, "G90")
+def _tabla_256(fn):
+    """Tabla con fn (Python puro) evaluada una vez para cada valor de píxel 0..255"""
+    return np.array([fn(v) for v in range(256)])
+
+def _tramos(mascara):
+    """Devuelve (inicio, fin) de cada tramo True de una fila usando np.diff"""
+    bordes = np.diff(np.concatenate(([0], mascara.view(np.int8), [0])))
+    return zip(np.flatnonzero(bordes == 1).tolist(), np.flatnonzero(bordes == -1).tolist())
+
+def raster_to_gcode_np(img: Image.Image, *, ppmm: float, origin, f_engrave: float,
+                       f_travel: float, s_max: int, mode: str, gamma_val: float):
+    """Versión vectorizada de raster_to_gcode (misma salida, línea por línea)"""
+    px_w, px_h = img.size
+    step = mm_per_pixel(ppmm)
+    ox, oy = origin
+
+    OVERSCAN_MM = 0.6
+    S_FIXED = s_max
+
+    arr = np.asarray(img)
+    if arr.dtype == bool:
+        arr = arr.view(np.uint8)
+    if arr.ndim != 2 or arr.dtype != np.uint8:
+        raise ValueError(f"Modo de imagen no soportado: {img.mode}")
+
+    # Intensidad, potencia y umbral calculados una sola vez por valor de píxel
+    # con las mismas fórmulas que raster_to_gcode (salida byte a byte idéntica);
+    # las tablas se aplican fila a fila para no crear mapas del tamaño de la imagen
+    if img.mode == "1":
+        inten_fn = lambda p: 1.0 if p == 0 else 0.0
+    else:
+        inten_fn = lambda p: (255 - p) / 255.0
+
+    def s_fn(p):
+        s_val = int(round(gamma_correct(inten_fn(p), gamma_val) * s_max))
+        if s_val > 0 and s_val < 50:
+            s_val = 50
+        return s_val
+
+    graysc = mode == "graysc"
+    if graysc:
+        s_lut = _tabla_256(s_fn)
+    else:
+        lit_lut = _tabla_256(lambda p: inten_fn(p) > 0.5).astype(bool)
+
+    x_mm = (ox + np.arange(px_w) * step).tolist()
+    g1_x = [f"G1 X{v:.4f}" for v in x_mm]
+    g1_over = [f"G1 X{(v + OVERSCAN_MM):.4f}" for v in x_mm]
+    m4_fixed = f"M4 S{S_FIXED}"
+    f_engr = f"F{f_engrave:.4f}"
+    f_trav = f"F{f_travel:.4f}"
+
+    yield ";; --- BEGIN ---"
+    yield "G21"
+    yield "G90"
+    yield "M5"
+    yield f_trav
+
+    for row in range(px_h):
+        y_mm = oy + (px_h - 1 - row) * step
+        y_txt = f" Y{y_mm:.4f}"
+
+        if row % 2 == 0:
+            xs = np.arange(px_w)
+            fila = arr[row]
+        else:
+            xs = np.arange(px_w - 1, -1, -1)
+            fila = arr[row, ::-1]
+        xs_l = xs.tolist()
+
+        if graysc:
+            s_row = s_lut[fila]
+            lit = s_row > 0
+        else:
+            lit = lit_lut[fila]
+
+        out = [f"G0 X{(x_mm[xs_l[0]] - OVERSCAN_MM):.4f}{y_txt}", f_engr]
+
+        for a, b in _tramos(lit):
+            if graysc:
+                # Un M4 por cada cambio de potencia dentro del tramo
+                s_run = s_row[a:b]
+                cortes = np.flatnonzero(np.diff(s_run)) + 1
+                inicios = [0] + cortes.tolist()
+                finales = cortes.tolist() + [b - a]
+                s_vals = s_run[inicios].tolist()
+                for c, d, s_val in zip(inicios, finales, s_vals):
+                    out.append(f"M4 S{s_val}")
+                    out.extend(g1_x[x] + y_txt for x in xs_l[a + c:a + d])
+                if b < px_w:
+                    out.append(g1_over[xs_l[b]] + y_txt)
+                    out.append("M5")
+            elif b < px_w:
+                x = xs_l[b]
+                out.append(m4_fixed)
+                out.append(g1_x[x] + y_txt)
+                out.append(g1_over[x] + y_txt)
+                out.append("M5")
+            if b == px_w:
+                end_x = xs_l[-1]
+                out.append(m4_fixed)
+                out.append(g1_x[end_x] + y_txt)
+                out.append(g1_over[end_x] + y_txt)
+                out.append("M5")
+
+        out.append(f_trav)
+        yield from out
+
+    yield "M5"
+    yield ";; --- END ---"
+
+RASTER_ENGINES = {
+    "python": raster_to_gcode,
+    "numpy": raster_to_gcode_np,
+}
+
+_RE_MOVIMIENTO = re.compile(r"^G0?([01])((?:\s+[XY]-?\d+(?:\.\d*)?)+)$")
+_RE_EJE = re.compile(r"([XY])(-?\d+(?:\.\d*)?)")
+
+def cuantizar_potencia(s_val: int, niveles: int, s_max: int) -> int:
+    """Lleva una potencia S al nivel más cercano de 'niveles' escalones (nunca apaga un píxel encendido)"""
+    if s_val <= 0:
+        return 0
+    nivel = max(1, min(niveles, int(round(s_val * niveles / s_max))))
+    return int(round(nivel * s_max / niveles))
+
+def optimize_gcode(lines, *, power_levels=None, s_max: int = 1000):
+    """Compacta el G-code del raster sin cambiar lo que se graba.
+
+    - Une G1 consecutivos colineales con la misma potencia en un solo G1.
+    - Con power_levels=N cuantiza cada 'M4 S' a N niveles entre 0 y s_max.
+    - Los F / M5 / M4 sólo se emiten justo antes del movimiento al que afectan
+      y si cambian el estado modal (se eliminan los F y M5 entre filas).
+    - Omite la coordenada X o Y que no cambia respecto al movimiento anterior.
+
+    Es un generador: procesa 'lines' a medida que llegan.
+    """
+    out = []  # líneas listas para entregar
+    f_act = None             # F emitido
+    laser_act = None         # ('M5', None) o ('M4', S) emitido
+    f_pend = None            # último F leído, pendiente de emitir
+    laser_pend = None        # último M4/M5 leído, pendiente de emitir
+    pos = None               # posición (x, y) tras el último movimiento
+    txt = {"X": None, "Y": None}  # última coordenada escrita de cada eje
+    tramo = None             # G1 retenido: [inicio, fin, {'X': txt, 'Y': txt}]
+
+    def volcar_tramo():
+        nonlocal tramo
+        if tramo is None:
+            return
+        palabras = [f"{eje}{v}" for eje, v in tramo[2].items() if v != txt[eje]]
+        if palabras:
+            out.append("G1 " + " ".join(palabras))
+            txt.update(tramo[2])
+        tramo = None
+
+    def volcar_laser():
+        nonlocal laser_act
+        if laser_pend is not None and laser_pend != laser_act:
+            out.append("M5" if laser_pend[0] == "M5" else f"M4 S{laser_pend[1]}")
+            laser_act = laser_pend
+
+    def colineal(a, b, c):
+        ux, uy = b[0] - a[0], b[1] - a[1]
+        vx, vy = c[0] - b[0], c[1] - b[1]
+        return abs(ux * vy - uy * vx) < 1e-9 and ux * vx + uy * vy > 0
+
+    for raw in lines:
+        if out:
+            yield from out
+            out.clear()
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith(";"):
+            volcar_tramo()
+            volcar_laser()
+            out.append(line)
+            continue
+        if line == "M5":
+            laser_pend = ("M5", None)
+            continue
+        if line.startswith("M4 S"):
+            s_val = int(float(line[4:]))
+            if power_levels:
+                s_val = cuantizar_potencia(s_val, power_levels, s_max)
+            laser_pend = ("M4", s_val)
+            continue
+        if line[0] == "F" and len(line) > 1:
+            f_pend = line
+            continue
+
+        m = _RE_MOVIMIENTO.match(line)
+        if not m:
+            # Cualquier otra orden se respeta tal cual y corta la optimización
+            volcar_tramo()
+            volcar_laser()
+            out.append(line)
+            pos = None
+            txt.update(X=None, Y=None)
+            continue
+
+        palabras = dict(_RE_EJE.findall(m.group(2)))
+        if pos is not None:
+            destino = (float(palabras.get("X", pos[0])), float(palabras.get("Y", pos[1])))
+        elif "X" in palabras and "Y" in palabras:
+            destino = (float(palabras["X"]), float(palabras["Y"]))
+        else:
+            destino = None
+
+        if m.group(1) == "0":
+            volcar_tramo()
+            volcar_laser()
+            ejes = [f"{eje}{v}" for eje, v in palabras.items() if v != txt[eje] or destino is None]
+            if ejes:
+                out.append("G0 " + " ".join(ejes))
+                txt.update(palabras)
+            pos = destino
+            continue
+
+        cambia_estado = (f_pend is not None and f_pend != f_act) or (
+            laser_pend is not None and laser_pend != laser_act)
+        if (tramo is not None and not cambia_estado and destino is not None
+                and colineal(tramo[0], tramo[1], destino)):
+            # Mismo estado y misma recta: se alarga el G1 retenido
+            tramo[1] = destino
+            tramo[2].update(palabras)
+            pos = destino
+            continue
+
+        volcar_tramo()
+        volcar_laser()
+        if f_pend is not None and f_pend != f_act:
+            out.append(f_pend)
+            f_act = f_pend
+        if pos is None or destino is None:
+            out.append("G1 " + " ".join(f"{eje}{v}" for eje, v in palabras.items()))
+            txt.update(palabras)
+        else:
+            tramo = [pos, destino, dict(palabras)]
+        pos = destino
+
+    volcar_tramo()
+    volcar_laser()
+    yield from out
+
+GRBL_RX_BUFFER = 127  # bytes del buffer serie de GRBL
+STREAM_TIMEOUT = 30.0  # s sin ninguna respuesta de GRBL tras los que se aborta el envío
+
+def stream_to_grbl(ser, gcode_text, *, protocol: str = "char-count", log=None,
+                   progress=None, cancel=None, pause=None) -> int:
+    """Envía G-code a GRBL (texto completo o cualquier iterable de líneas).
+
+    protocol='char-count' mantiene lleno el buffer RX de GRBL contando los
+    bytes enviados que aún no tienen 'ok'; protocol='sync' espera el 'ok' de
+    cada línea antes de mandar la siguiente. Ante un error se deja de enviar,
+    se apaga el láser (M5) y, si hay log, se indica la línea que lo causó.
+    Si GRBL pasa STREAM_TIMEOUT segundos sin responder nada (un 'ok' perdido)
+    se trata como un error: se avisa y se deja de enviar en vez de esperar
+    para siempre. Mientras pause (un threading.Event) está activo el trabajo
+    está en feed-hold y GRBL no contesta: ese tiempo no cuenta y el plazo
+    vuelve a empezar al reanudar.
+
+    progress(n) se llama con el número de líneas enviadas; si cancel (un
+    threading.Event) se activa, se deja de enviar y de esperar respuestas
+    sin mandar nada más (quien cancela hace el soft-reset). Devuelve 0 si
+    terminó bien, 2 si hubo error y 3 si se canceló.
+    """
+    link = enlace(ser)
+    send_cmd(link, "$X")
+    send_cmd(link, "G21")
+    send_cmd(link, "G90")
 
     errors = 0
-    for raw in gcode_text.splitlines():
+    pending = deque()  # (nº de línea, línea, bytes, Future) enviadas sin respuesta
+    in_buffer = 0
+    sent = 0
+    last_reply = time.monotonic()  # la espera cuenta desde la última respuesta, no desde cada envío
+
+    def report(n, line, resp):
+        nonlocal errors
+        errors += 1
+        if log:
+            log(f"Error en línea {n} '{line}': {resp}")
+
+    def wait(n, line, fut):
+        nonlocal last_reply
+        while True:
+            pausado = pause is not None and pause.is_set()
+            if pausado:
+                last_reply = time.monotonic()   # en feed-hold el plazo no corre
+            restante = max(0.0, last_reply + STREAM_TIMEOUT - time.monotonic())
+            try:
+                # Con pausa posible se espera a trozos para ver cuándo empieza / acaba
+                resp = _wait_response(fut, cancel, min(restante, 0.1) if pause is not None else restante)
+            except TimeoutError:
+                if pausado or time.monotonic() < last_reply + STREAM_TIMEOUT:
+                    continue
+                link.descartar_pendientes()   # los Future que quedan ya no van a casar con sus 'ok'
+                return f"sin respuesta en {STREAM_TIMEOUT:g} s"
+            last_reply = time.monotonic()
+            return resp
+
+    def ack():
+        nonlocal in_buffer
+        n, line, size, fut = pending.popleft()
+        in_buffer -= size
+        resp = wait(n, line, fut)
+        if resp == "cancel":
+            pending.clear()
+        elif resp != "ok":
+            report(n, line, resp)
+            if resp.startswith("sin respuesta"):
+                pending.clear()   # GRBL no contesta: no esperar al resto
+
+    if protocol not in ("char-count", "sync"):
+        raise ValueError(f"Protocolo de envío desconocido: {protocol}")
+
+    if isinstance(gcode_text, str):
+        gcode_text = io.StringIO(gcode_text)  # recorre el texto sin copiarlo en una lista
+    for n, raw in enumerate(gcode_text, 1):
         line = raw.strip()
         if not line or line.startswith(";"):
             continue
-        resp = send_cmd(ser, line)
-        if resp != "ok":
-            errors += 1
-            send_cmd(ser, "M5")
+        if cancel is not None and cancel.is_set():
             break
+        if protocol == "sync":
+            fut = link.send(line)
+            sent += 1
+            if progress:
+                progress(sent)
+            last_reply = time.monotonic()
+            resp = wait(n, line, fut)
+            if resp == "cancel":
+                break
+            if resp != "ok":
+                report(n, line, resp)
+                break
+            continue
 
-    send_cmd(ser, "M5")
-    return 0 if errors == 0 else 2
-
-def move_to_offset_and_set_origin(ser, dx: float = 0.0, dy: float = 0.0, feed: int = 1000):
-    """Mueve a offset y establece origen"""
+        data = (line + "\n").encode()
+        # Esperar los 'ok' necesarios para que la línea quepa en el buffer RX
+        while pending and in_buffer + len(data) > GRBL_RX_BUFFER and not errors:
+            ack()
+        if errors or (cancel is not None and cancel.is_set()):
+            break
+        pending.append((n, line, len(data), link.send(line)))
+        in_buffer += len(data)
+        sent += 1
+        if progress:
+            progress(sent)
+
+    # Recoger las respuestas de lo que quedó en el buffer
+    while pending:
+        ack()
+
+    if cancel is not None and cancel.is_set():
+        return 3
+    if errors:
+        try:
+            send_cmd(link, "M5")
+        except TimeoutError as e:
+            if log:
+                log(f"No se pudo apagar el láser: {e}")
+        return 2
+    send_cmd(link, "M5")
+    return 0
+
+MOVE_TIMEOUT = 120.0  # s máximos para que un desplazamiento termine
+
+def esperar_reposo(ser, timeout: float = MOVE_TIMEOUT):
+    """Espera a que GRBL termine todo lo enviado y quede en Idle"""
+    link = enlace(ser)
+    if not link.esperar_idle(timeout):
+        if link.estado.alarma:
+            raise RuntimeError(f"GRBL en alarma: {link.ultimo_estado}")
+        raise TimeoutError(f"GRBL no quedó en reposo en {timeout} s ({link.estado})")
+
+def move_to_offset_and_set_origin(ser, dx: float = 0.0, dy: float = 0.0, feed: int = 1000,
+                                  timeout: float = MOVE_TIMEOUT):
+    """Mueve a offset y establece origen (vuelve cuando el cabezal ha llegado)"""
     send_cmd(ser, "G90")
     send_cmd(ser, "G91")
     parts = []
@@ -275,33 +647,280 @@ def move_to_offset_and_set_origin(ser, dx: float = 0.0, dy: float = 0.0, feed: i
     if parts:
         send_cmd(ser, f"G1 {' '.join(parts)} F{int(feed)}")
     send_cmd(ser, "G90")
+    esperar_reposo(ser, timeout)
     send_cmd(ser, "G92 X0 Y0")
 
-def move_back_to_machine_origin(ser):
-    """Retorna al origen de máquina"""
+def move_back_to_machine_origin(ser, timeout: float = MOVE_TIMEOUT):
+    """Retorna al origen de máquina (vuelve cuando el cabezal ha llegado)"""
     send_cmd(ser, "G92.1")
     send_cmd(ser, "G90")
     send_cmd(ser, "G53 G0 X0 Y0")
+    esperar_reposo(ser, timeout)
+
+def iter_gcode_lines(*, image_path: str, size_mm, ppmm: float, mode: str,
+                     invert: bool, gamma_val: float, origin_xy, f_engrave: float,
+                     f_travel: float, s_max: int, engine: str = "numpy",
+                     optimize: bool = False, power_levels=None):
+    """Genera el G-code de una imagen línea a línea, fila por fila"""
+    if engine not in RASTER_ENGINES:
+        raise ValueError(f"Motor de G-code desconocido: {engine}")
+    img = prepare_image(image_path, size_mm, ppmm, invert, mode)
+    lines = RASTER_ENGINES[engine](
+        img,
+        ppmm=ppmm,
+        origin=origin_xy,
+        f_engrave=f_engrave,
+        f_travel=f_travel,
+        s_max=s_max,
+        mode=mode,
+        gamma_val=gamma_val,
+    )
+    if optimize:
+        lines = optimize_gcode(lines, power_levels=power_levels, s_max=s_max)
+    return lines
 
 def generate_gcode_text(*, image_path: str, size_mm, ppmm: float, mode: str, 
                        invert: bool, gamma_val: float, origin_xy, f_engrave: float, 
-                       f_travel: float, s_max: int) -> str:
-    """Genera G-code completo para una imagen"""
-    img = prepare_image(image_path, size_mm, ppmm, invert, mode)
-    lines = list(
-        raster_to_gcode(
-            img,
-            ppmm=ppmm,
-            origin=origin_xy,
-            f_engrave=f_engrave,
-            f_travel=f_travel,
-            s_max=s_max,
-            mode=mode,
-            gamma_val=gamma_val,
-        )
-    )
+                       f_travel: float, s_max: int, engine: str = "numpy",
+                       optimize: bool = False, power_levels=None) -> str:
+    """Genera G-code completo para una imagen (engine: 'numpy' o 'python').
+
+    Con optimize=True el resultado pasa por optimize_gcode (power_levels
+    cuantiza la potencia a N niveles).
+    """
+    lines = iter_gcode_lines(image_path=image_path, size_mm=size_mm, ppmm=ppmm, mode=mode,
+                             invert=invert, gamma_val=gamma_val, origin_xy=origin_xy,
+                             f_engrave=f_engrave, f_travel=f_travel, s_max=s_max,
+                             engine=engine, optimize=optimize, power_levels=power_levels)
     return "\n".join(lines) + "\n"
 
+STREAM_QUEUE_LINES = 2048  # líneas máximas entre el generador y el envío
+STREAM_BATCH_LINES = 256   # las líneas viajan por la cola en lotes
+
+def _cola_acotada(lines, maxsize: int = STREAM_QUEUE_LINES):
+    """Produce 'lines' en un hilo aparte y las entrega a través de una cola acotada.
+
+    Si el consumidor deja de leer (p. ej. por un error de GRBL) el productor
+    se detiene; si el productor falla, la excepción se relanza aquí.
+    """
+    cola = queue.Queue(maxsize=max(1, maxsize // STREAM_BATCH_LINES))
+    fin = object()
+    parar = threading.Event()
+    error = []
+
+    def poner(item):
+        while not parar.is_set():
+            try:
+                cola.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def productor():
+        try:
+            lote = []
+            for line in lines:
+                lote.append(line)
+                if len(lote) >= STREAM_BATCH_LINES:
+                    if not poner(lote):
+                        return
+                    lote = []
+            if lote and not poner(lote):
+                return
+        except Exception as e:
+            error.append(e)
+        poner(fin)
+
+    hilo = threading.Thread(target=productor, daemon=True)
+    hilo.start()
+    try:
+        while True:
+            item = cola.get()
+            if item is fin:
+                break
+            yield from item
+        if error:
+            raise error[0]
+    finally:
+        parar.set()
+        hilo.join()
+
+def gcode_trabajo(*, queue_size: int = STREAM_QUEUE_LINES, **params):
+    """G-code de un trabajo para LaserJobRunner.submit.
+
+    params son los de generate_gcode_text. Si ya está en la caché se devuelve
+    el texto; si no, las líneas salen según se calculan por una cola acotada:
+    el envío empieza con la primera fila, la memoria no depende del tamaño del
+    trabajo y la caché se escribe a la vez que se envía.
+    """
+    return cache_global().lineas(
+        generate_gcode_text,
+        lambda **p: _cola_acotada(iter_gcode_lines(**p), queue_size),
+        **params)
+
+def contar_lineas_gcode(gcode_text: str) -> int:
+    """Líneas que stream_to_grbl enviará realmente (sin vacías ni comentarios)"""
+    return sum(1 for l in io.StringIO(gcode_text) if l.strip() and not l.lstrip().startswith(";"))
+
+class LaserJobRunner:
+    """Ejecuta trabajos de grabado en un hilo propio, uno detrás de otro.
+
+    Los eventos ({'tipo': 'inicio' | 'progreso' | 'pausa' | 'reanudar' |
+    'fin' | 'error' | 'cancelado', ...}) se entregan a on_event en el hilo
+    de Tk mediante tk_root.after(). pause/resume/cancel se pueden llamar
+    desde la interfaz en cualquier momento (escriben por el GrblLink del puerto).
+    """
+    RESULTADOS = {0: "fin", 2: "error", 3: "cancelado"}
+
+    def __init__(self, tk_root=None, on_event=None, *, protocol: str = "char-count",
+                 intervalo_progreso: float = 0.25):
+        self.tk_root = tk_root
+        self.on_event = on_event
+        self.protocol = protocol
+        self.intervalo_progreso = intervalo_progreso
+        self._cola = queue.Queue()
+        self._cancel = threading.Event()
+        self._actual = None      # trabajo en curso
+        self._pausa = threading.Event()   # activo mientras el trabajo está en feed-hold
+        self._t_pausa = 0.0
+        self._siguiente_id = 0
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+
+    # ---------------- API para la interfaz ----------------
+    def submit(self, ser, gcode, *, nombre: str = "", total: int = None, antes=None, despues=None) -> int:
+        """Encola un trabajo; gcode es texto, iterable de líneas o una función
+        sin argumentos que los devuelve (se llama ya en el hilo del trabajo).
+
+        antes(ser) y despues(ser) se ejecutan en el hilo del trabajo (p. ej.
+        mover al offset y volver al origen). Devuelve el id del trabajo.
+        """
+        self._siguiente_id += 1
+        if total is None and isinstance(gcode, str):
+            total = contar_lineas_gcode(gcode)
+        self._cola.put({"id": self._siguiente_id, "nombre": nombre, "ser": ser, "gcode": gcode,
+                        "total": total, "antes": antes, "despues": despues})
+        return self._siguiente_id
+
+    @property
+    def ocupado(self) -> bool:
+        return self._actual is not None or not self._cola.empty()
+
+    def pause(self):
+        """Feed-hold ('!'): GRBL decelera y se detiene sin perder posición"""
+        if self._tiempo_real(b"!"):
+            self._pausa.set()
+            self._t_pausa = time.monotonic()
+            self._emitir("pausa", self._actual)
+
+    def resume(self):
+        """Reanuda ('~') tras un feed-hold"""
+        if self._pausa.is_set() and self._tiempo_real(b"~"):
+            self._pausa.clear()
+            self._actual["pausa_total"] += time.monotonic() - self._t_pausa
+            self._emitir("reanudar", self._actual)
+
+    def cancel(self, todos: bool = False):
+        """Cancela el trabajo en curso con soft-reset (Ctrl-X); con todos=True vacía la cola"""
+        if todos:
+            try:
+                while True:
+                    self._cola.get_nowait()
+            except queue.Empty:
+                pass
+        if self._actual is not None:
+            self._cancel.set()
+            self._tiempo_real(b"\x18")
+
+    def stop(self):
+        """Cancela todo y termina el hilo"""
+        self.cancel(todos=True)
+        self._cola.put(None)
+
+    # ---------------- Hilo de trabajos ----------------
+    def _tiempo_real(self, byte: bytes) -> bool:
+        trabajo = self._actual
+        if trabajo is None:
+            return False
+        enlace(trabajo["ser"]).write(byte)
+        return True
+
+    def _emitir(self, tipo: str, trabajo, **extra):
+        if trabajo is None or self.on_event is None:
+            return
+        evento = {"tipo": tipo, "id": trabajo["id"], "nombre": trabajo["nombre"],
+                  "enviadas": trabajo.get("enviadas", 0), "total": trabajo["total"]}
+        evento.update(extra)
+        if self.tk_root is not None:
+            self.tk_root.after(0, self.on_event, evento)
+        else:
+            self.on_event(evento)
+
+    def _progreso(self, trabajo, enviadas: int):
+        trabajo["enviadas"] = enviadas
+        ahora = time.monotonic()
+        if ahora - trabajo["ultimo_evento"] < self.intervalo_progreso and enviadas != trabajo["total"]:
+            return
+        trabajo["ultimo_evento"] = ahora
+        activo = ahora - trabajo["t0"] - trabajo["pausa_total"]
+        eta = None
+        if trabajo["total"] and enviadas:
+            eta = activo / enviadas * (trabajo["total"] - enviadas)
+        self._emitir("progreso", trabajo, transcurrido=activo, eta=eta)
+
+    @staticmethod
+    def _cerrar_gcode(trabajo):
+        """Un trabajo generado al vuelo que no se envió entero: parar el generador
+        (y descartar su archivo a medias de la caché) antes de avisar del final"""
+        cerrar = getattr(trabajo["gcode"], "close", None)
+        if cerrar:
+            cerrar()
+
+    def _bucle(self):
+        while True:
+            trabajo = self._cola.get()
+            if trabajo is None:
+                return
+            self._cancel.clear()
+            self._pausa.clear()
+            trabajo.update(enviadas=0, t0=time.monotonic(), pausa_total=0.0, ultimo_evento=0.0)
+            self._actual = trabajo
+            ser = trabajo["ser"]
+            self._emitir("inicio", trabajo)
+            try:
+                if callable(trabajo["gcode"]):
+                    trabajo["gcode"] = trabajo["gcode"]()
+                    if trabajo["total"] is None and isinstance(trabajo["gcode"], str):
+                        trabajo["total"] = contar_lineas_gcode(trabajo["gcode"])
+                if trabajo["antes"]:
+                    trabajo["antes"](ser)
+                resultado = stream_to_grbl(
+                    ser, trabajo["gcode"], protocol=self.protocol,
+                    log=lambda m, t=trabajo: self._emitir("log", t, mensaje=m),
+                    progress=lambda n, t=trabajo: self._progreso(t, n),
+                    cancel=self._cancel,
+                    pause=self._pausa,
+                )
+                self._cerrar_gcode(trabajo)
+                if resultado != 3 and trabajo["despues"]:
+                    trabajo["despues"](ser)
+                # 'fin' sólo cuando el cabezal está parado de verdad, no al aceptar la última línea
+                if resultado == 0 and not enlace(ser).esperar_idle(cancel=self._cancel):
+                    resultado = 3 if self._cancel.is_set() else 2
+                self._emitir(self.RESULTADOS.get(resultado, "error"), trabajo, resultado=resultado,
+                             duracion=time.monotonic() - trabajo["t0"])
+            except Exception as e:
+                try:
+                    send_cmd(ser, "M5")  # p. ej. la generación falló a mitad de trabajo
+                except Exception:
+                    pass
+                self._cerrar_gcode(trabajo)
+                self._emitir("error", trabajo, resultado=None, mensaje=str(e))
+            finally:
+                self._actual = None
+                self._pausa.clear()
+
 # =============================================================================
 # FUNCIONES DE MEDICIÓN Y DETECCIÓN DE OBJETOS
 # =============================================================================
@@ -410,6 +1029,13 @@ class VentanaLaser:
         self.offset_y = tk.DoubleVar(value=0.0)
         self.mode = tk.StringVar(value="Aruco")
         self.invert = tk.BooleanVar(value=False)
+        self.progreso = tk.StringVar(value="Sin trabajo en curso")
+        self.tiempo_estimado = tk.StringVar(value="Tiempo estimado: -")
+        self.estado_maquina = tk.StringVar(value="Estado GRBL: -")
+        self.ajustes_grbl = None  # '$$' leídos al conectar (None = valores por defecto)
+        
+        # Los grabados se ejecutan en su propio hilo (la ventana no se congela)
+        self.runner = LaserJobRunner(self.ventana, self.on_evento_grabado)
         
         self.crear_interfaz_laser()
         
@@ -520,6 +1146,13 @@ class VentanaLaser:
         
         ttk.Button(control_row1, text="Generar G-Code", command=self.generar_gcode, width=15).pack(side=tk.LEFT, padx=5)
         ttk.Button(control_row1, text="Iniciar Grabado", command=self.iniciar_grabado, width=15).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_row1, text="Pausa", command=self.runner.pause, width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_row1, text="Reanudar", command=self.runner.resume, width=9).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_row1, text="Cancelar", command=self.runner.cancel, width=9).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(control_frame, textvariable=self.estado_maquina).pack(fill=tk.X)
+        ttk.Label(control_frame, textvariable=self.tiempo_estimado).pack(fill=tk.X)
+        ttk.Label(control_frame, textvariable=self.progreso).pack(fill=tk.X, pady=(0, 5))
         
         # Segunda fila de botones
         control_row2 = ttk.Frame(control_frame)
@@ -549,15 +1182,34 @@ class VentanaLaser:
             baud = int(self.laser_baud.get())
             self.ser_laser = open_serial(port, baud)
             self.log_laser(f"✅ Conectado al láser en {port} @ {baud}")
+            try:
+                self.ajustes_grbl = leer_ajustes_grbl(self.ser_laser)
+                self.log_laser(f"Ajustes GRBL: vel. máx {self.ajustes_grbl[110]:.0f} mm/min, "
+                               f"acel. {self.ajustes_grbl[120]:.0f} mm/s²")
+            except Exception as e:
+                self.ajustes_grbl = None
+                self.log_laser(f"No se pudieron leer los ajustes $$: {e}")
+            enlace(self.ser_laser).iniciar_sondeo()
+            self.refrescar_estado()
             
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo conectar al láser:\n{e}")
             self.log_laser(f"❌ Error de conexión: {e}")
             
+    def refrescar_estado(self):
+        """Muestra el estado que mantiene el sondeo '?' del enlace GRBL"""
+        if not self.ser_laser or not getattr(self.ser_laser, "is_open", False):
+            self.estado_maquina.set("Estado GRBL: -")
+            return
+        estado = enlace(self.ser_laser).estado
+        self.estado_maquina.set(f"Estado GRBL: {estado}")
+        self.ventana.after(200, self.refrescar_estado)
+        
     def desconectar_laser(self):
         """Desconecta del láser"""
         try:
             if self.ser_laser and getattr(self.ser_laser, "is_open", False):
+                self.runner.cancel(todos=True)
                 send_cmd(self.ser_laser, "M5")  # Apagar láser
                 self.ser_laser.close()
                 self.log_laser("🔌 Láser desconectado")
@@ -631,20 +1283,8 @@ class VentanaLaser:
             
         try:
             self.log_laser("Generando G-code...")
-            size_mm = (self.size_mm_x.get(), self.size_mm_y.get())
-            
-            gcode = generate_gcode_text(
-                image_path=self.image_path,
-                size_mm=size_mm,
-                ppmm=self.ppmm.get(),
-                mode=self.mode.get(),
-                invert=self.invert.get(),
-                gamma_val=self.gamma_val.get(),
-                origin_xy=(0.0, 0.0),
-                f_engrave=self.f_engrave.get(),
-                f_travel=self.f_travel.get(),
-                s_max=self.s_max.get()
-            )
+            gcode = cache_global().obtener(generate_gcode_text, **self.params_gcode())
+            self.mostrar_estimacion(gcode)
             
             # Guardar G-code en archivo
             gcode_file = filedialog.asksaveasfilename(
@@ -676,6 +1316,10 @@ class VentanaLaser:
             messagebox.showwarning("Advertencia", "Inicializa el láser primero con el botón 'Inicializar Láser'")
             return
             
+        if self.runner.ocupado:
+            messagebox.showwarning("Advertencia", "Ya hay un grabado en curso")
+            return
+            
         # Verificar que el láser esté en posición correcta
         respuesta = messagebox.askyesno("Confirmar Grabado", 
                                        "¿El láser está en la posición correcta para comenzar?\n\n" +
@@ -685,40 +1329,70 @@ class VentanaLaser:
             self.log_laser("⏸️ Grabado cancelado por el usuario")
             return
             
-        try:
-            self.log_laser("� INICIANDO GRABADO...")
-            
-            # Generar G-code
-            size_mm = (self.size_mm_x.get(), self.size_mm_y.get())
-            gcode = generate_gcode_text(
-                image_path=self.image_path,
-                size_mm=size_mm,
-                ppmm=self.ppmm.get(),
-                mode=self.mode.get(),
-                invert=self.invert.get(),
-                gamma_val=self.gamma_val.get(),
-                origin_xy=(0.0, 0.0),
-                f_engrave=self.f_engrave.get(),
-                f_travel=self.f_travel.get(),
-                s_max=self.s_max.get()
-            )
-            
-            # Enviar G-code al láser
+        self.log_laser("� INICIANDO GRABADO...")
+        
+        # Parámetros leídos ahora en el hilo de Tk; la generación (o lectura
+        # de la caché) y el envío se hacen en el hilo del grabado
+        params = self.params_gcode()
+        
+        def preparar():
+            gcode = gcode_trabajo(**params)
+            if isinstance(gcode, str):  # generado al vuelo no hay texto que estimar
+                self.ventana.after(0, self.mostrar_estimacion, gcode)
+            return gcode
+        
+        self.runner.submit(self.ser_laser, preparar, nombre=os.path.basename(self.image_path))
+        
+    def params_gcode(self):
+        """Parámetros de generate_gcode_text según la ventana"""
+        return dict(
+            image_path=self.image_path,
+            size_mm=(self.size_mm_x.get(), self.size_mm_y.get()),
+            ppmm=self.ppmm.get(),
+            mode=self.mode.get(),
+            invert=self.invert.get(),
+            gamma_val=self.gamma_val.get(),
+            origin_xy=(0.0, 0.0),
+            f_engrave=self.f_engrave.get(),
+            f_travel=self.f_travel.get(),
+            s_max=self.s_max.get(),
+            optimize=True
+        )
+        
+    def mostrar_estimacion(self, gcode):
+        """Calcula y muestra el tiempo estimado del trabajo"""
+        segundos = estimar_tiempo(gcode, self.ajustes_grbl)
+        self.tiempo_estimado.set(f"Tiempo estimado: {formatear_duracion(segundos)}")
+        self.log_laser(f"⏱️ Tiempo estimado de grabado: {formatear_duracion(segundos)}")
+        return segundos
+        
+    def on_evento_grabado(self, ev):
+        """Muestra en la ventana los eventos del hilo de grabado"""
+        tipo = ev["tipo"]
+        if tipo == "inicio":
             self.log_laser("📤 Enviando comandos de grabado al láser...")
-            resultado = stream_to_grbl(self.ser_laser, gcode)
-            
-            if resultado == 0:
-                self.log_laser("✅ GRABADO COMPLETADO EXITOSAMENTE")
-                self.log_laser("🏠 El láser ha regresado a su posición inicial")
-                # Resetear estado de inicialización para próximo grabado
-                self.laser_inicializado = False
-            else:
-                self.log_laser("❌ ERROR DURANTE EL GRABADO")
-                self.laser_inicializado = False
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error durante el grabado:\n{e}")
-            self.log_laser(f"❌ Error durante el grabado: {e}")
+        elif tipo == "progreso":
+            eta = f" - quedan ~{ev['eta']:.0f} s" if ev.get("eta") is not None else ""
+            self.progreso.set(f"Líneas enviadas: {ev['enviadas']}/{ev['total'] or '?'}{eta}")
+        elif tipo == "pausa":
+            self.log_laser("⏸️ Grabado en pausa (feed-hold)")
+            self.progreso.set("En pausa")
+        elif tipo == "reanudar":
+            self.log_laser("▶️ Grabado reanudado")
+        elif tipo == "log":
+            self.log_laser(ev["mensaje"])
+        elif tipo == "fin":
+            self.log_laser("✅ GRABADO COMPLETADO EXITOSAMENTE")
+            self.log_laser("🏠 El láser ha regresado a su posición inicial")
+            self.progreso.set("Sin trabajo en curso")
+        elif tipo == "cancelado":
+            self.log_laser("⛔ Grabado cancelado (soft-reset)")
+            self.progreso.set("Cancelado")
+        else:
+            self.log_laser(f"❌ ERROR DURANTE EL GRABADO {ev.get('mensaje') or ''}")
+            self.progreso.set("Error")
+        if tipo in ("fin", "cancelado", "error"):
+            # Resetear estado de inicialización para próximo grabado
             self.laser_inicializado = False
             
 
@@ -726,6 +1400,7 @@ class VentanaLaser:
     def cerrar_ventana(self):
         """Cierra la ventana del láser"""
         self.desconectar_laser()
+        self.runner.stop()
         self.ventana.destroy()
 
 # =============================================================================
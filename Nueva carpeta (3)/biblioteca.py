@@ -0,0 +1,161 @@
+"""
+Biblioteca persistente de secuencias y posiciones (SQLite).
+
+Cada guardado añade una versión nueva (las anteriores se conservan); leer
+un nombre devuelve la última. La lista de nombres sale del índice
+(tipo, nombre) sin leer los datos, y Coleccion se usa como un dict que
+carga cada elemento sólo cuando se pide.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+BIBLIOTECA_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "biblioteca.sqlite3")
+
+SECUENCIA = "secuencia"
+POSICION_ROBOT = "posicion_robot"
+POSICION_LASER = "posicion_laser"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS elementos (
+    tipo    TEXT    NOT NULL,
+    nombre  TEXT    NOT NULL,
+    version INTEGER NOT NULL,
+    datos   TEXT    NOT NULL,
+    creado  REAL    NOT NULL,
+    borrado INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tipo, nombre, version)
+);
+"""
+
+
+class Biblioteca:
+    def __init__(self, ruta: str = BIBLIOTECA_DB):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(ruta, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_ESQUEMA)
+
+    def nombres(self, tipo: str) -> list:
+        """Nombres vigentes de un tipo (sólo el índice, sin leer los datos)"""
+        with self._lock:
+            filas = self._db.execute(
+                "SELECT nombre, MAX(version), borrado FROM elementos WHERE tipo=? "
+                "GROUP BY nombre ORDER BY nombre", (tipo,)).fetchall()
+        return [n for n, _, borrado in filas if not borrado]
+
+    def _ultima(self, tipo: str, nombre: str):
+        return self._db.execute(
+            "SELECT version, datos, borrado FROM elementos WHERE tipo=? AND nombre=? "
+            "ORDER BY version DESC LIMIT 1", (tipo, nombre)).fetchone()
+
+    def cargar(self, tipo: str, nombre: str, version: int = None):
+        """Datos de la última versión (o de la indicada); None si no existe"""
+        with self._lock:
+            if version is None:
+                fila = self._ultima(tipo, nombre)
+            else:
+                fila = self._db.execute(
+                    "SELECT version, datos, borrado FROM elementos WHERE tipo=? AND nombre=? AND version=?",
+                    (tipo, nombre, version)).fetchone()
+        if fila is None or fila[2]:
+            return None
+        return json.loads(fila[1])
+
+    def guardar(self, tipo: str, nombre: str, datos) -> int:
+        """Guarda una versión nueva si los datos cambiaron; devuelve el número de versión"""
+        texto = json.dumps(datos, ensure_ascii=False)
+        with self._lock, self._db:
+            fila = self._ultima(tipo, nombre)
+            if fila and not fila[2] and fila[1] == texto:
+                return fila[0]
+            version = (fila[0] + 1) if fila else 1
+            self._db.execute("INSERT INTO elementos VALUES (?, ?, ?, ?, ?, 0)",
+                             (tipo, nombre, version, texto, time.time()))
+        return version
+
+    def borrar(self, tipo: str, nombre: str):
+        """Marca el nombre como borrado (las versiones anteriores siguen en la base)"""
+        with self._lock, self._db:
+            fila = self._ultima(tipo, nombre)
+            if fila and not fila[2]:
+                self._db.execute("INSERT INTO elementos VALUES (?, ?, ?, 'null', ?, 1)",
+                                 (tipo, nombre, fila[0] + 1, time.time()))
+
+    def versiones(self, tipo: str, nombre: str) -> list:
+        """[(versión, instante de creación)] de un nombre, de la más nueva a la más vieja"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT version, creado FROM elementos WHERE tipo=? AND nombre=? AND borrado=0 "
+                "ORDER BY version DESC", (tipo, nombre)).fetchall()
+
+    def cerrar(self):
+        with self._lock:
+            self._db.close()
+
+
+class Coleccion(MutableMapping):
+    """Vista tipo dict de un tipo de la biblioteca; carga los datos bajo demanda"""
+
+    def __init__(self, biblioteca: Biblioteca, tipo: str, en_memoria: int = 32):
+        self.biblioteca = biblioteca
+        self.tipo = tipo
+        self.en_memoria = en_memoria
+        self._nombres = biblioteca.nombres(tipo)   # sólo el índice
+        self._cache = OrderedDict()
+
+    def __getitem__(self, nombre):
+        if nombre in self._cache:
+            self._cache.move_to_end(nombre)
+            return self._cache[nombre]
+        datos = self.biblioteca.cargar(self.tipo, nombre)
+        if datos is None:
+            raise KeyError(nombre)
+        self._recordar(nombre, datos)
+        return datos
+
+    def __setitem__(self, nombre, datos):
+        self.biblioteca.guardar(self.tipo, nombre, datos)
+        if nombre not in self._nombres:
+            self._nombres.append(nombre)
+            self._nombres.sort()
+        self._recordar(nombre, datos)
+
+    def __delitem__(self, nombre):
+        if nombre not in self._nombres:
+            raise KeyError(nombre)
+        self.biblioteca.borrar(self.tipo, nombre)
+        self._nombres.remove(nombre)
+        self._cache.pop(nombre, None)
+
+    def __contains__(self, nombre):
+        return nombre in self._nombres
+
+    def __iter__(self):
+        return iter(list(self._nombres))
+
+    def __len__(self):
+        return len(self._nombres)
+
+    def _recordar(self, nombre, datos):
+        self._cache[nombre] = datos
+        self._cache.move_to_end(nombre)
+        while len(self._cache) > self.en_memoria:
+            self._cache.popitem(last=False)
+
+
+_biblioteca = None
+
+
+def biblioteca_global() -> Biblioteca:
+    """Biblioteca compartida por la aplicación"""
+    global _biblioteca
+    if _biblioteca is None:
+        _biblioteca = Biblioteca()
+    return _biblioteca
@@ -0,0 +1,187 @@
+"""
+Ciclo automático de la celda: lista declarativa de pasos ACL y su ejecutor.
+
+Cada Paso es una orden (normalmente 'run <programa>') con lo que hay que
+esperar para darla por terminada:
+  - fin=None              -> basta el terminador de la orden ('Done.' / '>')
+  - fin=('ok2', ...)      -> además, una línea posterior que contenga alguno
+                             de esos textos (lo que imprime el programa al acabar)
+con su timeout, cuántas veces se reintenta si se agota y qué hacer si se
+agotan los reintentos ('fallar' corta el ciclo, 'seguir' continúa).
+
+ejecutar_pasos() bloquea al hilo que lo llama (no al de la interfaz): no hay
+pausas fijas, cada paso sale en cuanto el controlador avisa.
+
+EscuchaDisparos vigila el texto crudo del puerto buscando los avisos de
+pieza ('CMG' / 'CHG'), aunque lleguen partidos entre dos lecturas, y los
+guarda en una cola: los que llegan durante un ciclo se atienden después,
+uno por pieza.
+"""
+import queue
+import threading
+import time
+
+from scorbot_link import TIMEOUT, es_error, texto_respuesta
+
+FALLAR = "fallar"
+SEGUIR = "seguir"
+
+OK = "ok"
+ERROR = "error"
+SIN_FIN = "sin fin"      # se agotó la espera de un paso con al_agotar='seguir'
+CANCELADO = "cancelado"
+
+
+class Paso:
+    def __init__(self, orden: str, fin=None, timeout: float = 30.0, reintentos: int = 0,
+                 al_agotar: str = FALLAR):
+        self.orden = orden
+        self.fin = tuple(t.lower() for t in fin) if fin else None
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.al_agotar = al_agotar
+
+    def __repr__(self):
+        return f"Paso({self.orden!r}, fin={self.fin}, timeout={self.timeout})"
+
+
+# Ciclo que lanza conect.py al detectar CMG/CHG. dp esperaba 15 s fijos:
+# ahora sale en cuanto el programa avisa, y si no avisa sigue a los 15 s.
+PASOS_CELDA = [
+    Paso("run gp", reintentos=1),
+    Paso("run dp", fin=("done", "ok", "complete"), timeout=15, al_agotar=SEGUIR),
+    Paso("run initc", reintentos=1),
+    Paso("run gpv", fin=("done", "ok2", "complete")),
+    Paso("run gf", fin=("done", "ok3", "complete")),
+    Paso("run initc", reintentos=1),
+]
+
+
+DISPAROS = ("CMG", "CHG")
+
+
+class EscuchaDisparos:
+    def __init__(self, puerto, disparos=DISPAROS):
+        self.puerto = puerto              # puerto_serie.PuertoCompartido
+        self.disparos = tuple(disparos)
+        self._cola = queue.Queue()
+        self._cerrado = False
+        self._resto = ""                  # final de la última lectura (un disparo puede seguir)
+        self._guarda = max(len(d) for d in self.disparos) - 1
+        self._bajas = [puerto.suscribir_crudo(self._alimentar),
+                       puerto.suscribir(lambda trama: None, tick=self._vigilar)]
+
+    @property
+    def pendientes(self) -> int:
+        return self._cola.qsize()
+
+    def siguiente(self, timeout: float = None):
+        """Bloquea hasta el próximo disparo y lo devuelve; None al cerrar o agotar timeout"""
+        try:
+            disparo = self._cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return None if self._cerrado else disparo
+
+    def cerrar(self):
+        if self._cerrado:
+            return
+        self._cerrado = True
+        for baja in self._bajas:
+            baja()
+        self._cola.put(None)   # despierta a quien espera en siguiente()
+
+    # Desde el hilo de E/S del puerto
+    def _alimentar(self, texto: str):
+        buffer = self._resto + texto
+        pos = 0
+        while True:
+            encontrados = [(buffer.find(d, pos), d) for d in self.disparos]
+            encontrados = [(i, d) for i, d in encontrados if i >= 0]
+            if not encontrados:
+                break
+            i, d = min(encontrados)
+            self._cola.put(d)
+            pos = i + len(d)
+        # Se guarda sólo lo que aún puede ser el principio de un disparo
+        self._resto = buffer[max(pos, len(buffer) - self._guarda):]
+
+    def _vigilar(self):
+        if not self.puerto.is_open:
+            self.cerrar()
+
+
+def _intento(link, paso: Paso, cancelar: threading.Event):
+    """(estado, respuesta) de un único envío del paso"""
+    llegado = threading.Event()
+    texto = []
+    orden = {}
+    enviado = threading.Lock()   # oir() no mira nada hasta que orden['fut'] existe
+
+    def oir(linea):
+        # Las líneas de la propia orden llegan antes de su terminador (mismo hilo de E/S)
+        with enviado:
+            fut = orden.get("fut")
+        if fut is None or not fut.done():
+            return
+        if any(t in linea.lower() for t in paso.fin):
+            texto.append(linea)
+            llegado.set()
+
+    baja = link.escuchar(oir) if paso.fin else (lambda: None)
+    try:
+        with enviado:
+            fut = orden["fut"] = link.send(paso.orden, paso.timeout)
+        limite = time.monotonic() + paso.timeout
+        r = fut.result()
+        respuesta = texto_respuesta(fut)
+        if r == TIMEOUT:
+            return TIMEOUT, respuesta
+        if es_error(r):
+            return ERROR, respuesta
+        if not paso.fin:
+            return OK, respuesta
+        while not llegado.wait(0.1):
+            if cancelar.is_set():
+                return CANCELADO, respuesta
+            if time.monotonic() >= limite:
+                return TIMEOUT, respuesta
+        return OK, "\n".join([respuesta] + texto)
+    finally:
+        baja()
+
+
+def ejecutar_pasos(link, pasos=PASOS_CELDA, informar=None, cancelar: threading.Event = None) -> list:
+    """Ejecuta los pasos en orden; devuelve [{'orden', 'estado', 'respuesta', 'intentos', 'segundos'}].
+
+    informar(texto) recibe el progreso (desde este hilo: quien tenga interfaz
+    debe pasarlo a su bucle). Un error o un timeout con al_agotar='fallar'
+    cortan el ciclo.
+    """
+    informar = informar or (lambda texto: None)
+    cancelar = cancelar or threading.Event()
+    resultados = []
+    for paso in pasos:
+        if cancelar.is_set():
+            break
+        t0 = time.monotonic()
+        for intento in range(1, paso.reintentos + 2):
+            informar(f"Comando Enviado: {paso.orden}" + (f" (intento {intento})" if intento > 1 else ""))
+            estado, respuesta = _intento(link, paso, cancelar)
+            if estado != TIMEOUT:
+                break
+        if estado == TIMEOUT and paso.al_agotar == SEGUIR:
+            estado = SIN_FIN
+        resultados.append({"orden": paso.orden, "estado": estado, "respuesta": respuesta,
+                           "intentos": intento, "segundos": time.monotonic() - t0})
+        if estado == OK:
+            informar(f"Comando {paso.orden} completado.")
+        elif estado == SIN_FIN:
+            informar(f"{paso.orden}: sin aviso de fin en {paso.timeout:.0f} s, se continúa.")
+        elif estado == CANCELADO:
+            informar(f"{paso.orden}: ciclo cancelado.")
+            break
+        else:
+            informar(f"Error al ejecutar {paso.orden}.\nRespuesta: {respuesta or estado}")
+            break
+    return resultados
@@ -1,7 +1,11 @@
 import tkinter as tk  # hace import de tkinter para GUI
 from tkinter import ttk, messagebox  # hace import de widgets ttk y messagebox
 import serial  # hace import de pyserial para comunicación por COM
-import time  # hace import para pausas y timeouts
+import queue  # hace import de la cola de eventos que deja el hilo de E/S
+import time  # hace import para timeouts
+import hostlink  # hace import de las tramas Host Link del PLC
+import plc_link  # hace import del enlace que espera los acuses del PLC
+import puerto_serie  # hace import del hilo de E/S que lee el puerto
 
 # Aplicación simple y fácil para controlar una cinta transportadora por serial
 # - Conectar/desconectar puerto COM
@@ -14,11 +18,13 @@ BAUDRATE = 9600  # hace configurar la velocidad de baudios
 BYTESIZE = serial.SEVENBITS  # hace configurar tamaño de byte
 PARITY = serial.PARITY_EVEN  # hace configurar paridad
 STOPBITS = serial.STOPBITS_TWO  # hace configurar bits de parada
-READ_INTERVAL_MS = 200  # hace intervalo de lectura en ms
+UI_INTERVAL_MS = 20  # hace intervalo con que la ventana vacía la cola de eventos (la lectura va en su hilo)
 
 
 ser = None  # hace referencia al objeto serial.Serial
+plc = None  # hace referencia al PLCLink que envía tramas y espera sus acuses
 is_serial_open = False  # hace un "flag" para saber si el puerto está abierto
+espera = None  # hace guardar la confirmación que espera send_and_wait (texto, límite, estación)
 
 # --- Funciones auxiliares ---
 def append_log(text):
@@ -31,7 +37,7 @@ def append_log(text):
 # --- Control de puerto serial ---
 def connect_serial():
     """ hace abrir el puerto serial seleccionado desde el combobox """
-    global ser, is_serial_open
+    global ser, plc, is_serial_open
     if is_serial_open:
         return
     port = combo_puertos.get()  # hace leer el puerto seleccionado
@@ -42,6 +48,7 @@ def connect_serial():
         ser.parity = PARITY
         ser.stopbits = STOPBITS
         ser.timeout = 0.2  # hace timeout en lecturas
+        plc = plc_link.PLCLink(ser)  # hace crear el enlace de tramas con acuse (lee el puerto en su hilo)
         is_serial_open = True
         texto_estado_serial.config(state="normal")
         texto_estado_serial.delete(1.0, tk.END)
@@ -52,16 +59,20 @@ def connect_serial():
     except Exception as e:
         messagebox.showerror("Error", f"No se pudo abrir {port}: {e}")
         ser = None
+        plc = None
         is_serial_open = False
 
 
 def disconnect_serial():
     """ hace cerrar el puerto serial si está abierto """
-    global ser, is_serial_open
+    global ser, plc, is_serial_open
     if not is_serial_open or ser is None:
         return
+    if plc is not None:
+        plc.close()  # hace dejar de leer y descartar tramas sin enviar
+    plc = None
     try:
-        ser.close()  # hace cerrar la conexión serial
+        puerto_serie.cerrar(ser)  # hace parar el hilo de E/S y cerrar la conexión serial
     except Exception:
         pass
     ser = None
@@ -75,21 +86,29 @@ def disconnect_serial():
 
 
 def read_serial_loop():
-    """ hace leer periódicamente lo que llega por serial y lo muestra en el log """
-    global ser
-    if is_serial_open and ser is not None:
+    """ hace mostrar en el log lo que el hilo de E/S del enlace recibió del PLC """
+    global espera
+    if is_serial_open and plc is not None:
         try:
-            n = ser.in_waiting  # hace comprobar cuantos bytes hay esperando
-            if n and n > 0:
-                data = ser.read(n)  # hace leer los bytes disponibles
-                try:
-                    texto = data.decode('utf-8', errors='ignore')  # hace decodificar a texto
-                except Exception:
-                    texto = repr(data)  # hace fallback a repr si no es texto
-                append_log("<-- " + texto.strip())
+            while True:
+                evento = plc.eventos.get_nowait()  # hace tomar la siguiente trama ya rearmada
+                append_log("<-- " + evento.texto)
+                if espera is not None:
+                    espera["buffer"] += evento.texto
+                    if espera["texto"] in espera["buffer"]:
+                        estacion = espera["estacion"]
+                        append_log(f"Confirmación recibida: {espera['texto']}")
+                        espera = None
+                        messagebox.showinfo("Info", f"Llegada confirmada en estación {estacion}")
+        except queue.Empty:
+            pass
         except Exception as e:
             append_log(f"Error leyendo serial: {e}")
-    ventana.after(READ_INTERVAL_MS, read_serial_loop)  # hace reprogramar la función
+    if espera is not None and time.time() > espera["limite"]:
+        texto, timeout_s = espera["texto"], espera["timeout"]
+        espera = None
+        messagebox.showwarning("Timeout", f"No se recibió '{texto}' antes de {timeout_s} segundos")
+    ventana.after(UI_INTERVAL_MS, read_serial_loop)  # hace reprogramar la función
 
 # --- Envío de comandos ---
 def send_raw_command():
@@ -103,77 +122,32 @@ def send_raw_command():
         return
     try:
         append_log("--> " + cmd)  # hace registrar el envío
-        ser.write((cmd + "\r\n\r\n").encode())  # hace enviar con terminadores CR/LF
+        plc.write((cmd + "\r\n\r\n").encode())  # hace enviar con terminadores CR/LF desde el hilo de E/S
         append_log("Comando crudo enviado")
     except Exception as e:
         messagebox.showerror("Error", f"No se pudo enviar: {e}")
 
 
 def send_deliver(estacion, pallet):
-    """ hace enviar el comando Deliver según estación y pallet (if/elif simple) """
+    """ hace enviar el comando Deliver según estación y pallet """
     if not is_serial_open or ser is None:
         messagebox.showerror("Error", "Puerto serial no conectado")
         return
-    # hace seleccionar el comando correcto según estación/pallet
-    if estacion == 1 and pallet == 1:
-        cmd = "@00WD000900015B*"
-    elif estacion == 1 and pallet == 2:
-        cmd = "@00WD0010000153*"
-    elif estacion == 1 and pallet == 3:
-        cmd = "@00WD0011000152*"
-    elif estacion == 1 and pallet == 5:
-        cmd = "@00WD0013000150*"
-    elif estacion == 1 and pallet == 6:
-        cmd = "@00WD0014000157*"
-    elif estacion == 2 and pallet == 1:
-        cmd = "@00WD0009000258*"
-    elif estacion == 2 and pallet == 2:
-        cmd = "@00WD0010000250*"
-    elif estacion == 2 and pallet == 3:
-        cmd = "@00WD0011000251*"
-    elif estacion == 2 and pallet == 5:
-        cmd = "@00WD0013000253*"
-    elif estacion == 2 and pallet == 6:
-        cmd = "@00WD0014000254*"
-    elif estacion == 3 and pallet == 1:
-        cmd = "@00WD0009000359*"
-    elif estacion == 3 and pallet == 2:
-        cmd = "@00WD0010000351*"
-    elif estacion == 3 and pallet == 3:
-        cmd = "@00WD0011000350*"
-    elif estacion == 3 and pallet == 5:
-        cmd = "@00WD0013000352*"
-    elif estacion == 3 and pallet == 6:
-        cmd = "@00WD0014000355*"
-    elif estacion == 5 and pallet == 1:
-        cmd = "@00WD000900055F*"
-    elif estacion == 5 and pallet == 2:
-        cmd = "@00WD0010000557*"
-    elif estacion == 5 and pallet == 3:
-        cmd = "@00WD0011000556*"
-    elif estacion == 5 and pallet == 5:
-        cmd = "@00WD0013000554*"
-    elif estacion == 5 and pallet == 6:
-        cmd = "@00WD0014000553*"
-    elif estacion == 6 and pallet == 1:
-        cmd = "@00WD000900065C*"
-    elif estacion == 6 and pallet == 2:
-        cmd = "@00WD0010000654*"
-    elif estacion == 6 and pallet == 3:
-        cmd = "@00WD0011000655*"
-    elif estacion == 6 and pallet == 5:
-        cmd = "@00WD0013000657*"
-    elif estacion == 6 and pallet == 6:
-        cmd = "@00WD0014000650*"
-    else:
+    # hace tomar la trama precalculada (FCS incluido) para estación/pallet
+    cmd = hostlink.DELIVER.get((estacion, pallet))
+    if cmd is None:
         messagebox.showwarning("Atención", "Combinación estación/pallet no válida")
         return
-    try:
-        append_log("--> " + cmd)  # hace registrar el envío
-        ser.write((cmd + "\r\n\r\n").encode())  # hace enviar comando al PLC
-        append_log(f"Deliver enviado a estación {estacion}, pallet {pallet}")
-    except Exception as e:
-        messagebox.showerror("Error", f"No se pudo enviar deliver: {e}")
+    append_log("--> " + cmd)  # hace registrar el envío
+    fut = plc.send(cmd)  # hace enviar comando al PLC (el acuse llega después)
+    fut.add_done_callback(lambda f: ventana.after(0, log_acuse, f))
+    append_log(f"Deliver enviado a estación {estacion}, pallet {pallet}")
+
+
+def log_acuse(fut):
+    """ hace mostrar el acuse del PLC de una trama y cuánto tardó """
+    ms = f" ({fut.latencia * 1000:.0f} ms)" if fut.latencia is not None else ""
+    append_log(f"<-- acuse {fut.trama}: {plc_link.describir(fut.result())}{ms}")
 
 
 def send_free(estacion, pallet):
@@ -182,68 +156,40 @@ def send_free(estacion, pallet):
         messagebox.showerror("Error", "Puerto serial no conectado")
         return
     # hace determinar comando para liberar la estación
-    if estacion == 1:
-        cmd1 = "@00WD004800015E*"
-    elif estacion == 2:
-        cmd1 = "@00WD004900015F*"
-    elif estacion == 3:
-        cmd1 = "@00WD0050000157*"
-    elif estacion == 5:
-        cmd1 = "@00WD0052000155*"
-    elif estacion == 6:
-        cmd1 = "@00WD0053000154*"
-    else:
+    cmd1 = hostlink.FREE_ESTACION.get(estacion)
+    if cmd1 is None:
         messagebox.showwarning("Atención", "Estación no válida")
         return
     # hace determinar comando para confirmar salida del pallet
-    if pallet == 1:
-        cmd2 = "@00WD000900995A*"
-    elif pallet == 2:
-        cmd2 = "@00WD0010009952*"
-    elif pallet == 3:
-        cmd2 = "@00WD0011009953*"
-    elif pallet == 5:
-        cmd2 = "@00WD0013009951*"
-    elif pallet == 6:
-        cmd2 = "@00WD0014009956*"
-    else:
+    cmd2 = hostlink.FREE_PALLET.get(pallet)
+    if cmd2 is None:
         messagebox.showwarning("Atención", "Pallet no válido")
         return
-    try:
-        append_log("--> " + cmd1)  # hace registrar y enviar cmd1
-        ser.write((cmd1 + "\r\n\r\n").encode())
-        time.sleep(0.5)  # hace pequeña pausa
-        append_log("--> " + cmd2)  # hace registrar y enviar cmd2
-        ser.write((cmd2 + "\r\n\r\n").encode())
-        append_log(f"Free enviado a estación {estacion}, pallet {pallet}")
-    except Exception as e:
-        messagebox.showerror("Error", f"No se pudo enviar free: {e}")
+    append_log("--> " + cmd1)  # hace registrar cmd1 y cmd2
+    append_log("--> " + cmd2)
+    # hace enviar cmd2 cuando el PLC acusa cmd1, sin pausa fija ni bloquear la ventana
+    tx = plc.escribir_dm({hostlink.DM_ESTACION + estacion: 1, hostlink.DM_PALLET + pallet: hostlink.LIBERAR_PALLET})
+    tx.add_done_callback(lambda t: ventana.after(0, log_free, t, estacion, pallet))
+
+
+def log_free(tx, estacion, pallet):
+    """ hace mostrar el resultado de la transacción Free """
+    for fut in tx.futuros:
+        log_acuse(fut)
+    append_log(f"Free enviado a estación {estacion}, pallet {pallet} ({tx.duracion * 1000:.0f} ms)")
 
 # --- Enviar y esperar confirmación (básico) ---
 def send_and_wait(estacion, pallet, confirm_text, timeout_s=10):
-    """ hace enviar deliver y esperar hasta encontrar confirm_text en el serial """
+    """ hace enviar deliver y esperar (sin bloquear la ventana) hasta encontrar confirm_text en el serial """
+    global espera
     if not is_serial_open or ser is None:
         messagebox.showerror("Error", "Puerto serial no conectado")
         return
     append_log(f"Enviando deliver a estación {estacion}, esperando '{confirm_text}' (timeout {timeout_s}s)")
-    send_deliver(estacion, pallet)  # hace enviar el deliver primero
-    deadline = time.time() + timeout_s  # hace calcular deadline
-    buffer = ""  # hace acumular datos leídos
-    while time.time() < deadline:
-        try:
-            if ser.in_waiting > 0:
-                data = ser.read(ser.in_waiting)
-                texto = data.decode('utf-8', errors='ignore')
-                append_log("<-- " + texto.strip())
-                buffer += texto
-                if confirm_text in buffer:
-                    append_log(f"Confirmación recibida: {confirm_text}")
-                    messagebox.showinfo("Info", f"Llegada confirmada en estación {estacion}")
-                    return
-        except Exception as e:
-            append_log(f"Error mientras esperaba confirmación: {e}")
-        time.sleep(0.2)  # hace esperar un poco antes de volver a leer
-    messagebox.showwarning("Timeout", f"No se recibió '{confirm_text}' antes de {timeout_s} segundos")
+    # hace registrar la espera antes de enviar: read_serial_loop la comprueba con cada trama
+    espera = {"texto": confirm_text, "buffer": "", "limite": time.time() + timeout_s,
+              "timeout": timeout_s, "estacion": estacion}
+    send_deliver(estacion, pallet)  # hace enviar el deliver
 
 # --- Interfaz gráfica ---
 ventana = tk.Tk()  # hace crear la ventana principal
@@ -326,7 +272,7 @@ btn_stop = tk.Button(frame_right, text="Enviar STOP crudo", width=20, command=la
 btn_stop.place(x=10, y=270)
 
 # --- Inicia el loop de lectura periódica del serial ---
-ventana.after(READ_INTERVAL_MS, read_serial_loop)
+ventana.after(UI_INTERVAL_MS, read_serial_loop)
 
 # --- Inicia la ventana principal ---
 ventana.mainloop()
\ No newline at end of file
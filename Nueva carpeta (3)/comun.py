@@ -2,8 +2,10 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.filedialog import asksaveasfilename
 import serial
-import time
 import serial.tools.list_ports
+import puerto_serie
+from secuencias import agregar_paso, optimizar_secuencia
+from scorbot_link import enlace, cerrar_enlace, es_error, texto_respuesta, CMD_TIMEOUT
 
 # Crear objeto Serial
 SerialPort1 = serial.Serial()
@@ -17,33 +19,26 @@ current_sequence_name = ""
 spin_increment = None
 
 # ==== FUNCIONES ACTUALIZADAS ====
-def send_scorbot_command(command, description=""):
+def send_scorbot_command(command, description="", timeout=CMD_TIMEOUT):
     """Función mejorada para enviar comandos al Scorbot-ER V Plus"""
     if SerialPort1.is_open:
         try:
-            # Asegurar formato correcto del comando
-            cmd = command.upper().strip() + '\r'  # Comandos en mayúsculas y con retorno de carro
+            # Comandos en mayúsculas; el enlace añade el retorno de carro
+            cmd = command.upper().strip()
             
-            # Limpiar buffer de entrada
-            SerialPort1.reset_input_buffer()
-            
-            # Enviar comando
-            SerialPort1.write(cmd.encode())
-            
-            # Esperar respuesta (ajustar tiempo según necesidad)
-            time.sleep(0.5)
-            
-            # Leer respuesta
-            response = SerialPort1.read_all().decode('ascii', errors='ignore').strip()
+            # Enviar y esperar a 'Done.', al prompt '>' o a un error (no un tiempo fijo)
+            fut = enlace(SerialPort1).send(cmd, timeout)
+            fut.result()
+            response = texto_respuesta(fut)
             
             # Mostrar en la interfaz
-            TextRecibidos.insert("1.0", f"> {cmd.strip()}\n")
+            TextRecibidos.insert("1.0", f"> {cmd}\n")
             TextRecibidos.insert("2.0", f"< {response}\n")
             if description:
                 TextRecibidos.insert("3.0", f"{description}\n")
             TextRecibidos.insert("4.0", "-"*50 + "\n")
             
-            return True
+            return not es_error(fut.result())
         except Exception as e:
             messagebox.showerror("Error", f"Error al enviar comando: {str(e)}")
             return False
@@ -131,9 +126,9 @@ def mover_eje(eje, direccion):
     
     print(f"Enviando comando: {command}")  # Debug
     
-    # Grabar comando si está en modo grabación
+    # Grabar comando si está en modo grabación (fusionado con el MJ anterior del mismo eje)
     if sequence_recording:
-        recorded_sequence.append(command)
+        agregar_paso(recorded_sequence, command)
         update_sequence_display()
     
     send_scorbot_command(command, description)
@@ -182,11 +177,13 @@ def execute_sequence():
         messagebox.showwarning("Advertencia", "No hay secuencia grabada")
         return
     
+    pasos = optimizar_secuencia(recorded_sequence)
     TextRecibidos.insert("1.0", "=== EJECUTANDO SECUENCIA ===\n")
-    for i, cmd in enumerate(recorded_sequence, 1):
-        TextRecibidos.insert("1.0", f"Paso {i}/{len(recorded_sequence)}: {cmd}\n")
-        send_scorbot_command(cmd, f"Paso {i}")
-        time.sleep(0.5)  # Pausa entre comandos
+    for i, cmd in enumerate(pasos, 1):
+        TextRecibidos.insert("1.0", f"Paso {i}/{len(pasos)}: {cmd}\n")
+        if not send_scorbot_command(cmd, f"Paso {i}"):
+            TextRecibidos.insert("1.0", f"=== SECUENCIA DETENIDA EN EL PASO {i} ===\n")
+            return
     TextRecibidos.insert("1.0", "=== SECUENCIA COMPLETADA ===\n")
 
 def clear_sequence():
@@ -255,7 +252,8 @@ def click_desconectar():
     if SerialPort1.is_open:
         try:
             send_scorbot_command("COFF", "Apagando servomotores antes de desconectar")
-            SerialPort1.close()
+            cerrar_enlace(SerialPort1)
+            puerto_serie.cerrar(SerialPort1)
             TextoEstado.config(state="normal")
             TextoEstado.delete("1.0", tk.END)
             TextoEstado.insert("1.0", "DESCONECTADO")
@@ -2,105 +2,42 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.filedialog import asksaveasfilename
 import serial
-import time
 import serial.tools.list_ports
+import threading
 from threading import Thread
+import puerto_serie
+from scorbot_link import enlace, cerrar_enlace
+from ciclo_automatico import PASOS_CELDA, EscuchaDisparos, ejecutar_pasos
 
 # Crear objeto Serial
 SerialPort1 = serial.Serial()
+cancelar_ciclo = threading.Event()
+escucha = None  # EscuchaDisparos mientras el puerto está abierto
 
 # ==== FUNCIONES ==== 
 def escuchar_automatica():
+    # Atiende todas las piezas mientras el puerto esté abierto: los avisos que
+    # llegan durante un ciclo quedan en cola y se procesan a continuación
+    global escucha
+    escucha = EscuchaDisparos(enlace(SerialPort1).puerto)
     while True:
-        if SerialPort1.is_open:
-            recibir = SerialPort1.read_all()  # Leer todos los datos del puerto
-            if recibir:
-                # Verificar si el mensaje contiene "CMG" o "CHG"
-                recibir_str = recibir.decode('utf-8')
-                if "CMG" in recibir_str or "CHG" in recibir_str:
-                    # Si se detecta "CMG" o "CHG", enviar los comandos en orden
-                    enviar_comandos_automatically()
-                    break  # Salir después de enviar los comandos (para evitar múltiples envíos)
-            time.sleep(1)  # Pausa de 1 segundo antes de intentar leer más datos
+        disparo = escucha.siguiente()  # bloquea hasta que llega un CMG/CHG (o se cierra)
+        if disparo is None:
+            break
+        mostrar_recibido(f"Aviso {disparo} recibido (en cola: {escucha.pendientes})")
+        enviar_comandos_automatically()
 
 def enviar_comandos_automatically():
     if SerialPort1.is_open:
-        # Lista de comandos
-        comandos = [b"run gp", b"run dp", b"run initc", b"run gpv", b"run gf", b"run initc"]
-
-        for comando in comandos:
-            # Enviar el comando
-            SerialPort1.write(comando + b"\r")
-            TextRecibidos.insert(tk.END, f"Comando Enviado: {comando.decode()}\n")
-
-            # Esperar que el robot termine el comando
-            respuesta = leer_respuesta()
-            print(f"Respuesta recibida: {respuesta}")  # Depuración para ver lo que se recibe
-
-            # Verificar si la respuesta indica que el comando ha terminado
-            if "done" in respuesta.lower() or "ok" in respuesta.lower() or "complete" in respuesta.lower():
-                TextRecibidos.insert(tk.END, f"Comando {comando.decode()} completado.\n")
-            else:
-                # Solo tratar como error si la respuesta no es esperada o claramente fallida
-                if "error" in respuesta.lower():
-                    TextRecibidos.insert(tk.END, f"Error al ejecutar {comando.decode()}.\nRespuesta: {respuesta}\n")
-                    print(f"Error al ejecutar {comando.decode()}. Respuesta: {respuesta}")
-                    break  # Salir si hubo un error crítico
-                else:
-                    TextRecibidos.insert(tk.END, f"Respuesta no esperada para {comando.decode()}: {respuesta}\n")
-                    print(f"Respuesta no esperada: {respuesta}")
-                    # No interrumpir el flujo, pero loguear el error para futuras revisiones
-
-            if comando == b"run dp":
-                # Ejecutar initc después de dp
-                time.sleep(15)  # Esperar 15 segundos entre dp y gpv
-
-            #elif comando == b"run initc":
-                # Verificar si "initc" terminó correctamente
-             #   respuesta = leer_respuesta()
-              #  time.sleep(1)
-                
-
-            elif comando == b"run gpv":
-                # Esperar a que el comando gpv termine antes de continuar con gf
-                respuesta = leer_respuesta()
-                if "done" in respuesta.lower()  or "ok2" in respuesta.lower() or "complete" in respuesta.lower():
-                    TextRecibidos.insert(tk.END, "Comando gpv completado.\n")
-                else:
-                    TextRecibidos.insert(tk.END, f"Respuesta no esperada para gpv: {respuesta}\n")
-                    print(f"Respuesta no esperada para gpv: {respuesta}")
-
-            elif comando == b"run gf":
-                # Esperar a que el comando gf termine correctamente
-                respuesta = leer_respuesta()
-                if "done" in respuesta.lower() or "ok3" in respuesta.lower() or "complete" in respuesta.lower():
-                    TextRecibidos.insert(tk.END, "Comando gf enviado correctamente.\n")
-                else:
-                    TextRecibidos.insert(tk.END, "Error al ejecutar gf. El robot no está listo.\n")
-                    break  # Salir si el robot no está listo para ejecutar gf
-
-            else:
-                time.sleep(1)  # Para los demás comandos, 1 segundo de espera
-
-        # Enviar initc después de gf, asegurando que los pasos previos fueron completados correctamente
-        TextRecibidos.insert(tk.END, "\nComandos enviados correctamente.\n")  # Confirmación final
-
-
-def leer_respuesta():
-    """Lee la respuesta del puerto serial hasta encontrar un salto de línea o timeout."""
-    response = b""
-    start_time = time.time()
-
-    while time.time() - start_time < 30:  # Espera de hasta 30 segundos
-        if SerialPort1.in_waiting > 0:
-            response += SerialPort1.read(SerialPort1.in_waiting)
-        if b"Done." in response or b"done" in response or b"ok" in response or b"complete" in response:
-            break
-        time.sleep(0.1)  # Pausa para no sobrecargar el CPU
+        # Cada paso espera el aviso de fin del controlador (ver ciclo_automatico.PASOS_CELDA)
+        cancelar_ciclo.clear()
+        ejecutar_pasos(enlace(SerialPort1), PASOS_CELDA, informar=mostrar_recibido, cancelar=cancelar_ciclo)
+        mostrar_recibido("\nCiclo terminado.")
+
 
-    respuesta_str = response.decode('utf-8', errors='ignore')
-    print(f"Respuesta completa recibida: {respuesta_str}")  # Esto ayudará a depurar el flujo
-    return respuesta_str
+def mostrar_recibido(texto):
+    """Añade texto a 'Datos Recibidos' desde cualquier hilo (lo escribe el bucle de Tk)"""
+    root.after(0, lambda: TextRecibidos.insert(tk.END, texto + "\n"))
 
 
 def click_conectar():
@@ -127,7 +64,11 @@ def click_conectar():
 
 def click_desconectar():
     if SerialPort1.is_open:
-        SerialPort1.close()
+        cancelar_ciclo.set()
+        if escucha is not None:
+            escucha.cerrar()
+        cerrar_enlace(SerialPort1)
+        puerto_serie.cerrar(SerialPort1)
         TextoEstado.config(state="normal")
         TextoEstado.delete("1.0", tk.END)
         TextoEstado.insert("1.0", "DESCONECTADO")
@@ -141,12 +82,9 @@ def click_enviar():
     if SerialPort1.is_open:
         data_to_send = TextEnviar.get("1.0", tk.END).strip()  # Eliminar saltos de línea extra
         if data_to_send:
-            SerialPort1.write(data_to_send.encode() + b"\r")
-            time.sleep(2)
-            aux = SerialPort1.read_all()
-            if b"Done." in aux:
-                time.sleep(42)
-                TextRecibidos.insert(tk.END, b"OK\n")
+            fut = enlace(SerialPort1).send(data_to_send, timeout=60)
+            if fut.result() == "Done.":
+                TextRecibidos.insert(tk.END, "OK\n")
             messagebox.showinfo(message="Enviado Correctamente", title="Resultado")
         else:
             messagebox.showwarning("Advertencia", "El campo de envío está vacío.")
@@ -0,0 +1,157 @@
+"""
+Escaneo cíclico de palabras del PLC de la cinta (DM / CIO) con Host Link.
+
+En vez de esperar a que el PLC mande un 'EX', EscanerPLC lee cada 'ciclo'
+segundos un conjunto fijo de palabras y lo compara con la lectura anterior:
+sólo las palabras que cambian salen como CambioPLC por la cola self.cambios
+(la primera lectura sale entera, con anterior=None, para partir de una
+imagen completa).
+
+Las direcciones se agrupan en lecturas en bloque (hostlink.rangos): DM9..DM14
+es una sola trama RD aunque sólo interesen 5 de las 6 palabras. Las lecturas
+van por el mismo PLCLink que los Deliver / Free, que ya escribe de una en una
+esperando el acuse, así que no se pisan con ellos en el bus.
+
+  escaner = EscanerPLC(plc, [("DM", 9), ("DM", 10), ("CIO", 1)], ciclo=0.5)
+  escaner.iniciar()
+  ...  cambio = escaner.cambios.get_nowait()
+  escaner.detener()
+"""
+import queue
+import threading
+import time
+
+import hostlink
+import plc_link
+
+ESCANEO_CICLO = 0.5   # s entre el inicio de dos lecturas completas
+HUECO_MAX = 4         # palabras sin interés que se leen de más para no partir un bloque
+CAMBIOS_MAX = 1000    # cambios que se guardan si nadie vacía la cola
+
+
+class CambioPLC:
+    def __init__(self, area: str, direccion: int, anterior, valor: int, t: float):
+        self.area = area
+        self.direccion = direccion
+        self.anterior = anterior      # None en la primera lectura
+        self.valor = valor
+        self.t = t                    # hora de la lectura que lo detectó
+
+    @property
+    def clave(self) -> tuple:
+        return (self.area, self.direccion)
+
+    def __repr__(self):
+        antes = "----" if self.anterior is None else "%04X" % self.anterior
+        return f"CambioPLC({self.area}{self.direccion}: {antes} -> {self.valor:04X})"
+
+
+def plan_lecturas(palabras, hueco: int = HUECO_MAX) -> list:
+    """[(área, dirección)] -> [(área, dirección inicial, cantidad)] en el mínimo de tramas"""
+    por_area = {}
+    for area, direccion in palabras:
+        if area not in hostlink.LECTURA:
+            raise hostlink.ErrorHostLink(f"área no válida: {area!r}")
+        por_area.setdefault(area, set()).add(direccion)
+    return [(area, inicio, cantidad)
+            for area in sorted(por_area)
+            for inicio, cantidad in hostlink.rangos(por_area[area], hostlink.LECTURA_MAX, hueco)]
+
+
+class EscanerPLC:
+    def __init__(self, plc, palabras, ciclo: float = ESCANEO_CICLO, hueco: int = HUECO_MAX,
+                 timeout: float = None):
+        self.plc = plc                          # plc_link.PLCLink
+        self.palabras = set(palabras)           # {(área, dirección)} que se vigilan
+        self.ciclo = ciclo
+        self.timeout = timeout
+        self.lecturas = plan_lecturas(self.palabras, hueco)
+        self.imagen = {}                        # (área, dirección) -> último valor leído
+        self.cambios = queue.Queue(maxsize=CAMBIOS_MAX)
+        self.ciclos = 0
+        self.errores = 0
+        self.ultimo_error = ""
+        self.duracion = 0.0                     # s que tardó la última lectura completa
+        self._parar = threading.Event()
+        self._hilo = None
+
+    @property
+    def activo(self) -> bool:
+        return self._hilo is not None and self._hilo.is_alive()
+
+    @property
+    def utilizacion(self) -> float:
+        """Fracción del ciclo que el bus pasa leyendo"""
+        return min(1.0, self.duracion / self.ciclo) if self.ciclo else 1.0
+
+    def iniciar(self):
+        if self.activo:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, daemon=True, name="escaner-plc")
+        self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+
+    def escanear(self) -> list:
+        """Una lectura completa; devuelve (y encola) los CambioPLC respecto a la anterior"""
+        t0 = time.monotonic()
+        cambios = []
+        for area, inicio, cantidad in self.lecturas:
+            if self._parar.is_set():
+                break
+            fut = self.plc.send(hostlink.leer(inicio, cantidad, area), self.timeout)
+            r = fut.result()
+            if plc_link.es_error(r):
+                self._fallo(f"{area}{inicio}+{cantidad}: {plc_link.describir(r)}")
+                continue
+            valores = r.palabras()
+            if len(valores) != cantidad:
+                self._fallo(f"{area}{inicio}+{cantidad}: {len(valores)} palabras en la respuesta")
+                continue
+            t = time.time()
+            for i, valor in enumerate(valores):
+                clave = (area, inicio + i)
+                if clave not in self.palabras:
+                    continue   # palabra de relleno del bloque
+                anterior = self.imagen.get(clave)
+                if anterior != valor:
+                    self.imagen[clave] = valor
+                    cambios.append(CambioPLC(area, inicio + i, anterior, valor, t))
+        self.duracion = time.monotonic() - t0
+        self.ciclos += 1
+        for cambio in cambios:
+            self._encolar(cambio)
+        return cambios
+
+    # ---------------- Interno ----------------
+    def _bucle(self):
+        siguiente = time.monotonic()
+        while not self._parar.is_set():
+            try:
+                self.escanear()
+            except Exception as e:
+                self._fallo(str(e))
+            # Ritmo fijo: el ciclo cuenta desde el inicio de la lectura anterior
+            siguiente += self.ciclo
+            espera = siguiente - time.monotonic()
+            if espera < 0:
+                siguiente = time.monotonic()   # el bus no da para este ciclo: no acumular retraso
+                espera = 0
+            self._parar.wait(espera)
+
+    def _fallo(self, texto: str):
+        self.errores += 1
+        self.ultimo_error = texto
+
+    def _encolar(self, cambio: CambioPLC):
+        while True:
+            try:
+                self.cambios.put_nowait(cambio)
+                return
+            except queue.Full:
+                try:
+                    self.cambios.get_nowait()
+                except queue.Empty:
+                    pass
@@ -0,0 +1,194 @@
+"""
+Estimación del tiempo de un trabajo de G-code para GRBL.
+
+Reproduce a grandes rasgos el planificador de GRBL 1.1: velocidad máxima y
+aceleración por eje ($110/$111, $120/$121), velocidad en las esquinas por
+desviación de unión ($11) y perfil trapezoidal en cada bloque, con pasadas
+hacia atrás y hacia adelante sobre todo el programa. Los cambios de estado
+del láser (M3/M4/M5) sincronizan el buffer y obligan a parar, igual que en
+GRBL; en modo láser ($32=1) un cambio sólo de S no detiene el movimiento.
+"""
+import math
+import re
+
+from grbl_link import enlace
+
+# Valores por defecto de GRBL 1.1 si no se pueden leer los '$$' de la máquina
+GRBL_DEFAULTS = {
+    11: 0.010,   # desviación de unión (mm)
+    32: 0,       # modo láser
+    110: 500.0,  # velocidad máx. X (mm/min)
+    111: 500.0,  # velocidad máx. Y (mm/min)
+    120: 10.0,   # aceleración X (mm/s²)
+    121: 10.0,   # aceleración Y (mm/s²)
+}
+
+_RE_AJUSTE = re.compile(r"^\$(\d+)=(-?[\d.]+)")
+_RE_PALABRA = re.compile(r"([A-Z])(-?\d*\.?\d+)")
+
+
+def parse_ajustes_grbl(texto) -> dict:
+    """Convierte la respuesta de '$$' ('$110=3000.000' ...) en {110: 3000.0, ...}"""
+    ajustes = dict(GRBL_DEFAULTS)
+    lineas = texto.splitlines() if isinstance(texto, str) else texto
+    for linea in lineas:
+        m = _RE_AJUSTE.match(linea.strip())
+        if m:
+            ajustes[int(m.group(1))] = float(m.group(2))
+    return ajustes
+
+
+def leer_ajustes_grbl(ser, timeout: float = 5.0) -> dict:
+    """Pide '$$' a GRBL y devuelve los ajustes (lanza TimeoutError si no responde)"""
+    fut = enlace(ser).send("$$")
+    fut.result(timeout)
+    return parse_ajustes_grbl(fut.lineas)
+
+
+def _limite_por_eje(limites, ux, uy):
+    """Valor máximo en la dirección (ux, uy) sin superar el límite de ningún eje"""
+    v = float("inf")
+    if ux:
+        v = min(v, limites[0] / abs(ux))
+    if uy:
+        v = min(v, limites[1] / abs(uy))
+    return v
+
+
+def _tiempo_tramo(bloques) -> float:
+    """Tiempo de una serie de bloques que empieza y termina parada"""
+    n = len(bloques)
+    if not n:
+        return 0.0
+    # bloque = [longitud, v_nominal², aceleración, v²_max_entrada]
+    entrada = [0.0] * (n + 1)
+    # Pasada hacia atrás: poder frenar hasta la salida (parada al final)
+    for i in range(n - 1, -1, -1):
+        L, _, a, v_max2 = bloques[i]
+        entrada[i] = min(v_max2, entrada[i + 1] + 2.0 * a * L)
+    entrada[0] = 0.0
+    # Pasada hacia adelante: poder acelerar desde la entrada
+    for i in range(n):
+        L, _, a, _ = bloques[i]
+        entrada[i + 1] = min(entrada[i + 1], entrada[i] + 2.0 * a * L)
+
+    total = 0.0
+    for i in range(n):
+        L, vn2, a, _ = bloques[i]
+        ve2, vx2 = entrada[i], entrada[i + 1]
+        # Velocidad pico: la nominal o la que permite el trapecio (triángulo)
+        vp2 = min(vn2, (2.0 * a * L + ve2 + vx2) / 2.0)
+        vp, ve, vx = math.sqrt(vp2), math.sqrt(ve2), math.sqrt(vx2)
+        d_acel = (vp2 - ve2) / (2.0 * a)
+        d_fren = (vp2 - vx2) / (2.0 * a)
+        crucero = max(0.0, L - d_acel - d_fren)
+        total += (vp - ve) / a + (vp - vx) / a + (crucero / vp if vp > 0 else 0.0)
+    return total
+
+
+def estimar_tiempo(gcode, ajustes=None) -> float:
+    """Segundos estimados de movimiento para 'gcode' (texto o iterable de líneas)"""
+    aj = dict(GRBL_DEFAULTS)
+    if ajustes:
+        aj.update(ajustes)
+    v_max = (aj[110] / 60.0, aj[111] / 60.0)
+    acel = (aj[120], aj[121])
+    desviacion = aj[11]
+    modo_laser = bool(aj[32])
+
+    lineas = gcode.splitlines() if isinstance(gcode, str) else gcode
+    x = y = 0.0
+    feed = None            # mm/s
+    movimiento = 0         # 0 = G0, 1 = G1
+    husillo = "M5"
+    s_val = 0.0
+    anterior = None        # (ux, uy, v_nominal²) del bloque anterior
+    bloques = []
+    total = 0.0
+
+    def sincronizar():
+        nonlocal anterior, total
+        total += _tiempo_tramo(bloques)
+        bloques.clear()
+        anterior = None
+
+    for raw in lineas:
+        linea = raw.split(";", 1)[0].strip().upper()
+        if not linea or linea.startswith("$"):
+            continue
+        palabras = _RE_PALABRA.findall(linea)
+        nx, ny = x, y
+        hay_xy = False
+        for letra, valor in palabras:
+            if letra == "G":
+                g = float(valor)
+                if g in (0.0, 1.0):
+                    movimiento = int(g)
+                elif g == 4.0:
+                    sincronizar()
+                    p = next((float(v) for l, v in palabras if l == "P"), 0.0)
+                    total += p
+            elif letra == "M":
+                m = "M" + str(int(float(valor)))
+                if m in ("M3", "M4", "M5") and m != husillo:
+                    sincronizar()
+                    husillo = m
+            elif letra == "S":
+                s = float(valor)
+                if s != s_val and husillo != "M5" and not modo_laser:
+                    sincronizar()
+                s_val = s
+            elif letra == "F":
+                feed = float(valor) / 60.0
+            elif letra == "X":
+                nx, hay_xy = float(valor), True
+            elif letra == "Y":
+                ny, hay_xy = float(valor), True
+        if not hay_xy:
+            continue
+
+        dx, dy = nx - x, ny - y
+        L = math.hypot(dx, dy)
+        x, y = nx, ny
+        if L < 1e-9:
+            continue
+        ux, uy = dx / L, dy / L
+        v_nom = _limite_por_eje(v_max, ux, uy)
+        if movimiento == 1 and feed:
+            v_nom = min(v_nom, feed)
+        a = _limite_por_eje(acel, ux, uy)
+        vn2 = v_nom * v_nom
+
+        if anterior is None:
+            v_max2 = 0.0
+        else:
+            pux, puy, pvn2 = anterior
+            cos_theta = -(pux * ux + puy * uy)
+            if cos_theta > 0.999999:
+                v_union2 = 0.0  # vuelta atrás: parada
+            elif cos_theta < -0.999999:
+                v_union2 = float("inf")  # misma recta
+            else:
+                jx, jy = ux - pux, uy - puy
+                jn = math.hypot(jx, jy)
+                a_union = _limite_por_eje(acel, jx / jn, jy / jn)
+                sin_d2 = math.sqrt(0.5 * (1.0 - cos_theta))
+                v_union2 = a_union * desviacion * sin_d2 / (1.0 - sin_d2)
+            v_max2 = min(v_union2, pvn2, vn2)
+        bloques.append([L, vn2, a, v_max2])
+        anterior = (ux, uy, vn2)
+
+    sincronizar()
+    return total
+
+
+def formatear_duracion(segundos: float) -> str:
+    """'1 h 02 min 05 s' / '3 min 20 s' / '45 s'"""
+    s = int(round(segundos))
+    h, s = divmod(s, 3600)
+    m, s = divmod(s, 60)
+    if h:
+        return f"{h} h {m:02d} min {s:02d} s"
+    if m:
+        return f"{m} min {s:02d} s"
+    return f"{s} s"
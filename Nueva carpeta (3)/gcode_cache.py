@@ -0,0 +1,276 @@
+"""
+Caché en disco del G-code generado para los marcadores ArUco.
+
+La clave es el SHA-256 del contenido de la imagen más todos los parámetros
+de generate_gcode_text (y el generador usado), así que reimprimir la misma
+opción no vuelve a pasar por Python: se lee el archivo ya generado.
+Los archivos más antiguos (por último uso) se borran al superar max_bytes.
+
+PrecalentadorCatalogo genera en segundo plano el G-code de un catálogo fijo
+de imágenes y lo vuelve a generar cuando cambia el mtime de un PNG.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_VERSION = 1
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "gcode_cache")
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_MEMORIA = 32  # trabajos que además se guardan en RAM
+
+
+def hash_imagen(path: str) -> str:
+    """SHA-256 del contenido del archivo de imagen"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 16), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class GcodeCache:
+    def __init__(self, directorio: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES,
+                 en_memoria: int = CACHE_MEMORIA):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.en_memoria = en_memoria
+        self._lock = threading.Lock()
+        self._hashes = {}  # path -> (mtime, tamaño, sha256)
+        self._memoria = OrderedDict()  # clave -> G-code, en orden de uso
+        self._en_curso = {}  # clave -> Event de la generación en marcha
+        self.aciertos = 0
+        self.fallos = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    def _hash(self, path: str) -> str:
+        """Hash de la imagen, recalculado sólo si cambió su mtime o tamaño"""
+        st = os.stat(path)
+        firma = (st.st_mtime_ns, st.st_size)
+        previo = self._hashes.get(path)
+        if previo and previo[:2] == firma:
+            return previo[2]
+        h = hash_imagen(path)
+        self._hashes[path] = firma + (h,)
+        return h
+
+    def clave(self, generador, image_path: str, **params) -> str:
+        """Clave del trabajo: imagen + parámetros + generador + versión"""
+        datos = {
+            "version": CACHE_VERSION,
+            "generador": f"{getattr(generador, '__module__', '')}.{getattr(generador, '__qualname__', '')}",
+            "imagen": self._hash(image_path),
+            "params": params,
+        }
+        texto = json.dumps(datos, sort_keys=True, default=repr)
+        return hashlib.sha256(texto.encode()).hexdigest()
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, clave + ".gcode")
+
+    def _recordar(self, clave: str, texto: str):
+        with self._lock:
+            self._memoria[clave] = texto
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.en_memoria:
+                self._memoria.popitem(last=False)
+
+    def leer(self, clave: str):
+        """Devuelve el G-code guardado o None; marca el archivo como usado"""
+        with self._lock:
+            texto = self._memoria.get(clave)
+            if texto is not None:
+                self._memoria.move_to_end(clave)
+        ruta = self._ruta(clave)
+        try:
+            if texto is None:
+                with open(ruta, "r", encoding="utf-8") as f:
+                    texto = f.read()
+                self._recordar(clave, texto)
+            os.utime(ruta)
+        except OSError:
+            return texto
+        return texto
+
+    def guardar(self, clave: str, texto: str):
+        """Escribe el G-code de forma atómica y aplica el límite de tamaño"""
+        ruta = self._ruta(clave)
+        tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(texto)
+        os.replace(tmp, ruta)
+        self._recordar(clave, texto)
+        self._recortar()
+
+    def _recortar(self):
+        """Borra los archivos usados hace más tiempo hasta quedar bajo max_bytes"""
+        with self._lock:
+            archivos = []
+            for nombre in os.listdir(self.directorio):
+                if not nombre.endswith(".gcode"):
+                    continue
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    st = os.stat(ruta)
+                except OSError:
+                    continue
+                archivos.append((st.st_mtime, st.st_size, ruta))
+            total = sum(a[1] for a in archivos)
+            for _, tam, ruta in sorted(archivos):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(ruta)
+                    total -= tam
+                except OSError:
+                    pass
+
+    def obtener(self, generador, *, image_path: str, **params) -> str:
+        """G-code de la caché o, si no está, generador(image_path=..., **params)"""
+        clave = self.clave(generador, image_path, **params)
+        while True:
+            texto = self.leer(clave)
+            if texto is not None:
+                self.aciertos += 1
+                return texto
+            with self._lock:
+                evento = self._en_curso.get(clave)
+                if evento is None:
+                    evento = self._en_curso[clave] = threading.Event()
+                    break
+            # Otro hilo ya lo está generando: se espera a que termine
+            evento.wait()
+
+        self.fallos += 1
+        try:
+            texto = generador(image_path=image_path, **params)
+            if texto:
+                self.guardar(clave, texto)
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+            evento.set()
+        return texto
+
+    def lineas(self, generador, generador_lineas, *, image_path: str, **params):
+        """Como obtener, pero sin esperar a tener el trabajo entero.
+
+        Si está en la caché devuelve el texto. Si no, devuelve las líneas de
+        generador_lineas(image_path=..., **params) según se consumen y las va
+        escribiendo al archivo de la caché (con la clave de generador), que sólo
+        queda guardado si se consumen todas; un envío cortado no deja nada.
+        """
+        clave = self.clave(generador, image_path, **params)
+        texto = self.leer(clave)
+        if texto is not None:
+            self.aciertos += 1
+            return texto
+        self.fallos += 1
+        return self._escribir_lineas(clave, generador_lineas(image_path=image_path, **params))
+
+    def _escribir_lineas(self, clave: str, lineas):
+        ruta = self._ruta(clave)
+        tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        completo = False
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for linea in lineas:
+                    f.write(linea + "\n")   # mismo texto que "\n".join(...) + "\n"
+                    yield linea
+            os.replace(tmp, ruta)
+            completo = True
+        finally:
+            if not completo:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            cerrar = getattr(lineas, "close", None)
+            if cerrar:
+                cerrar()
+        # No se guarda en RAM: la próxima lectura lo carga del disco
+        self._recortar()
+
+    def limpiar(self):
+        """Vacía la caché"""
+        with self._lock:
+            self._memoria.clear()
+            for nombre in os.listdir(self.directorio):
+                if nombre.endswith(".gcode"):
+                    try:
+                        os.remove(os.path.join(self.directorio, nombre))
+                    except OSError:
+                        pass
+
+
+class PrecalentadorCatalogo:
+    """Mantiene generado en la caché el G-code de todas las imágenes de un catálogo"""
+
+    def __init__(self, cache: GcodeCache, generador, rutas: dict, params: dict,
+                 workers: int = None, intervalo: float = 5.0, log=None):
+        self.cache = cache
+        self.generador = generador
+        self.rutas = dict(rutas)        # nombre -> ruta de imagen
+        self.params = dict(params)      # parámetros de generate_gcode_text
+        self.intervalo = intervalo      # s entre revisiones de mtime
+        self.log = log
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                        thread_name_prefix="gcode")
+        self._vistos = {}               # ruta -> (mtime, tamaño) ya generado o en cola
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        """Genera todo el catálogo y sigue vigilando los cambios en segundo plano"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._vigilar, daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+        self._pool.shutdown(wait=False)
+
+    def _vigilar(self):
+        while not self._parar.is_set():
+            self.refrescar()
+            self._parar.wait(self.intervalo)
+
+    def refrescar(self):
+        """Encola las imágenes nuevas o cuyo archivo cambió desde la última vez"""
+        for nombre, ruta in self.rutas.items():
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            firma = (st.st_mtime_ns, st.st_size)
+            if self._vistos.get(ruta) == firma:
+                continue
+            self._vistos[ruta] = firma
+            try:
+                self._pool.submit(self._generar, nombre, ruta)
+            except RuntimeError:
+                return  # pool cerrado
+
+    def _generar(self, nombre: str, ruta: str):
+        try:
+            self.cache.obtener(self.generador, image_path=ruta, **self.params)
+            if self.log:
+                self.log(f"[GCODE] {nombre} listo en caché")
+        except Exception as e:
+            self._vistos.pop(ruta, None)
+            if self.log:
+                self.log(f"[GCODE] {nombre}: error precalentando ({e})")
+
+
+_cache = None
+
+
+def cache_global() -> GcodeCache:
+    """Caché compartida por las ventanas de la aplicación"""
+    global _cache
+    if _cache is None:
+        _cache = GcodeCache()
+    return _cache
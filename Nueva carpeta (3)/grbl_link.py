@@ -0,0 +1,338 @@
+"""
+Enlace con un dispositivo GRBL por puerto serie.
+
+Un único hilo lector por puerto separa lo que responde GRBL:
+  - 'ok' / 'error:N'         -> resuelven, en orden, el Future de cada línea enviada
+  - 'ALARM:N' / reinicio      -> resuelven con ese texto todos los Future pendientes
+  - '<...>'                  -> informes de estado (nunca cuentan como respuesta)
+  - '[MSG:...]', '$n=v', ... -> se adjuntan a la orden en curso y van a la cola de eventos
+
+send() devuelve un concurrent.futures.Future, así quien espera puede poner
+un timeout en lugar de quedarse leyendo el puerto para siempre.
+
+Los informes '<...>' mantienen un EstadoMaquina (Idle/Run/Hold/Alarm,
+posiciones, buffer, overrides); iniciar_sondeo() pide '?' a intervalos
+fijos y esperar_idle() bloquea hasta que la máquina está realmente parada.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+CMD_TIMEOUT = 10.0  # s de espera por defecto para una respuesta
+SONDEO_HZ = 5.0     # '?' por segundo del sondeo de estado
+EVENTOS_MAX = 500   # si nadie lee la cola de eventos se descartan los más viejos
+ERROR_ESPERA = 0.1  # s de pausa tras un fallo de lectura (no girar en vacío)
+ERRORES_MAX = 20    # fallos de lectura seguidos tras los que se da el puerto por perdido
+
+# Campos numéricos de los informes '<...>'; Pn y A (accesorios) son letras
+CAMPOS_NUMERICOS = {"MPos", "WPos", "WCO", "Bf", "FS", "F", "Ov", "Ln"}
+
+
+class EstadoMaquina:
+    """Último estado informado por GRBL ('<Idle|MPos:...|Bf:...|FS:...>')"""
+
+    def __init__(self):
+        self.estado = "Desconocido"   # Idle, Run, Hold, Jog, Alarm, Door, Check, Home, Sleep
+        self.subestado = None         # p. ej. 0 en 'Hold:0'
+        self.mpos = None              # (x, y, z) coordenadas de máquina
+        self.wpos = None              # (x, y, z) coordenadas de trabajo
+        self.wco = None               # desplazamiento de trabajo (MPos - WPos)
+        self.bloques_libres = None    # Bf: bloques libres del planificador
+        self.rx_libre = None          # Bf: bytes libres del buffer RX
+        self.feed = None              # FS: velocidad actual (mm/min)
+        self.spindle = None           # FS: potencia / velocidad actual
+        self.overrides = None         # Ov: (feed, rapid, spindle) en %
+        self.pines = ""               # Pn: entradas activas
+        self.accesorios = ""          # A: S/C (spindle/láser), F/M (refrigerante)
+        self.linea = None             # Ln: número de línea en ejecución
+        self.instante = 0.0           # time.monotonic() del informe
+        self.informes = 0             # nº de informes recibidos
+
+    @property
+    def idle(self) -> bool:
+        return self.estado == "Idle"
+
+    @property
+    def alarma(self) -> bool:
+        return self.estado == "Alarm"
+
+    def actualizar(self, texto: str):
+        """Aplica un informe '<...>' (los campos que no vienen conservan su valor)"""
+        campos = texto.strip("<>").split("|")
+        estado, _, sub = campos[0].partition(":")
+        self.estado = estado
+        self.subestado = int(sub) if sub.isdigit() else None
+        mpos = wpos = None
+        self.pines = ""
+        self.accesorios = ""   # GRBL sólo envía Pn / A mientras hay algo activo
+        for campo in campos[1:]:
+            clave, _, valor = campo.partition(":")
+            if clave == "Pn":
+                self.pines = valor
+                continue
+            if clave == "A":
+                self.accesorios = valor
+                continue
+            if clave not in CAMPOS_NUMERICOS:
+                continue   # campo desconocido (otra versión de GRBL): se ignora
+            try:
+                numeros = [float(v) for v in valor.split(",")] if valor else []
+            except ValueError:
+                continue   # campo mal formado: el resto del informe se aplica igual
+            if clave == "MPos":
+                mpos = tuple(numeros)
+            elif clave == "WPos":
+                wpos = tuple(numeros)
+            elif clave == "WCO":
+                self.wco = tuple(numeros)
+            elif clave == "Bf" and len(numeros) >= 2:
+                self.bloques_libres, self.rx_libre = int(numeros[0]), int(numeros[1])
+            elif clave == "FS" and len(numeros) >= 2:
+                self.feed, self.spindle = numeros[0], numeros[1]
+            elif clave == "F" and numeros:
+                self.feed = numeros[0]
+            elif clave == "Ov" and len(numeros) >= 3:
+                self.overrides = tuple(int(v) for v in numeros[:3])
+            elif clave == "Ln" and numeros:
+                self.linea = int(numeros[0])
+        # GRBL envía MPos o WPos; la otra se deduce con el último WCO
+        if mpos is not None:
+            self.mpos = mpos
+            if self.wco:
+                self.wpos = tuple(m - w for m, w in zip(mpos, self.wco))
+        if wpos is not None:
+            self.wpos = wpos
+            if self.wco:
+                self.mpos = tuple(p + w for p, w in zip(wpos, self.wco))
+        self.instante = time.monotonic()
+        self.informes += 1
+
+    def __str__(self):
+        pos = self.wpos or self.mpos
+        xyz = " ".join(f"{e}{v:.2f}" for e, v in zip("XYZ", pos)) if pos else "-"
+        return f"{self.estado} {xyz}"
+
+
+class GrblLink:
+    def __init__(self, ser, on_status=None):
+        self.ser = ser
+        self.on_status = on_status      # función(texto '<...>') llamada desde el hilo lector
+        self.eventos = queue.Queue(maxsize=EVENTOS_MAX)  # (tipo, texto): 'mensaje' | 'alarma' | 'reinicio' | 'error'
+        self.ultimo_estado = None
+        self.estado = EstadoMaquina()
+        self._cambio_estado = threading.Condition()
+        self._sondeo = None             # hilo que envía '?'
+        self._lock = threading.Lock()
+        self._pendientes = deque()      # Future en el orden en que se enviaron las líneas
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._leer, daemon=True,
+                                      name=f"grbl-{getattr(ser, 'port', '?')}")
+        self._hilo.start()
+
+    # ---------------- Envío ----------------
+    def send(self, cmd: str) -> Future:
+        """Envía una línea y devuelve el Future de su respuesta ('ok', 'error:N', 'ALARM:N', 'reset')"""
+        fut = Future()
+        fut.linea = cmd.strip()
+        fut.lineas = []                 # salida adicional ($$, $G, [MSG]...)
+        if not fut.linea:
+            fut.set_result("ok")
+            return fut
+        with self._lock:
+            self._pendientes.append(fut)
+            self.ser.write((fut.linea + "\n").encode())
+        return fut
+
+    def send_cmd(self, cmd: str, timeout: float = CMD_TIMEOUT) -> str:
+        """Envía y espera la respuesta; lanza TimeoutError si no llega a tiempo"""
+        return self.send(cmd).result(timeout)
+
+    def write(self, data: bytes):
+        """Escritura directa (órdenes de tiempo real como '?', '!', '~', Ctrl-X)"""
+        with self._lock:
+            return self.ser.write(data)
+
+    @property
+    def pendientes(self) -> int:
+        return len(self._pendientes)
+
+    @property
+    def is_open(self) -> bool:
+        return getattr(self.ser, "is_open", False) and not self._parar.is_set()
+
+    def descartar_pendientes(self, respuesta: str = "timeout"):
+        """Resuelve con 'respuesta' todo lo que espera un 'ok' (tras perder uno, así
+        el 'ok' de la siguiente orden no se le asigna a una línea vieja)"""
+        self._fallar_pendientes(respuesta)
+
+    def close(self):
+        """Detiene el hilo lector (el puerto lo cierra quien lo abrió)"""
+        self._parar.set()
+        self._fallar_pendientes("reset")
+        with self._cambio_estado:
+            self._cambio_estado.notify_all()
+
+    # ---------------- Estado ----------------
+    def iniciar_sondeo(self, hz: float = SONDEO_HZ):
+        """Pide '?' hz veces por segundo mientras el enlace esté abierto"""
+        self.periodo_sondeo = 1.0 / hz
+        if self._sondeo is None or not self._sondeo.is_alive():
+            self._sondeo = threading.Thread(target=self._sondear, daemon=True)
+            self._sondeo.start()
+
+    def detener_sondeo(self):
+        self._sondeo = None
+
+    def _sondear(self):
+        hilo = threading.current_thread()
+        while self._sondeo is hilo and self.is_open:
+            try:
+                self.write(b"?")
+            except Exception:
+                break
+            time.sleep(self.periodo_sondeo)
+
+    def pedir_estado(self, timeout: float = 1.0) -> EstadoMaquina:
+        """Envía '?' y espera el siguiente informe"""
+        with self._cambio_estado:
+            n = self.estado.informes
+            self.write(b"?")
+            self._cambio_estado.wait_for(lambda: self.estado.informes > n or not self.is_open, timeout)
+        return self.estado
+
+    def esperar_idle(self, timeout: float = None, cancel=None, periodo: float = 0.1) -> bool:
+        """Bloquea hasta que GRBL haya respondido a todo lo enviado y esté en Idle.
+
+        Sólo cuenta un informe pedido después de la última respuesta, así un
+        'Idle' anterior a que empiece el movimiento no engaña. Devuelve False
+        si se agota el timeout, se activa cancel o la máquina entra en alarma.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        desde = None
+        while self.is_open:
+            if cancel is not None and cancel.is_set():
+                return False
+            if limite is not None and time.monotonic() >= limite:
+                return False
+            if self._pendientes:
+                desde = None
+                time.sleep(periodo / 2)
+                continue
+            if desde is None:
+                desde = time.monotonic()
+            estado = self.pedir_estado(periodo)
+            if estado.instante > desde:
+                if estado.idle:
+                    return True
+                if estado.alarma:
+                    return False
+            time.sleep(periodo)
+        return False
+
+    # ---------------- Hilo lector ----------------
+    def _fallar_pendientes(self, respuesta: str):
+        with self._lock:
+            pendientes = list(self._pendientes)
+            self._pendientes.clear()
+        for fut in pendientes:
+            if not fut.done():
+                fut.set_result(respuesta)
+
+    def _leer(self):
+        fallos = 0
+        while not self._parar.is_set():
+            try:
+                raw = self.ser.readline()
+            except Exception as e:
+                if not getattr(self.ser, "is_open", True):
+                    break  # puerto cerrado
+                # p. ej. cable USB desconectado: el puerto sigue 'abierto' pero cada read falla
+                fallos += 1
+                if fallos >= ERRORES_MAX:
+                    self._evento("error", f"lectura fallida {fallos} veces seguidas: {e}")
+                    self._parar.set()
+                    break
+                time.sleep(ERROR_ESPERA)
+                continue
+            fallos = 0
+            if not raw:
+                if not getattr(self.ser, "is_open", True):
+                    break  # cerrado sin excepción: readline devuelve b'' sin esperar
+                continue
+            linea = raw.decode(errors="ignore").strip()
+            if linea:
+                self._procesar(linea)
+        self._fallar_pendientes("reset")
+
+    def _procesar(self, linea: str):
+        if linea.startswith("<") and linea.endswith(">"):
+            self.ultimo_estado = linea
+            with self._cambio_estado:
+                try:
+                    self.estado.actualizar(linea)
+                except ValueError:
+                    pass
+                self._cambio_estado.notify_all()
+            if self.on_status:
+                self.on_status(linea)
+            return
+
+        if linea == "ok" or linea.lower().startswith("error"):
+            with self._lock:
+                fut = self._pendientes.popleft() if self._pendientes else None
+            if fut is not None and not fut.done():
+                fut.set_result(linea)
+            return
+
+        if linea.upper().startswith("ALARM"):
+            self._evento("alarma", linea)
+            self._fallar_pendientes(linea)
+            return
+
+        if linea.startswith("Grbl "):
+            # Reinicio (soft-reset o encendido): lo enviado ya no tendrá respuesta
+            self._evento("reinicio", linea)
+            self._fallar_pendientes("reset")
+            return
+
+        with self._lock:
+            fut = self._pendientes[0] if self._pendientes else None
+        if fut is not None:
+            fut.lineas.append(linea)
+        self._evento("mensaje", linea)
+
+    def _evento(self, tipo: str, texto: str):
+        while True:
+            try:
+                self.eventos.put_nowait((tipo, texto))
+                return
+            except queue.Full:
+                try:
+                    self.eventos.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+_enlaces = {}
+_enlaces_lock = threading.Lock()
+
+
+def enlace(ser) -> GrblLink:
+    """GrblLink del puerto (se crea la primera vez; uno por puerto abierto)"""
+    if isinstance(ser, GrblLink):
+        return ser
+    with _enlaces_lock:
+        link = _enlaces.get(id(ser))
+        if link is None or link.ser is not ser or not link.is_open:
+            link = _enlaces[id(ser)] = GrblLink(ser)
+        return link
+
+
+def cerrar_enlace(ser):
+    """Detiene el hilo lector asociado a ser, si lo hay"""
+    with _enlaces_lock:
+        link = _enlaces.pop(id(ser), None)
+    if link is not None:
+        link.close()
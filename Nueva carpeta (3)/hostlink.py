@@ -0,0 +1,358 @@
+"""
+Tramas Omron Host Link (C-mode) para el PLC de la cinta.
+
+Una trama es '@' + unidad (2 dígitos) + cabecera (WD, RD, ...) + texto +
+FCS + '*' y se termina con CR. El FCS es el XOR de todos los caracteres
+desde '@' hasta el final del texto, en 2 dígitos hex. Las direcciones van en
+4 dígitos decimales y cada palabra en 4 dígitos hex.
+
+  wd(9, [0x0001])          -> '@00WD000900015B*'   (escribir DM9 = 0001)
+  wd(9, [1, 2, 3])         -> una sola trama para DM9, DM10 y DM11
+  rd(9, 6)                 -> leer DM9..DM14
+  rangos([9, 10, 13, 48], hueco=2) -> [(9, 5), (48, 1)]   (lecturas en bloque)
+  parsear('@00WD0053*')    -> Respuesta(cabecera='WD', codigo_fin='00', ...)
+
+ReceptorHostLink recibe el texto del puerto tal como llega (trozos de
+cualquier tamaño), rearma las tramas hasta su '*' + CR (un 'EX' suelto, en
+cuanto llegan sus 10 caracteres), comprueba el FCS y
+entrega a los suscriptores un EventoPLC por trama: acuse, error (código de
+fin distinto de '00'), paso de pallet ('EX' + estación + pallet), mensaje no
+solicitado o trama inválida.
+
+Las tramas de Deliver / Free de la cinta se calculan una vez al importar
+(DELIVER, FREE_ESTACION, FREE_PALLET) a partir de la distribución de DM.
+"""
+import re
+import time
+from functools import reduce
+
+UNIDAD = 0
+FIN = "*"
+TERMINADOR = "\r"
+FIN_ENVIO = "\r\n\r\n"   # lo que las aplicaciones añaden al escribir (el PLC ignora el resto)
+
+# Escritura/lectura por área: DM (WD/RD) y CIO/IR (WR/RR)
+ESCRITURA = {"DM": "WD", "CIO": "WR"}
+LECTURA = {"DM": "RD", "CIO": "RR"}
+
+PALABRAS_MAX = 30   # palabras por trama de escritura (la trama no pasa de 131 caracteres)
+LECTURA_MAX = 30    # palabras por lectura (la respuesta cabe en una sola trama)
+
+CODIGOS_FIN = {
+    "00": "fin normal",
+    "01": "no ejecutable en modo RUN",
+    "02": "no ejecutable en modo MONITOR",
+    "03": "no ejecutable en modo PROGRAM",
+    "04": "dirección fuera de rango",
+    "0B": "no ejecutable en modo PROGRAM",
+    "13": "error de FCS",
+    "14": "error de formato",
+    "15": "dato de entrada erróneo",
+    "16": "orden no soportada",
+    "18": "longitud de trama incorrecta",
+    "19": "no ejecutable",
+    "23": "memoria protegida contra escritura",
+    "A3": "FCS erróneo en trama de transmisión",
+    "A4": "formato erróneo en trama de transmisión",
+    "A5": "dato erróneo en trama de transmisión",
+    "A8": "longitud errónea en trama de transmisión",
+}
+
+# Distribución de DM en el PLC de la cinta
+DM_PALLET = 8           # DM(8 + pallet): estación destino del pallet / 0099 al liberarlo
+DM_ESTACION = 47        # DM(47 + estación): 0001 libera la estación
+LIBERAR_PALLET = 0x0099
+ESTACIONES = (1, 2, 3, 5, 6)
+PALLETS = (1, 2, 3, 5, 6)
+
+
+# Cabeceras de las órdenes cuya respuesta es un acuse con código de fin
+CABECERAS_ORDEN = {"WD", "WR", "RD", "RR", "WH", "RH", "WJ", "RJ", "MS", "SC", "TS"}
+
+# Tipos de EventoPLC
+ACUSE = "acuse"
+ERROR = "error"
+PASO = "paso"
+NO_SOLICITADO = "no solicitado"
+INVALIDA = "inválida"
+
+TRAMA_MAX = 256   # caracteres sin terminador a partir de los cuales se descarta lo recibido
+
+_RE_EX = re.compile(r"EX(\d{4})(\d{4})")
+
+
+class ErrorHostLink(ValueError):
+    pass
+
+
+class Respuesta:
+    def __init__(self, unidad: int, cabecera: str, codigo_fin: str, datos: str, texto: str):
+        self.unidad = unidad
+        self.cabecera = cabecera
+        self.codigo_fin = codigo_fin
+        self.datos = datos          # texto después del código de fin
+        self.texto = texto          # trama completa
+
+    @property
+    def ok(self) -> bool:
+        return self.codigo_fin == "00"
+
+    @property
+    def descripcion(self) -> str:
+        return CODIGOS_FIN.get(self.codigo_fin, f"código de fin {self.codigo_fin}")
+
+    def palabras(self) -> list:
+        """Palabras leídas (respuesta de RD/RR) como enteros"""
+        return [int(self.datos[i:i + 4], 16) for i in range(0, len(self.datos) - 3, 4)]
+
+    def __repr__(self):
+        return f"Respuesta(unidad={self.unidad}, cabecera={self.cabecera!r}, codigo_fin={self.codigo_fin!r}, datos={self.datos!r})"
+
+
+def fcs(texto: str) -> str:
+    """XOR de los caracteres, en 2 dígitos hex"""
+    return "%02X" % reduce(lambda a, c: a ^ c, texto.encode("ascii"), 0)
+
+
+def _palabra(valor) -> str:
+    if isinstance(valor, str):
+        if len(valor) != 4 or any(c not in "0123456789ABCDEFabcdef" for c in valor):
+            raise ErrorHostLink(f"palabra no válida: {valor!r}")
+        return valor.upper()
+    if not 0 <= valor <= 0xFFFF:
+        raise ErrorHostLink(f"palabra fuera de rango: {valor}")
+    return "%04X" % valor
+
+
+def _direccion(direccion: int) -> str:
+    if not 0 <= direccion <= 9999:
+        raise ErrorHostLink(f"dirección fuera de rango: {direccion}")
+    return "%04d" % direccion
+
+
+def trama(cabecera: str, texto: str = "", unidad: int = UNIDAD) -> str:
+    """'@' + unidad + cabecera + texto + FCS + '*' (sin el CR)"""
+    cuerpo = "@%02d%s%s" % (unidad, cabecera, texto)
+    return cuerpo + fcs(cuerpo) + FIN
+
+
+def escribir(direccion: int, palabras, area: str = "DM", unidad: int = UNIDAD) -> str:
+    """Una trama de escritura con todas las palabras desde direccion"""
+    palabras = list(palabras)
+    if not 1 <= len(palabras) <= PALABRAS_MAX:
+        raise ErrorHostLink(f"entre 1 y {PALABRAS_MAX} palabras por trama ({len(palabras)})")
+    return trama(ESCRITURA[area], _direccion(direccion) + "".join(_palabra(p) for p in palabras), unidad)
+
+
+def leer(direccion: int, cantidad: int, area: str = "DM", unidad: int = UNIDAD) -> str:
+    if not 1 <= cantidad <= 9999:
+        raise ErrorHostLink(f"cantidad fuera de rango: {cantidad}")
+    return trama(LECTURA[area], _direccion(direccion) + "%04d" % cantidad, unidad)
+
+
+def wd(direccion: int, palabras, unidad: int = UNIDAD) -> str:
+    return escribir(direccion, palabras, "DM", unidad)
+
+
+def wr(direccion: int, palabras, unidad: int = UNIDAD) -> str:
+    return escribir(direccion, palabras, "CIO", unidad)
+
+
+def rd(direccion: int, cantidad: int, unidad: int = UNIDAD) -> str:
+    return leer(direccion, cantidad, "DM", unidad)
+
+
+def rr(direccion: int, cantidad: int, unidad: int = UNIDAD) -> str:
+    return leer(direccion, cantidad, "CIO", unidad)
+
+
+def bloques(palabras: dict, maximo: int = PALABRAS_MAX) -> list:
+    """{dirección: valor} -> [(dirección inicial, [valores])]; respeta el orden dado y
+    junta en un bloque las direcciones que van seguidas (9, 10, 11 -> un bloque)"""
+    salida = []
+    for direccion, valor in palabras.items():
+        if salida and salida[-1][0] + len(salida[-1][1]) == direccion and len(salida[-1][1]) < maximo:
+            salida[-1][1].append(valor)
+        else:
+            salida.append((direccion, [valor]))
+    return salida
+
+
+def rangos(direcciones, maximo: int = LECTURA_MAX, hueco: int = 0) -> list:
+    """Direcciones a leer -> [(dirección inicial, cantidad)], de menor a mayor. Junta
+    las seguidas y también las separadas por hasta 'hueco' palabras (leer unas
+    palabras de más cuesta menos que otra trama con su ida y vuelta)"""
+    salida = []
+    for direccion in sorted(set(direcciones)):
+        if salida:
+            inicio, cantidad = salida[-1]
+            fin = inicio + cantidad
+            if direccion - fin <= hueco and direccion - inicio < maximo:
+                salida[-1] = (inicio, direccion - inicio + 1)
+                continue
+        salida.append((direccion, 1))
+    return salida
+
+
+def verificar_fcs(texto: str) -> bool:
+    """True si la trama (con o sin '*' / CR al final) tiene el FCS correcto"""
+    t = texto.strip().rstrip(FIN)
+    return len(t) >= 5 and t[0] == "@" and fcs(t[:-2]) == t[-2:].upper()
+
+
+def parsear(texto: str) -> Respuesta:
+    """Respuesta de una trama del PLC; lanza ErrorHostLink si el formato o el FCS no son válidos"""
+    t = texto.strip()
+    if not t.startswith("@") or not t.endswith(FIN):
+        raise ErrorHostLink(f"trama incompleta: {texto!r}")
+    t = t[:-1]
+    if len(t) < 9:
+        raise ErrorHostLink(f"trama demasiado corta: {texto!r}")
+    if fcs(t[:-2]) != t[-2:].upper():
+        raise ErrorHostLink(f"FCS incorrecto en {texto!r} (esperado {fcs(t[:-2])})")
+    try:
+        unidad = int(t[1:3])
+    except ValueError:
+        raise ErrorHostLink(f"unidad no válida en {texto!r}") from None
+    return Respuesta(unidad, t[3:5], t[5:7], t[7:-2], texto.strip())
+
+
+# ----------------------------------------------------------------------
+# Órdenes de la cinta, precalculadas
+# ----------------------------------------------------------------------
+def deliver(estacion: int, pallet: int, unidad: int = UNIDAD) -> str:
+    """Enviar el pallet a la estación: DM(8 + pallet) = estación"""
+    return wd(DM_PALLET + pallet, [estacion], unidad)
+
+
+def free_estacion(estacion: int, unidad: int = UNIDAD) -> str:
+    """Liberar la estación: DM(47 + estación) = 0001"""
+    return wd(DM_ESTACION + estacion, [1], unidad)
+
+
+def free_pallet(pallet: int, unidad: int = UNIDAD) -> str:
+    """Confirmar la salida del pallet: DM(8 + pallet) = 0099"""
+    return wd(DM_PALLET + pallet, [LIBERAR_PALLET], unidad)
+
+
+DELIVER = {(e, p): deliver(e, p) for e in ESTACIONES for p in PALLETS}
+FREE_ESTACION = {e: free_estacion(e) for e in ESTACIONES}
+FREE_PALLET = {p: free_pallet(p) for p in PALLETS}
+
+
+# ----------------------------------------------------------------------
+# Recepción
+# ----------------------------------------------------------------------
+class EventoPLC:
+    def __init__(self, tipo: str, texto: str, respuesta: Respuesta = None,
+                 estacion: int = None, pallet: int = None, detalle: str = ""):
+        self.tipo = tipo
+        self.texto = texto            # trama o línea tal como llegó (sin CR)
+        self.respuesta = respuesta    # Respuesta si era una trama Host Link válida
+        self.estacion = estacion      # sólo en PASO
+        self.pallet = pallet
+        self.detalle = detalle
+        self.t = time.time()          # hora de llegada: se crea al completarse la trama
+
+    def __repr__(self):
+        extra = f", estacion={self.estacion}, pallet={self.pallet}" if self.tipo == PASO else ""
+        return f"EventoPLC({self.tipo!r}, {self.texto!r}{extra})"
+
+
+def clasificar(texto: str) -> list:
+    """Eventos de una trama o línea completa (una línea puede traer varios pasos EX)"""
+    respuesta = None
+    if texto.startswith("@"):
+        try:
+            respuesta = parsear(texto)
+        except ErrorHostLink as e:
+            return [EventoPLC(INVALIDA, texto, detalle=str(e))]
+    pasos = [EventoPLC(PASO, texto, respuesta, int(m.group(1)), int(m.group(2)))
+             for m in _RE_EX.finditer(texto.upper())]
+    if pasos:
+        return pasos
+    if respuesta is not None and respuesta.cabecera in CABECERAS_ORDEN:
+        tipo = ACUSE if respuesta.ok else ERROR
+        return [EventoPLC(tipo, texto, respuesta, detalle=respuesta.descripcion)]
+    return [EventoPLC(NO_SOLICITADO, texto, respuesta)]
+
+
+class ReceptorHostLink:
+    def __init__(self):
+        self._buffer = ""
+        self._subs = []        # (función(evento), tipos o None)
+
+    def suscribir(self, fn, tipos=None):
+        """fn(evento) por cada evento (de los tipos indicados, o todos). Devuelve la baja."""
+        sub = (fn, set(tipos) if tipos else None)
+        self._subs.append(sub)
+        return lambda: sub in self._subs and self._subs.remove(sub)
+
+    def alimentar(self, texto: str) -> list:
+        """Añade texto recibido; entrega y devuelve los eventos de las tramas ya completas"""
+        self._buffer += texto
+        eventos = []
+        for trama in self._tramas():
+            eventos.extend(clasificar(trama))
+        for evento in eventos:
+            for fn, tipos in list(self._subs):
+                if tipos is None or evento.tipo in tipos:
+                    try:
+                        fn(evento)
+                    except Exception:
+                        pass
+        return eventos
+
+    def _tramas(self):
+        b = self._buffer
+        tramas = []
+        while True:
+            b = b.lstrip("\r\n")
+            if not b:
+                break
+            if b[0] == "@":
+                # Trama Host Link: hasta '*' seguido de CR/LF (u otra trama)
+                fin = -1
+                i = b.find(FIN)
+                while i >= 0:
+                    if i + 1 < len(b) and b[i + 1] in "\r\n@":
+                        fin = i
+                        break
+                    if i + 1 == len(b):
+                        break   # falta el CR: se espera al siguiente trozo
+                    i = b.find(FIN, i + 1)
+                if fin < 0:
+                    otra = b.find("@", 1)
+                    corte = b.find("\r")
+                    if 0 <= corte and (otra < 0 or corte < otra):
+                        tramas.append(b[:corte])      # CR sin '*': trama incompleta
+                        b = b[corte + 1:]
+                        continue
+                    if otra > 0:
+                        tramas.append(b[:otra])       # empezó otra trama antes del fin
+                        b = b[otra:]
+                        continue
+                    if len(b) > TRAMA_MAX:
+                        tramas.append(b)
+                        b = ""
+                    break
+                tramas.append(b[:fin + 1])
+                b = b[fin + 1:]
+            else:
+                # Texto suelto: hasta fin de línea, hasta la próxima '@' o, si trae un
+                # 'EX' + estación + pallet, justo detrás (el PLC puede no terminarlo con CR
+                # y el paso no debe esperar a la trama siguiente)
+                corte = min([i for i in (b.find("\r"), b.find("\n"), b.find("@")) if i >= 0], default=-1)
+                m = _RE_EX.search(b.upper())
+                if m and (corte < 0 or m.end() <= corte):
+                    corte = m.end()
+                if corte < 0:
+                    if len(b) > TRAMA_MAX:
+                        tramas.append(b)
+                        b = ""
+                    break
+                if b[:corte].strip():
+                    tramas.append(b[:corte].strip())
+                b = b[corte:]
+        self._buffer = b
+        return tramas
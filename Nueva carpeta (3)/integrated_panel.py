@@ -8,7 +8,6 @@ from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
 from ultralytics import YOLO
 import os
-import re
 import socket
 import queue
 
@@ -22,30 +21,41 @@ try:
 except Exception:
     ArucoProyectoBloqueo = None
 
+from gcode_cache import cache_global
+import scorbot_link
+import puerto_serie
+from secuencias import agregar_paso, optimizar_secuencia, ejecutar_en_controlador, leer_seq, escribir_seq
+import biblioteca
+import metricas
+import hostlink
+import plc_link
+import escaner_plc
+
 # --- Configuración serial para cinta (PLC) ---
 CINTA_BAUDRATE = 9600
 CINTA_BYTESIZE = serial.SEVENBITS if serial is not None else None
 CINTA_PARITY = serial.PARITY_EVEN if serial is not None else None
 CINTA_STOPBITS = serial.STOPBITS_TWO if serial is not None else None
-CINTA_READ_INTERVAL_MS = 200
-
-DELIVER_COMMANDS = {
-    (1, 1): "@00WD000900015B*",
-    (1, 2): "@00WD0010000153*",
-    (1, 3): "@00WD0011000152*",
-    (1, 5): "@00WD0013000150*",
-    (1, 6): "@00WD0014000157*",
-    (2, 1): "@00WD0009000258*",
-    (2, 2): "@00WD0010000250*",
-    (2, 3): "@00WD0011000251*",
-    (2, 5): "@00WD0013000253*",
-    (2, 6): "@00WD0014000254*",
-    (3, 1): "@00WD0009000359*",
-    (3, 2): "@00WD0010000351*",
-    (3, 3): "@00WD0011000350*",
-    (3, 5): "@00WD0013000352*",
-    (3, 6): "@00WD0014000355*",
-}
+CINTA_UI_INTERVAL_MS = 20   # la interfaz vacía la cola de eventos de la cinta (la lectura va en su hilo)
+CINTA_SCAN_CICLO = 0.5      # s entre lecturas cíclicas de la memoria del PLC (0 = sin escaneo)
+# Sensor de presencia de cada estación en la memoria del PLC: {estación: (área, dirección, bit)}.
+# Depende del programa del PLC; sin entradas, la ocupación sale de los EX y de las DM de abajo.
+CINTA_SCAN_SENSORES = {}
+# Palabras que se escanean: destino de cada pallet DM(8+p) y liberación de cada estación DM(47+e)
+CINTA_SCAN_PALABRAS = ([('DM', hostlink.DM_PALLET + p) for p in hostlink.PALLETS]
+                       + [('DM', hostlink.DM_ESTACION + e) for e in hostlink.ESTACIONES]
+                       + [(area, direccion) for area, direccion, _bit in CINTA_SCAN_SENSORES.values()])
+
+# --- Parámetros de grabado (mismos que usuario.py) ---
+LASER_GCODE_PARAMS = dict(size_mm=(20, 20), ppmm=5, mode="grayscale", invert=False, gamma_val=0.6,
+                          origin_xy=(0.0, 0.0), f_engrave=1000, f_travel=1000, s_max=600)
+
+# Programa del controlador donde se guarda la secuencia grabada por ejes
+ROBOT_SEQ_PROGRAM = "GRAB"
+
+# Tramas Host Link (FCS calculado en hostlink) de las estaciones de este panel
+PANEL_STATIONS = (1, 2, 3)
+DELIVER_COMMANDS = {k: v for k, v in hostlink.DELIVER.items() if k[0] in PANEL_STATIONS}
 
 class IntegratedApp:
     def __init__(self, root):
@@ -55,6 +65,10 @@ class IntegratedApp:
         
         self.model_yolo = YOLO('bestMH.pt')
         self.ser_cinta = None
+        self.cinta_plc = None  # PLCLink: tramas Host Link con espera del acuse
+        self.cinta_escaner = None  # EscanerPLC: lectura cíclica de DM/CIO con aviso de cambios
+        self._cinta_scan_error = ''
+        self.pallet_destino = {}  # pallet -> estación destino según DM(8 + pallet)
         self.ser_robot = None
         self.ser_laser = None
 
@@ -70,17 +84,28 @@ class IntegratedApp:
         self.cam_running = False
         self.camera_index = 0  # Índice de cámara seleccionada (0 o 1)
 
-        self.laser_positions = {}
-        self.robot_positions = {}
+        # Posiciones y secuencias persistentes (SQLite); en memoria si no se puede abrir la base
+        try:
+            bib = biblioteca.biblioteca_global()
+            self.laser_positions = biblioteca.Coleccion(bib, biblioteca.POSICION_LASER)
+            self.robot_positions = biblioteca.Coleccion(bib, biblioteca.POSICION_ROBOT)
+            robot_sequences = biblioteca.Coleccion(bib, biblioteca.SECUENCIA)
+        except Exception as e:
+            # La ventana aún no está construida: el aviso sale en cuanto arranque el bucle de Tk
+            aviso = f'Biblioteca no disponible ({e}); posiciones y secuencias sólo en memoria'
+            self.root.after(0, lambda: messagebox.showwarning('Biblioteca', aviso))
+            self.laser_positions = {}
+            self.robot_positions = {}
+            robot_sequences = {}
         self.aruco_generated_path = None
         
         # Robot command queue and sequence management
-        # Queue con límite para evitar uso excesivo de memoria
-        self.robot_command_queue = queue.Queue(maxsize=100)  # Max 100 comandos pendientes
-        self.robot_queue_thread = None
+        # Cola con prioridad (máx. 100 pendientes); avanza con las respuestas del robot
+        self.robot_scheduler = scorbot_link.PlanificadorComandos(
+            self._robot_link_activo, al_terminar=self._on_robot_cmd_done, maxsize=100, timeout=8)
         self.robot_queue_running = False
-        self.robot_sequences = {}  # {name: [list of commands]} - acceso O(1)
-        self.robot_executing = False
+        self.robot_metricas = metricas.metricas_global()  # latencias de órdenes y duración de programas
+        self.robot_sequences = robot_sequences  # {name: [list of commands]}, cargadas bajo demanda
         
         # Control avanzado de ejes y grabación
         self.axis_sequence_recording = False
@@ -121,8 +146,7 @@ class IntegratedApp:
         self.client_thread = None
 
         # Robot serial stream visibility
-        self.robot_stream_polling = False  # UI-driven polling to display all incoming data
-        self.robot_active_read = False     # True while a blocking command read is in progress
+        self.robot_stream_polling = False  # el hilo lector del enlace muestra todo lo recibido
         self.robot_ok_event = threading.Event()  # Señal para 'ok' recibido
         self.client_connected = False
 
@@ -137,8 +161,8 @@ class IntegratedApp:
         self._last_free_pallet = None
 
         self._build_ui()
-        # Inicia loop de lectura de la cinta
-        self.root.after(CINTA_READ_INTERVAL_MS, self._read_cinta_loop)
+        # Inicia loop que muestra los eventos de la cinta
+        self.root.after(CINTA_UI_INTERVAL_MS, self._cinta_ui_pump)
         self.root.after(200, self._serial_poll_loop)
         self.root.after(300, self._net_ui_pump)
 
@@ -478,22 +502,20 @@ class IntegratedApp:
             self._net_broadcast_plc('deliver', estacion, pallet)
         
         # Enviar comando al PLC si está conectado
-        if not self.ser_cinta or not getattr(self.ser_cinta, 'is_open', False):
+        if self.cinta_plc is None or not getattr(self.ser_cinta, 'is_open', False):
             self._append_cinta_log(f'(SIM) Deliver no conectado: {cmd}')
             return
         
-        try:
-            self._last_deliver_station = estacion
-            self._last_deliver_pallet = pallet
-            self._append_cinta_log(f'--> Enviando comando: {cmd}')
-            self.ser_cinta.write((cmd + '\r\n\r\n').encode())
-        except Exception as e:
-            self._append_cinta_log(f'Error enviando deliver: {e}')
+        self._last_deliver_station = estacion
+        self._last_deliver_pallet = pallet
+        self._append_cinta_log(f'--> Enviando comando: {cmd}')
+        fut = self.cinta_plc.send(cmd)
+        fut.add_done_callback(lambda f: self.root.after(0, lambda: self._report_plc_ack(f, 'Deliver')))
 
     def _send_free(self, estacion, pallet, broadcast=True):
         # Sequence Free: liberar estación y confirmar salida pallet
-        cmd_est = {1: "@00WD004800015E*", 2: "@00WD004900015F*", 3: "@00WD0050000157*"}.get(estacion)
-        cmd_pal = {1: "@00WD000900995A*", 2: "@00WD0010009952*", 3: "@00WD0011009953*", 5: "@00WD0013009951*", 6: "@00WD0014009956*"}.get(pallet)
+        cmd_est = hostlink.FREE_ESTACION.get(estacion) if estacion in PANEL_STATIONS else None
+        cmd_pal = hostlink.FREE_PALLET.get(pallet)
         
         if not cmd_est or not cmd_pal:
             self._append_cinta_log('Comando Free inválido')
@@ -510,21 +532,33 @@ class IntegratedApp:
             self._net_broadcast_plc('free', estacion, pallet)
         
         # Enviar comando al PLC si está conectado
-        if not self.ser_cinta or not getattr(self.ser_cinta, 'is_open', False):
+        if self.cinta_plc is None or not getattr(self.ser_cinta, 'is_open', False):
             self._append_cinta_log(f'(SIM) Free no conectado: Est{estacion} Pal{pallet}')
             return
         
-        try:
-            self._last_free_station = estacion
-            self._last_free_pallet = pallet
-            self._append_cinta_log(f'--> Enviando comando Free...')
-            self._append_cinta_log(f'--> {cmd_est}')
-            self.ser_cinta.write((cmd_est + '\r\n\r\n').encode())
-            time.sleep(0.5)
-            self._append_cinta_log(f'--> {cmd_pal}')
-            self.ser_cinta.write((cmd_pal + '\r\n\r\n').encode())
-        except Exception as e:
-            self._append_cinta_log(f'Error enviando free: {e}')
+        self._last_free_station = estacion
+        self._last_free_pallet = pallet
+        self._append_cinta_log(f'--> Enviando comando Free...')
+        # Una transacción: cada trama sale tras el acuse de la anterior (sin bloquear la UI)
+        tx = self.cinta_plc.escribir_dm({hostlink.DM_ESTACION + estacion: 1,
+                                         hostlink.DM_PALLET + pallet: hostlink.LIBERAR_PALLET})
+        for fut in tx.futuros:
+            self._append_cinta_log(f'--> {fut.trama}')
+        tx.add_done_callback(lambda t: self.root.after(0, lambda: self._report_plc_tx(t, 'Free')))
+
+    def _report_plc_ack(self, fut, title):
+        """Muestra el acuse del PLC de una trama y su latencia."""
+        ms = f' · {fut.latencia * 1000:.0f} ms' if fut.latencia is not None else ''
+        result = fut.result()
+        mark = '✗' if plc_link.es_error(result) else '<--'
+        self._append_cinta_log(f'{mark} {title} {fut.trama}: {plc_link.describir(result)}{ms}')
+
+    def _report_plc_tx(self, tx, title):
+        for fut in tx.futuros[1:]:
+            self._append_cinta_log(f'--> {fut.trama}')
+        for fut in tx.futuros:
+            self._report_plc_ack(fut, title)
+        self._append_cinta_log(f'{title}: {len(tx.futuros)} trama(s) en {tx.duracion * 1000:.0f} ms')
 
     def _reset_cinta_ui(self):
         for s in self.station_states.keys():
@@ -583,9 +617,15 @@ class IntegratedApp:
         
         try:
             # Cerrar conexión previa si existe
+            if self.cinta_escaner is not None:
+                self.cinta_escaner.detener()
+                self.cinta_escaner = None
+            if self.cinta_plc is not None:
+                self.cinta_plc.close()
+                self.cinta_plc = None
             if self.ser_cinta is not None:
                 try:
-                    self.ser_cinta.close()
+                    puerto_serie.cerrar(self.ser_cinta)
                 except Exception:
                     pass
             time.sleep(0.2)
@@ -599,6 +639,13 @@ class IntegratedApp:
             self.ser_cinta.timeout = 0.2
             self.ser_cinta.port = port
             self.ser_cinta.open()
+            # El enlace lee el puerto desde su propio hilo; los eventos llegan por cinta_plc.eventos
+            self.cinta_plc = plc_link.PLCLink(self.ser_cinta)
+            if CINTA_SCAN_CICLO:
+                self.cinta_escaner = escaner_plc.EscanerPLC(self.cinta_plc, CINTA_SCAN_PALABRAS, CINTA_SCAN_CICLO)
+                self.cinta_escaner.iniciar()
+                lecturas = ', '.join(f'{a}{d}+{n}' for a, d, n in self.cinta_escaner.lecturas)
+                self._append_cinta_log(f'Escaneo PLC cada {CINTA_SCAN_CICLO} s: {lecturas}')
             
             self._append_cinta_log(f'✓ Cinta conectada en puerto {port} (9600 7E2)')
             try:
@@ -615,8 +662,14 @@ class IntegratedApp:
 
     def _disconnect_cinta(self):
         try:
+            if self.cinta_escaner is not None:
+                self.cinta_escaner.detener()
+                self.cinta_escaner = None
+            if self.cinta_plc is not None:
+                self.cinta_plc.close()
+                self.cinta_plc = None
             if self.ser_cinta and getattr(self.ser_cinta, 'is_open', False):
-                self.ser_cinta.close()
+                puerto_serie.cerrar(self.ser_cinta)
             self._append_cinta_log('Cinta desconectada')
             try:
                 self.label_cinta_status.config(text='Estado: Desconectada')
@@ -625,79 +678,119 @@ class IntegratedApp:
         except Exception:
             pass
 
-    def _read_cinta_loop(self):
-        """Lee periódicamente datos del puerto serial de la cinta y los muestra en el log."""
-        if self.ser_cinta and getattr(self.ser_cinta, 'is_open', False):
+    def _cinta_ui_pump(self):
+        """Muestra los eventos que el hilo de E/S de la cinta dejó en la cola."""
+        plc = self.cinta_plc
+        if plc is not None:
             try:
-                n = self.ser_cinta.in_waiting
-                if n and n > 0:
-                    data = self.ser_cinta.read(n)
-                    try:
-                        texto = data.decode('utf-8', errors='ignore')
-                    except Exception:
-                        texto = repr(data)
-                    self._append_cinta_log('<-- ' + texto.strip())
-                    
-                    # Detectar respuestas del PLC para cambiar color de estaciones
-                    self._detect_pallet_status(texto)
+                while True:
+                    evento = plc.eventos.get_nowait()
+                    if not self._is_scan_frame(evento):
+                        self._append_cinta_log('<-- ' + evento.texto)
+                    self._on_plc_event(evento)
+            except queue.Empty:
+                pass
             except Exception as e:
-                self._append_cinta_log(f'Error leyendo cinta: {e}')
-        # Reprogramar siguiente lectura
-        self.root.after(CINTA_READ_INTERVAL_MS, self._read_cinta_loop)
-
-    def _detect_pallet_status(self, response_text):
-        """
-        Detecta pallet en estación desde mensajes PLC (puede haber múltiples en un buffer).
-        Procesa TODAS las estaciones/pallets encontradas, permitiendo múltiples pasadas.
-        """
-        response = response_text.strip()
-        if not response:
+                self._append_cinta_log(f'Error procesando cinta: {e}')
+            escaner = self.cinta_escaner
+            if escaner is not None:
+                try:
+                    while True:
+                        self._on_plc_change(escaner.cambios.get_nowait())
+                except queue.Empty:
+                    pass
+                except Exception as e:
+                    self._append_cinta_log(f'Error procesando escaneo: {e}')
+                if escaner.ultimo_error != self._cinta_scan_error:
+                    self._cinta_scan_error = escaner.ultimo_error
+                    self._append_cinta_log(f'✗ Escaneo PLC ({escaner.errores} errores): {escaner.ultimo_error}')
+            if not plc.puerto.is_open and plc is self.cinta_plc:
+                self._append_cinta_log('✗ Puerto de la cinta cerrado')
+                self._disconnect_cinta()
+        self.root.after(CINTA_UI_INTERVAL_MS, self._cinta_ui_pump)
+
+    def _on_plc_event(self, evento):
+        """Eventos del receptor Host Link de la cinta (tramas completas y con FCS válido)."""
+        if evento.tipo == hostlink.PASO:
+            self._on_pallet_pass(evento.estacion, evento.pallet, evento.texto, evento.t)
+        elif evento.tipo == hostlink.ERROR and not self._is_scan_frame(evento):
+            self._append_cinta_log(f'✗ PLC: {evento.texto} ({evento.detalle})')
+        elif evento.tipo == hostlink.INVALIDA:
+            self._append_cinta_log(f'⚠ Trama descartada: {evento.texto!r} ({evento.detalle})')
+
+    @staticmethod
+    def _is_scan_frame(evento):
+        """Respuesta a una lectura RD/RR (tráfico del escaneo: no se muestra en el log)."""
+        return (evento.tipo in (hostlink.ACUSE, hostlink.ERROR) and evento.respuesta is not None
+                and evento.respuesta.cabecera in hostlink.LECTURA.values())
+
+    def _on_plc_change(self, cambio):
+        """Palabra del PLC que cambió entre dos lecturas del escaneo cíclico."""
+        antes = '----' if cambio.anterior is None else f'{cambio.anterior:04X}'
+        self._append_cinta_log(f'PLC {cambio.area}{cambio.direccion:04d}: {antes} -> {cambio.valor:04X}')
+
+        for est, (area, direccion, bit) in CINTA_SCAN_SENSORES.items():
+            if est in self.station_states and cambio.clave == (area, direccion):
+                has_pallet = bool((cambio.valor >> bit) & 1)
+                pallet = self.station_pallet_info[est]['pallet']
+                if pallet is None:
+                    pallet = next((p for p, e in self.pallet_destino.items() if e == est), None)
+                self._set_cinta_station(est, has_pallet, pallet)
+        if cambio.area != 'DM':
             return
-        
-        resp_upper = response.upper()
-        resp_lower = response.lower()
 
-        # Buscar TODOS los patrones EX en el texto (puede haber múltiples mensajes)
-        for m_ex in re.finditer(r'EX(\d{4})(\d{4})', resp_upper):
-            try:
-                station_found = int(m_ex.group(1))
-                pallet_found = int(m_ex.group(2))
-            except Exception:
-                continue
+        pallet = cambio.direccion - hostlink.DM_PALLET
+        if pallet in hostlink.PALLETS:
+            if cambio.valor == hostlink.LIBERAR_PALLET:
+                # El pallet salió de su estación
+                self.pallet_destino.pop(pallet, None)
+                for est, info in self.station_pallet_info.items():
+                    if info.get('pallet') == pallet:
+                        self._set_cinta_station(est, False)
+            elif cambio.valor in hostlink.ESTACIONES:
+                self.pallet_destino[pallet] = cambio.valor
+            return
 
-            # Registrar siempre un pass al detectar EX (centraliza UI y limpieza)
-            try:
-                # Debug log: mostrar lo que se parseó
-                self._append_cinta_log(f"DBG: EX match raw='{m_ex.group(0)}' station={station_found} pallet={pallet_found}")
-                self._record_pass_event(station_found, pallet_found)
-            except Exception as e:
-                self._append_cinta_log(f'Error en pass event: {e}')
+        station = cambio.direccion - hostlink.DM_ESTACION
+        if station in self.station_states and cambio.valor == 1:
+            # Estación liberada: el pallet que tenía se va
+            self._set_cinta_station(station, False)
 
-            # Intentar confirmar si hay un comando pendiente para este pallet (no registrar otra vez)
-            if pallet_found is not None:
-                hid = self.deliver_by_pallet.get(pallet_found)
-                if hid:
-                    try:
-                        self._confirm_command(hid)
-                        self.deliver_by_pallet.pop(pallet_found, None)
-                        for s, v in list(self.deliver_last_sent_by_station.items()):
-                            if v == hid:
-                                self.deliver_last_sent_by_station.pop(s, None)
-                    except Exception as e:
-                        self._append_cinta_log(f'Error confirmando pallet {pallet_found}: {e}')
-                    continue
+    def _on_pallet_pass(self, station_found, pallet_found, raw='', t=None):
+        """Pallet detectado en estación (mensaje EX del PLC)."""
+        # Registrar siempre un pass al detectar EX (centraliza UI y limpieza)
+        try:
+            # Debug log: mostrar lo que se parseó
+            self._append_cinta_log(f"DBG: EX match raw='{raw}' station={station_found} pallet={pallet_found}")
+            self._record_pass_event(station_found, pallet_found, t)
+        except Exception as e:
+            self._append_cinta_log(f'Error en pass event: {e}')
 
-            # Si no hay mapeo por pallet, intentar por estación (confirmar sólo)
-            hid = self.deliver_last_sent_by_station.get(station_found)
+        # Intentar confirmar si hay un comando pendiente para este pallet (no registrar otra vez)
+        if pallet_found is not None:
+            hid = self.deliver_by_pallet.get(pallet_found)
             if hid:
                 try:
                     self._confirm_command(hid)
-                    self.deliver_last_sent_by_station.pop(station_found, None)
-                    for p, v in list(self.deliver_by_pallet.items()):
+                    self.deliver_by_pallet.pop(pallet_found, None)
+                    for s, v in list(self.deliver_last_sent_by_station.items()):
                         if v == hid:
-                            self.deliver_by_pallet.pop(p, None)
+                            self.deliver_last_sent_by_station.pop(s, None)
                 except Exception as e:
-                    self._append_cinta_log(f'Error en estación {station_found}: {e}')
+                    self._append_cinta_log(f'Error confirmando pallet {pallet_found}: {e}')
+                return
+
+        # Si no hay mapeo por pallet, intentar por estación (confirmar sólo)
+        hid = self.deliver_last_sent_by_station.get(station_found)
+        if hid:
+            try:
+                self._confirm_command(hid)
+                self.deliver_last_sent_by_station.pop(station_found, None)
+                for p, v in list(self.deliver_by_pallet.items()):
+                    if v == hid:
+                        self.deliver_by_pallet.pop(p, None)
+            except Exception as e:
+                self._append_cinta_log(f'Error en estación {station_found}: {e}')
 
     # ---------------------- Robot panel ----------------------
     def _build_robot_panel(self, parent):
@@ -755,6 +848,7 @@ class IntegratedApp:
         grid2.pack(pady=(0,6))
         actions2 = [
             ('AUTO', lambda: self._robot_send_cmd('AUTO')),
+            ('Abortar (A)', self._robot_abort),
         ]
         for i,(t,cmd) in enumerate(actions2):
             ttk.Button(grid2, text=t, command=cmd).grid(row=0, column=i, padx=4, pady=4)
@@ -801,6 +895,23 @@ class IntegratedApp:
         ttk.Button(seq_mid, text='Ejecutar', command=self._run_sequence).pack(side=tk.LEFT, padx=2)
         ttk.Button(seq_mid, text='Ver', command=self._view_sequence).pack(side=tk.LEFT, padx=2)
         ttk.Button(seq_mid, text='Borrar', command=self._delete_sequence).pack(side=tk.LEFT, padx=2)
+        ttk.Button(seq_mid, text='Importar .seq', command=self._import_sequence).pack(side=tk.LEFT, padx=2)
+
+        # Métricas de tiempos (lo que más pesa en el ciclo, arriba)
+        met_frame = ttk.LabelFrame(left, text='Métricas de tiempos (s)', padding=4)
+        met_frame.pack(fill=tk.X, pady=(6,4))
+        cols = ('nombre', 'n', 'p50', 'p95', 'p99', 'total')
+        self.robot_metrics_tree = ttk.Treeview(met_frame, columns=cols, show='headings', height=5)
+        for c in cols:
+            self.robot_metrics_tree.heading(c, text=c)
+            self.robot_metrics_tree.column(c, width=110 if c == 'nombre' else 55, anchor='center')
+        self.robot_metrics_tree.pack(fill=tk.X)
+        met_btns = ttk.Frame(met_frame)
+        met_btns.pack(fill=tk.X, pady=(4,0))
+        ttk.Button(met_btns, text='Exportar CSV', command=lambda: self._export_robot_metrics('csv')).pack(side=tk.LEFT, padx=2)
+        ttk.Button(met_btns, text='Exportar JSON', command=lambda: self._export_robot_metrics('json')).pack(side=tk.LEFT, padx=2)
+        ttk.Button(met_btns, text='Limpiar', command=self.robot_metricas.limpiar).pack(side=tk.LEFT, padx=2)
+        self.root.after(1000, self._refresh_robot_metrics)
 
         # Cámara ubicada a la derecha del panel de robot
         self._build_camera_panel(right, title='Cámara / Detección')
@@ -808,6 +919,35 @@ class IntegratedApp:
         # Refrescar puertos al iniciar
         self._refresh_robot_ports()
 
+    def _refresh_robot_metrics(self):
+        """Vuelca el resumen de métricas en la tabla del panel (cada segundo)."""
+        try:
+            tree = self.robot_metrics_tree
+            tree.delete(*tree.get_children())
+            for fila in self.robot_metricas.resumen():
+                nombre = fila['nombre'] if fila['tipo'] == metricas.ORDEN else f"{fila['tipo']} {fila['nombre']}"
+                n = f"{fila['n']}" + (f" ({fila['fallos']}✗)" if fila['fallos'] else '')
+                tree.insert('', 'end', values=(nombre, n, f"{fila['p50']:.3f}", f"{fila['p95']:.3f}",
+                                               f"{fila['p99']:.3f}", f"{fila['total_s']:.1f}"))
+        except tk.TclError:
+            return  # ventana cerrada
+        self.root.after(1000, self._refresh_robot_metrics)
+
+    def _export_robot_metrics(self, formato):
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=f'.{formato}',
+            filetypes=[(formato.upper(), f'*.{formato}'), ('All Files', '*.*')])
+        if not filepath:
+            return
+        try:
+            if formato == 'csv':
+                self.robot_metricas.exportar_csv(filepath)
+            else:
+                self.robot_metricas.exportar_json(filepath)
+            self._append_robot_log(f'📊 Métricas exportadas: {filepath}')
+        except Exception as e:
+            messagebox.showerror('Métricas', f'No se pudieron exportar: {e}')
+
     def _refresh_robot_ports(self):
         """Actualiza la lista de puertos COM disponibles para el robot."""
         try:
@@ -844,21 +984,18 @@ class IntegratedApp:
         try:
             if self.ser_robot is not None:
                 try:
-                    self.ser_robot.close()
+                    scorbot_link.cerrar_enlace(self.ser_robot)
+                    puerto_serie.cerrar(self.ser_robot)
                 except Exception:
                     pass
-            time.sleep(0.2)
             
-            self.ser_robot = serial.Serial(port, baudrate=9600, bytesize=serial.EIGHTBITS, 
-                                          parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, 
-                                          timeout=2)
-            self.ser_robot.reset_input_buffer()
-            self.ser_robot.reset_output_buffer()
+            # Mismo objeto y mismo hilo de E/S si otro panel ya tiene abierto el puerto
+            self.ser_robot = puerto_serie.abrir(port, baudrate=9600, bytesize=serial.EIGHTBITS, 
+                                                parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, 
+                                                timeout=2)
             
-            # Iniciar cola de comandos
+            # Activar cola de comandos
             self.robot_queue_running = True
-            self.robot_queue_thread = threading.Thread(target=self._robot_queue_worker, daemon=True)
-            self.robot_queue_thread.start()
             
             self._append_robot_log(f'✓ Robot conectado en {port}')
             self.label_robot_status.config(text='Conectado', foreground='green')
@@ -880,145 +1017,104 @@ class IntegratedApp:
             # Detener lector de stream
             self.robot_stream_polling = False
             self.robot_queue_running = False
+            self.robot_scheduler.cancelar_pendientes()
             if self.ser_robot and getattr(self.ser_robot, 'is_open', False):
                 try:
-                    self._robot_send_cmd('COFF', wait=False)
-                    time.sleep(0.3)
+                    self._robot_send_cmd('COFF', timeout=2)
                 except Exception:
                     pass
-                self.ser_robot.close()
+                scorbot_link.cerrar_enlace(self.ser_robot)
+                puerto_serie.cerrar(self.ser_robot)
             self._append_robot_log('Robot desconectado')
             self.label_robot_status.config(text='Desconectado', foreground='red')
         except Exception:
             pass
 
+    def _robot_link(self):
+        """Enlace ACL del puerto del robot; su hilo lector es el único que lee el puerto."""
+        return scorbot_link.enlace(self.ser_robot, on_line=self._on_robot_line)
+
+    def _on_robot_line(self, line):
+        # Llamado desde el hilo lector del enlace
+        if 'ok' in line.lower():
+            self.robot_ok_event.set()
+        if self.robot_stream_polling:
+            self.root.after(0, lambda l=line: self._append_robot_log(f'← {l}'))
+
     def _robot_send_cmd(self, cmd, wait=True, timeout=10):
-        """Envía comando ACL al robot con manejo robusto y NO bloqueante. O(1) para envío."""
+        """Envía comando ACL al robot; con wait espera su terminador ('Done.', '>' o error)."""
         if not self.ser_robot or not getattr(self.ser_robot,'is_open',False):
             self.root.after(0, lambda: self._append_robot_log('⚠ Robot no conectado'))
             return False
         
         try:
             cmd_clean = cmd.strip().upper()
-            
-            # Envío O(1) - no bloqueante
-            try:
-                self.ser_robot.reset_input_buffer()
-            except:
-                pass
-            
-            payload = (cmd_clean + '\r').encode('ascii', errors='ignore')
-            self.ser_robot.write(payload)
-            self.ser_robot.flush()
+            fut = self._robot_link().send(cmd_clean, timeout)
+            fut.add_done_callback(self._registrar_orden)
             self.root.after(0, lambda c=cmd_clean: self._append_robot_log(f'→ {c}'))
             
             if not wait:
                 return True
             
-            # Lectura con polling eficiente - timeout reducido
-            start_time = time.time()
-            response = ''
-            check_interval = 0.02  # 20ms entre checks - más responsive
-            # Bloqueo la lectura periódica mientras espero respuesta
-            self.robot_active_read = True
-            try:
-                while (time.time() - start_time) < timeout:
-                    try:
-                        waiting = self.ser_robot.in_waiting
-                        if waiting > 0:
-                            chunk = self.ser_robot.read(waiting).decode('ascii', errors='ignore')
-                            response += chunk
-                            
-                            # Detección rápida de respuesta completa - O(n) donde n es tamaño respuesta
-                            if 'Done.' in response or 'Error' in response or '>' in response:
-                                break
-                    except:
-                        break
-                    
-                    time.sleep(check_interval)
-            finally:
-                self.robot_active_read = False
-            
-            response = response.strip()
-            
-            # Validación O(n) donde n es tamaño de respuesta (pequeño)
-            if 'Done.' in response:
-                self.root.after(0, lambda r=response: self._append_robot_log(f'✓ OK: {r}'))
-                return True
-            elif 'Error' in response:
-                self.root.after(0, lambda r=response: self._append_robot_log(f'✗ ERROR: {r}'))
-                return False
-            elif response:
-                self.root.after(0, lambda r=response: self._append_robot_log(f'← {r}'))
-                return True
-            else:
+            result = fut.result()
+            response = scorbot_link.texto_respuesta(fut)
+            if result == scorbot_link.TIMEOUT:
                 self.root.after(0, lambda: self._append_robot_log('⚠ Sin respuesta (timeout)'))
                 return False
+            elif scorbot_link.es_error(result):
+                self.root.after(0, lambda r=response: self._append_robot_log(f'✗ ERROR: {r}'))
+                return False
+            elif result == scorbot_link.DONE:
+                self.root.after(0, lambda r=response: self._append_robot_log(f'✓ OK: {r}'))
+            return True
                 
         except Exception as e:
             self.root.after(0, lambda ex=e: self._append_robot_log(f'✗ Excepción: {ex}'))
             return False
 
     def _robot_start_stream_reader(self):
-        # Inicia un lector basado en after() que muestra todo lo recibido en la terminal
-        def _tick():
-            if not self.robot_stream_polling:
-                return
-            try:
-                if self.ser_robot and getattr(self.ser_robot, 'is_open', False) and not self.robot_active_read:
-                    waiting = self.ser_robot.in_waiting
-                    if waiting and waiting > 0:
-                        data = self.ser_robot.read(waiting).decode('ascii', errors='ignore')
-                        if data:
-                            # Mostrar exactamente lo recibido
-                            self._append_robot_log(f'← {data.strip()}')
-                            try:
-                                if 'ok' in data.lower():
-                                    self.robot_ok_event.set()
-                            except Exception:
-                                pass
-            except Exception:
-                # Silencioso para no saturar; se puede loguear si es necesario
-                pass
-            finally:
-                # Reprogramar próximo tick
-                self.root.after(60, _tick)
-        # Primera ejecución
-        self.root.after(60, _tick)
-    
-    def _robot_queue_worker(self):
-        """Worker thread optimizado - procesa comandos O(1) sin bloquear UI."""
-        while self.robot_queue_running:
-            try:
-                # Get con timeout - O(1) operación
-                cmd = self.robot_command_queue.get(timeout=0.05)
-                if cmd:
-                    self.robot_executing = True
-                    # Ejecutar comando (puede tardar pero no bloquea UI)
-                    success = self._robot_send_cmd(cmd, wait=True, timeout=8)
-                    self.robot_executing = False
-                    
-                    # Pequeña pausa entre comandos para estabilidad
-                    if success:
-                        time.sleep(0.1)
-            except queue.Empty:
-                continue
-            except Exception as e:
-                self.root.after(0, lambda ex=e: self._append_robot_log(f'⚠ Error en cola: {ex}'))
-                self.robot_executing = False
-                time.sleep(0.1)
+        # El hilo lector del enlace muestra todo lo recibido en la terminal (ver _on_robot_line)
+        try:
+            self._robot_link()
+        except Exception as e:
+            self._append_robot_log(f'⚠ No se pudo iniciar el lector: {e}')
     
-    def _robot_queue_cmd(self, cmd):
-        """Agrega comando a la cola - Operación O(1) garantizada."""
+    def _robot_link_activo(self):
+        """Enlace del robot para el planificador (None si no hay conexión)."""
+        if not self.ser_robot or not getattr(self.ser_robot, 'is_open', False):
+            return None
+        return self._robot_link()
+
+    def _registrar_orden(self, fut):
+        # Callback de los Future de órdenes: latencia envío -> terminador
+        result = fut.result()
+        if result != scorbot_link.CANCELADO:
+            self.robot_metricas.registrar_orden(fut, ok=not scorbot_link.es_error(result))
+
+    def _on_robot_cmd_done(self, fut):
+        # Llamado desde el hilo de E/S al terminar cada orden de la cola
+        self._registrar_orden(fut)
+        result = fut.result()
+        ms = f'{fut.servicio * 1000:.0f} ms' if fut.servicio is not None else '-'
+        espera = f'{fut.espera * 1000:.0f} ms' if fut.espera is not None else '-'
+        if result == scorbot_link.CANCELADO:
+            msg = f'⊘ Cancelado: {fut.linea}'
+        elif scorbot_link.es_error(result):
+            msg = f'✗ {fut.linea}: {result} ({ms})'
+        else:
+            msg = f'✓ {fut.linea} · {ms} (en cola {espera})'
+        self.root.after(0, lambda m=msg: self._append_robot_log(m))
+
+    def _robot_queue_cmd(self, cmd, prioridad=scorbot_link.PRIORIDAD_NORMAL):
+        """Agrega comando a la cola; devuelve su Future (o False si no se pudo encolar)."""
         if not self.robot_queue_running:
             self._append_robot_log('⚠ Cola de comandos no activa')
             return False
         
         try:
-            # put() es O(1) en Queue
-            self.robot_command_queue.put_nowait(cmd)
+            fut = self.robot_scheduler.encolar(cmd.strip().upper(), prioridad)
             self._append_robot_log(f'⏱ En cola: {cmd}')
-            return True
+            return fut
         except queue.Full:
             self._append_robot_log('⚠ Cola llena - espere')
             return False
@@ -1026,6 +1122,28 @@ class IntegratedApp:
             self._append_robot_log(f'⚠ Error agregando a cola: {e}')
             return False
 
+    def _robot_queue_batch(self, cmds, on_done=None):
+        """Encola una secuencia completa; on_done(lote) se llama en la UI cuando termina."""
+        if not self.robot_queue_running:
+            self._append_robot_log('⚠ Cola de comandos no activa')
+            return None
+        try:
+            lote = self.robot_scheduler.encolar_lote([c.strip().upper() for c in cmds])
+        except queue.Full:
+            self._append_robot_log('⚠ Cola llena - espere')
+            return None
+        if on_done:
+            lote.add_done_callback(lambda l: self.root.after(0, lambda: on_done(l)))
+        return lote
+
+    def _robot_abort(self):
+        """ABORT salta la cola: se escribe en el acto y descarta lo pendiente."""
+        if not self.robot_queue_running:
+            self._append_robot_log('⚠ Robot no conectado')
+            return
+        self.robot_scheduler.encolar('A', scorbot_link.PRIORIDAD_URGENTE)
+        self._append_robot_log('⛔ Abortar enviado (cola vaciada)')
+
     def _robot_cmd_home(self): self._robot_queue_cmd('HOME')
     def _robot_cmd_ready(self): self._robot_queue_cmd('READY')
     def _robot_cmd_coff(self): self._robot_queue_cmd('COFF')
@@ -1043,22 +1161,32 @@ class IntegratedApp:
         if not self.ser_robot or not getattr(self.ser_robot, 'is_open', False):
             self._append_robot_log('⚠ Robot no conectado')
             return
+        nombre_seq = '→'.join(p.upper() for p in programs)
+        t_seq = time.perf_counter()
         try:
             self._append_robot_log(f"=== INICIANDO SECUENCIA: {' → '.join(programs)} ===")
             for i, prog in enumerate(programs, 1):
                 self.robot_ok_event.clear()
                 cmd = f"RUN {prog.upper()}"
+                t_prog = time.perf_counter()
                 sent = self._robot_send_cmd(cmd, wait=True, timeout=15)
                 if not sent:
                     self._append_robot_log(f'✗ Falló envío/resp de {cmd}')
+                    self.robot_metricas.registrar(metricas.PROGRAMA, prog.upper(), 0.0, ok=False)
+                    self.robot_metricas.registrar(metricas.SECUENCIA, nombre_seq, 0.0, ok=False)
                     return
                 self._append_robot_log('… Esperando ok …')
                 ok = self.robot_ok_event.wait(timeout=ok_timeout)
+                # Duración del programa: del RUN al 'ok' que imprime al terminar
+                self.robot_metricas.registrar(metricas.PROGRAMA, prog.upper(),
+                                              time.perf_counter() - t_prog, ok=ok)
                 if not ok:
                     self._append_robot_log('✗ Timeout esperando ok')
+                    self.robot_metricas.registrar(metricas.SECUENCIA, nombre_seq, 0.0, ok=False)
                     return
                 self._append_robot_log('✓ ok recibido')
                 time.sleep(0.3)
+            self.robot_metricas.registrar(metricas.SECUENCIA, nombre_seq, time.perf_counter() - t_seq)
             self._append_robot_log('=== SECUENCIA COMPLETADA ===')
         except Exception as e:
             self._append_robot_log(f'✗ Excepción en secuencia: {e}')
@@ -1145,7 +1273,8 @@ class IntegratedApp:
             messagebox.showwarning('Secuencias', 'Ingresa un comando en "Comando/Posición"')
             return
         
-        self.robot_sequences[seq_name].append(cmd.upper())
+        # Se reasigna para que la biblioteca guarde la versión nueva
+        self.robot_sequences[seq_name] = self.robot_sequences[seq_name] + [cmd.upper()]
         self._append_robot_log(f'➕ Agregado a "{seq_name}": {cmd}')
         self.entry_robot_cmd.delete(0, tk.END)
     
@@ -1163,20 +1292,37 @@ class IntegratedApp:
         
         self._append_robot_log(f'▶ Ejecutando secuencia "{name}" ({len(seq)} comandos)')
         
-        # Agregar todos los comandos a la cola - O(n) donde n = número de comandos
-        # Pero cada put es O(1), así que complejidad total es O(n)
-        count = 0
-        for cmd in seq:
-            if self._robot_queue_cmd(cmd):
-                count += 1
-            else:
-                break
-        
-        if count == len(seq):
-            self._append_robot_log(f'✓ {count} comandos en cola para "{name}"')
+        # Toda la secuencia entra como un lote; se informa cuando termina el último paso
+        seq = optimizar_secuencia(seq)
+        lote = self._robot_queue_batch(seq, lambda l: self._report_batch(l, f'Secuencia "{name}"', self._append_robot_log))
+        if lote is not None:
+            self._append_robot_log(f'✓ {len(seq)} comandos en cola para "{name}"')
+
+    def _report_batch(self, lote, title, log):
+        results = lote.result()
+        failed = next((i for i, r in enumerate(results) if scorbot_link.es_error(r)), None)
+        if failed is None:
+            log(f'✓ {title} completada: {len(results)} pasos en {lote.duracion:.2f} s')
         else:
-            self._append_robot_log(f'⚠ Solo {count}/{len(seq)} comandos encolados')
+            log(f'✗ {title} detenida en el paso {failed + 1}/{len(results)} '
+                f'({lote.futuros[failed].linea}: {results[failed]})')
     
+    def _import_sequence(self):
+        filepath = filedialog.askopenfilename(
+            filetypes=[("Sequence Files", "*.seq"), ("Text Files", "*.txt"), ("All Files", "*.*")])
+        if not filepath:
+            return
+        try:
+            seq = [c.upper() for c in leer_seq(filepath)]
+        except Exception as e:
+            messagebox.showerror('Secuencias', f'No se pudo leer {filepath}:\n{e}')
+            return
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        self.robot_sequences[name] = seq
+        self.combo_sequences['values'] = list(self.robot_sequences.keys())
+        self.combo_sequences.set(name)
+        self._append_robot_log(f'📂 Secuencia "{name}" importada ({len(seq)} comandos)')
+
     def _view_sequence(self):
         name = (self.combo_sequences.get() or '').strip()
         if not name or name not in self.robot_sequences:
@@ -1218,8 +1364,20 @@ class IntegratedApp:
         mid = ttk.Frame(frame)
         mid.pack(fill=tk.X, pady=6)
         ttk.Button(mid, text='Seleccionar Imagen', command=self._select_laser_image).pack(side=tk.LEFT, padx=6)
-        ttk.Button(mid, text='Generar G-code (sim)', command=self._generate_gcode_sim).pack(side=tk.LEFT, padx=6)
-        ttk.Button(mid, text='Iniciar Grabado (sim)', command=self._start_laser_sim).pack(side=tk.LEFT, padx=6)
+        ttk.Button(mid, text='Generar G-code', command=self._generate_gcode_sim).pack(side=tk.LEFT, padx=6)
+        ttk.Button(mid, text='Iniciar Grabado', command=self._start_laser_sim).pack(side=tk.LEFT, padx=6)
+
+        # Grabado real en hilo propio (si ArucoProyectoBloqueo está disponible)
+        self.laser_runner = None
+        if ArucoProyectoBloqueo is not None:
+            self.laser_runner = ArucoProyectoBloqueo.LaserJobRunner(self.root, self._on_laser_event)
+        job = ttk.Frame(frame)
+        job.pack(fill=tk.X, pady=(0, 6))
+        ttk.Button(job, text='Pausa', command=lambda: self.laser_runner and self.laser_runner.pause()).pack(side=tk.LEFT, padx=6)
+        ttk.Button(job, text='Reanudar', command=lambda: self.laser_runner and self.laser_runner.resume()).pack(side=tk.LEFT, padx=6)
+        ttk.Button(job, text='Cancelar', command=lambda: self.laser_runner and self.laser_runner.cancel()).pack(side=tk.LEFT, padx=6)
+        self.laser_progress = tk.StringVar(value='Sin trabajo')
+        ttk.Label(job, textvariable=self.laser_progress).pack(side=tk.LEFT, padx=12)
 
         # Offset / posiciones del láser
         pos_frame = ttk.Frame(frame)
@@ -1272,6 +1430,8 @@ class IntegratedApp:
     def _disconnect_laser(self):
         try:
             if self.ser_laser and self.ser_laser.is_open:
+                if self.laser_runner:
+                    self.laser_runner.cancel(todos=True)
                 self.ser_laser.close()
             self._append_laser_log('Laser desconectado')
         except Exception:
@@ -1287,11 +1447,57 @@ class IntegratedApp:
         if not self.laser_image_path:
             messagebox.showwarning('Laser','Selecciona una imagen primero')
             return
-        # If project provides generate_gcode_text we could use it — here we simulate
-        self._append_laser_log('G-code generado (simulado)')
+        if ArucoProyectoBloqueo is None:
+            self._append_laser_log('G-code generado (simulado)')
+            return
+        path = self.laser_image_path
+        self._append_laser_log('Generando G-code...')
+
+        def worker():
+            try:
+                gcode = cache_global().obtener(ArucoProyectoBloqueo.generate_gcode_text,
+                                               image_path=path, **LASER_GCODE_PARAMS)
+                n = ArucoProyectoBloqueo.contar_lineas_gcode(gcode)
+                self.root.after(0, self._append_laser_log, f'G-code listo: {n} líneas')
+            except Exception as e:
+                self.root.after(0, self._append_laser_log, f'Error generando G-code: {e}')
+
+        threading.Thread(target=worker, daemon=True).start()
 
     def _start_laser_sim(self):
-        self._append_laser_log('Grabado iniciado (SIM) — no enviar comandos reales')
+        if self.laser_runner is None or not (self.ser_laser and getattr(self.ser_laser, 'is_open', False)):
+            self._append_laser_log('Grabado iniciado (SIM) — no enviar comandos reales')
+            return
+        if not self.laser_image_path:
+            messagebox.showwarning('Laser', 'Selecciona una imagen primero')
+            return
+        path = self.laser_image_path
+        self.laser_runner.submit(
+            self.ser_laser,
+            lambda: ArucoProyectoBloqueo.gcode_trabajo(image_path=path, **LASER_GCODE_PARAMS),
+            nombre=os.path.basename(path))
+        self._append_laser_log(f'Grabado en cola: {os.path.basename(path)}')
+
+    def _on_laser_event(self, ev):
+        tipo = ev['tipo']
+        if tipo == 'progreso':
+            eta = f" · ETA {ev['eta']:.0f} s" if ev.get('eta') is not None else ''
+            self.laser_progress.set(f"{ev['enviadas']}/{ev['total'] or '?'} líneas{eta}")
+            return
+        if tipo == 'log':
+            self._append_laser_log(ev['mensaje'])
+            return
+        mensajes = {
+            'inicio': f"Grabado iniciado: {ev['nombre']}",
+            'pausa': 'Grabado en pausa (feed-hold)',
+            'reanudar': 'Grabado reanudado',
+            'fin': 'Grabado finalizado',
+            'cancelado': 'Grabado cancelado (soft-reset)',
+            'error': f"Error en el grabado {ev.get('mensaje') or ''}",
+        }
+        self._append_laser_log(mensajes.get(tipo, tipo))
+        if tipo in ('fin', 'cancelado', 'error'):
+            self.laser_progress.set('Sin trabajo')
 
     def _append_laser_log(self, msg):
         ts = time.strftime('%H:%M:%S')
@@ -1939,17 +2145,12 @@ class IntegratedApp:
                 pass
             
             # Conectar al robot en COM6
-            self.ser_robot = serial.Serial(port, baudrate=9600, bytesize=serial.EIGHTBITS, 
-                                          parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, 
-                                          timeout=2)
-            self.ser_robot.reset_input_buffer()
-            self.ser_robot.reset_output_buffer()
+            self.ser_robot = puerto_serie.abrir(port, baudrate=9600, bytesize=serial.EIGHTBITS, 
+                                                parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, 
+                                                timeout=2)
             
-            # Iniciar cola de comandos si no está corriendo
-            if not self.robot_queue_running:
-                self.robot_queue_running = True
-                self.robot_queue_thread = threading.Thread(target=self._robot_queue_worker, daemon=True)
-                self.robot_queue_thread.start()
+            # Activar cola de comandos
+            self.robot_queue_running = True
             
             # Actualizar UI
             self.lbl_qc_robot_status.config(text='Conectado', foreground='green')
@@ -1975,14 +2176,15 @@ class IntegratedApp:
         """Desconecta el robot."""
         try:
             self.robot_queue_running = False
+            self.robot_scheduler.cancelar_pendientes()
             
             if self.ser_robot and getattr(self.ser_robot, 'is_open', False):
                 try:
-                    self._qc_send_command('COFF')
-                    time.sleep(0.3)
+                    self._robot_link().send('COFF', timeout=2).result()
                 except Exception:
                     pass
-                self.ser_robot.close()
+                scorbot_link.cerrar_enlace(self.ser_robot)
+                puerto_serie.cerrar(self.ser_robot)
             
             # Actualizar UI
             self.lbl_qc_robot_status.config(text='Desconectado', foreground='red')
@@ -2005,7 +2207,15 @@ class IntegratedApp:
         
         # Ejecutar el programa enviando el comando RUN
         command = f'RUN {program_name}'
-        self._qc_send_command(command)
+        self.robot_ok_event.clear()
+        t0 = time.perf_counter()
+        if self._qc_send_command(command):
+            threading.Thread(target=self._qc_measure_program, args=(program_name, t0), daemon=True).start()
+    
+    def _qc_measure_program(self, program_name, t0, timeout=180):
+        """Duración de un programa QC: del RUN al 'ok' que imprime al terminar."""
+        ok = self.robot_ok_event.wait(timeout)
+        self.robot_metricas.registrar(metricas.PROGRAMA, program_name.upper(), time.perf_counter() - t0, ok=ok)
     
     def _qc_send_command(self, command):
         """Envía un comando al robot."""
@@ -2015,20 +2225,16 @@ class IntegratedApp:
         
         try:
             cmd_clean = command.strip().upper()
-            payload = (cmd_clean + '\r').encode('ascii', errors='ignore')
-            
-            self.ser_robot.write(payload)
-            self.ser_robot.flush()
-            
+            fut = self._robot_link().send(cmd_clean)
+            fut.add_done_callback(self._registrar_orden)
             self._qc_append_log(f'→ Enviado: {cmd_clean}')
             
-            # Esperar respuesta breve
-            time.sleep(0.1)
-            waiting = self.ser_robot.in_waiting
-            if waiting > 0:
-                response = self.ser_robot.read(waiting).decode('ascii', errors='ignore')
-                self._qc_append_log(f'← Respuesta: {response.strip()}')
-            
+            # La respuesta se muestra cuando llega, sin bloquear la interfaz
+            def _respuesta(f):
+                response = scorbot_link.texto_respuesta(f)
+                if response:
+                    self.root.after(0, lambda r=response: self._qc_append_log(f'← Respuesta: {r}'))
+            fut.add_done_callback(_respuesta)
             return True
             
         except Exception as e:
@@ -2159,6 +2365,13 @@ class IntegratedApp:
                                        command=self._save_axis_sequence, state="disabled")
         self.btn_axis_save.pack(side=tk.LEFT, padx=2, fill=tk.X, expand=True)
         
+        ttk.Button(frame_secuencias, text="📂 Cargar .seq",
+                   command=self._load_axis_sequence).pack(fill=tk.X, pady=(0, 5))
+        
+        # Ejecutar como programa guardado en el controlador (un solo RUN)
+        ttk.Button(frame_secuencias, text="⚡ Ejecutar como programa ACL",
+                   command=self._run_axis_sequence_as_program).pack(fill=tk.X, pady=(0, 5))
+        
         # Instrucciones
         instr = """Instrucciones:
 1. Conecte el robot en la pestaña Robot & Laser
@@ -2195,9 +2408,9 @@ class IntegratedApp:
         joint_num = ejes[eje]
         command = f"MJ {joint_num} {value}"
         
-        # Grabar si está en modo grabación
+        # Grabar si está en modo grabación (fusionado con el MJ anterior del mismo eje)
         if self.axis_sequence_recording:
-            self.axis_recorded_sequence.append(command)
+            agregar_paso(self.axis_recorded_sequence, command)
             self._update_axis_sequence_display()
         
         # Enviar comando
@@ -2253,12 +2466,38 @@ class IntegratedApp:
             messagebox.showerror("Error", "Debe conectar el robot primero")
             return
         
-        self._append_adv_robot_log(f"=== EJECUTANDO SECUENCIA ({len(self.axis_recorded_sequence)} pasos) ===")
-        for i, cmd in enumerate(self.axis_recorded_sequence, 1):
-            self._robot_queue_cmd(cmd)
-            self._append_adv_robot_log(f"Paso {i}/{len(self.axis_recorded_sequence)}: {cmd}")
-        self._append_adv_robot_log("=== SECUENCIA EN COLA ===")
+        pasos = optimizar_secuencia(self.axis_recorded_sequence)
+        self._append_adv_robot_log(f"=== EJECUTANDO SECUENCIA ({len(pasos)} pasos) ===")
+        lote = self._robot_queue_batch(pasos,
+                                       lambda l: self._report_batch(l, "Secuencia de ejes", self._append_adv_robot_log))
+        if lote is not None:
+            for i, cmd in enumerate(pasos, 1):
+                self._append_adv_robot_log(f"Paso {i}/{len(pasos)}: {cmd}")
+            self._append_adv_robot_log("=== SECUENCIA EN COLA ===")
     
+    def _run_axis_sequence_as_program(self):
+        """Compila la secuencia grabada a un programa ACL, lo sube si cambió y lo ejecuta con RUN."""
+        if not self.axis_recorded_sequence:
+            messagebox.showwarning("Advertencia", "No hay secuencia grabada")
+            return
+        if not self.ser_robot or not self.ser_robot.is_open:
+            messagebox.showerror("Error", "Debe conectar el robot primero")
+            return
+        pasos = list(self.axis_recorded_sequence)
+        threading.Thread(target=self._program_worker, args=(ROBOT_SEQ_PROGRAM, pasos), daemon=True).start()
+
+    def _program_worker(self, nombre, pasos):
+        log = lambda m: self.root.after(0, lambda: self._append_adv_robot_log(m))
+        try:
+            t0 = time.time()
+            # Mientras se edita y corre el programa no sale ninguna otra orden de la cola
+            with self.robot_scheduler.exclusivo(timeout=30):
+                r = ejecutar_en_controlador(self._robot_link(), nombre, pasos, log=log)
+            estado = "subido y ejecutado" if r["subido"] else "ejecutado (sin subir)"
+            log(f"=== PROGRAMA {r['programa']} {estado}: {r['pasos']} pasos en {time.time() - t0:.2f} s ===")
+        except Exception as e:
+            log(f"✗ Programa {nombre}: {e}")
+
     def _clear_axis_sequence(self):
         """Limpia la secuencia grabada."""
         if self.axis_recorded_sequence:
@@ -2281,14 +2520,33 @@ class IntegratedApp:
         )
         if filepath:
             try:
-                with open(filepath, "w") as f:
-                    for cmd in self.axis_recorded_sequence:
-                        f.write(cmd + "\n")
+                escribir_seq(filepath, self.axis_recorded_sequence)
+                # También en la biblioteca, con el nombre del archivo
+                name = os.path.splitext(os.path.basename(filepath))[0]
+                self.robot_sequences[name] = list(self.axis_recorded_sequence)
+                self.combo_sequences['values'] = list(self.robot_sequences.keys())
                 messagebox.showinfo("Éxito", f"Secuencia guardada en {filepath}")
                 self._append_adv_robot_log(f"Secuencia guardada: {filepath}")
             except Exception as e:
                 messagebox.showerror("Error", f"Error al guardar: {e}")
     
+    def _load_axis_sequence(self):
+        """Carga un archivo .seq como secuencia grabada."""
+        filepath = filedialog.askopenfilename(
+            filetypes=[("Sequence Files", "*.seq"), ("Text Files", "*.txt"), ("All Files", "*.*")])
+        if not filepath:
+            return
+        try:
+            self.axis_recorded_sequence = optimizar_secuencia(leer_seq(filepath))
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al cargar: {e}")
+            return
+        self._update_axis_sequence_display()
+        state = "normal" if self.axis_recorded_sequence else "disabled"
+        self.btn_axis_execute.config(state=state)
+        self.btn_axis_save.config(state=state)
+        self._append_adv_robot_log(f"Secuencia cargada: {filepath} ({len(self.axis_recorded_sequence)} pasos)")
+    
     def _update_axis_sequence_display(self):
         """Actualiza la visualización de la secuencia."""
         self.text_axis_sequence.config(state="normal")
@@ -2379,12 +2637,13 @@ class IntegratedApp:
         self._append_cinta_log(f'CMD: {typ} {pallet}→{station} (id={hid})')
         return hid
 
-    def _record_pass_event(self, station, pallet_id):
+    def _record_pass_event(self, station, pallet_id, t=None):
         """Registra un evento PASS (pallet detectado en estación) en el tracking.
-        También actualiza la posición actual del pallet y limpia estaciones anteriores."""
+        También actualiza la posición actual del pallet y limpia estaciones anteriores.
+        t es la hora a la que llegó el aviso del PLC (por defecto, ahora)."""
         self.pass_counter += 1
         pid = self.pass_counter
-        t = time.time()
+        t = time.time() if t is None else t
         entry = {'id': pid, 'pallet': pallet_id, 'station': station, 'time': t}
         self.pass_history.append(entry)
         self.pass_history_map[pid] = entry
@@ -2624,10 +2883,14 @@ class IntegratedApp:
             self.cam_running = False
             self.cinta_reading = False
 
+            if getattr(self, 'cinta_escaner', None) is not None:
+                self.cinta_escaner.detener()
+            if getattr(self, 'cinta_plc', None) is not None:
+                self.cinta_plc.close()
             if hasattr(self, 'ser_cinta') and self.ser_cinta and getattr(self.ser_cinta, 'is_open', False):
-                self.ser_cinta.close()
+                puerto_serie.cerrar(self.ser_cinta)
             if hasattr(self, 'ser_robot') and self.ser_robot and getattr(self.ser_robot, 'is_open', False):
-                self.ser_robot.close()
+                puerto_serie.cerrar(self.ser_robot)
             if hasattr(self, 'ser_laser') and self.ser_laser and getattr(self.ser_laser, 'is_open', False):
                 self.ser_laser.close()
 
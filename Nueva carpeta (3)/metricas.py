@@ -0,0 +1,160 @@
+"""
+Métricas de tiempos del robot: latencia envío -> respuesta de cada orden y
+duración de cada programa ACL.
+
+Cada clave ('orden', 'MOVE') / ('programa', 'ARU2') guarda sus últimas
+muestras en un Anillo (array de doubles de tamaño fijo, sin crecer con las
+horas de uso) y de ahí salen p50 / p95 / p99. resumen() ordena por tiempo
+total, así lo primero que se ve es lo que más pesa en el ciclo.
+"""
+import csv
+import json
+import math
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+MUESTRAS = 512   # muestras que se guardan por clave
+
+ORDEN = "orden"
+PROGRAMA = "programa"
+SECUENCIA = "secuencia"
+
+
+def clave_orden(cmd: str) -> str:
+    """Nombre con el que se agrupa una orden: el verbo, salvo 'RUN <programa>'"""
+    partes = (cmd or "").strip().upper().split()
+    if not partes:
+        return ""
+    if partes[0] == "RUN" and len(partes) > 1:
+        return f"RUN {partes[1]}"
+    return partes[0]
+
+
+def percentil(ordenados, p: float) -> float:
+    """Percentil p (0-100) de una lista ya ordenada, por rango más cercano"""
+    if not ordenados:
+        return 0.0
+    k = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[k]
+
+
+class Anillo:
+    def __init__(self, capacidad: int = MUESTRAS):
+        self._datos = array("d", bytes(8 * capacidad))
+        self._pos = 0
+        self.n = 0          # muestras guardadas (como mucho capacidad)
+        self.total = 0      # muestras registradas desde el principio
+        self.suma = 0.0     # suma de todas las registradas
+        self.maximo = 0.0
+
+    def agregar(self, valor: float):
+        self._datos[self._pos] = valor
+        self._pos = (self._pos + 1) % len(self._datos)
+        self.n = min(self.n + 1, len(self._datos))
+        self.total += 1
+        self.suma += valor
+        self.maximo = max(self.maximo, valor)
+
+    def valores(self) -> list:
+        """Muestras guardadas, de la más vieja a la más nueva"""
+        if self.n < len(self._datos):
+            return list(self._datos[:self.n])
+        return list(self._datos[self._pos:]) + list(self._datos[:self._pos])
+
+    def percentiles(self, *ps) -> list:
+        ordenados = sorted(self.valores())
+        return [percentil(ordenados, p) for p in ps]
+
+
+class Metricas:
+    def __init__(self, capacidad: int = MUESTRAS):
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._anillos = {}     # (tipo, nombre) -> Anillo
+        self._fallos = {}      # (tipo, nombre) -> nº de errores / timeouts
+        self.desde = time.time()
+
+    def registrar(self, tipo: str, nombre: str, segundos: float, ok: bool = True):
+        """Añade una muestra (los fallos sólo se cuentan: su tiempo es el timeout)"""
+        clave = (tipo, nombre)
+        with self._lock:
+            if not ok:
+                self._fallos[clave] = self._fallos.get(clave, 0) + 1
+                return
+            anillo = self._anillos.get(clave)
+            if anillo is None:
+                anillo = self._anillos[clave] = Anillo(self.capacidad)
+            anillo.agregar(segundos)
+
+    def registrar_orden(self, fut, ok: bool = True):
+        """Muestra de un Future de ScorbotLink / PlanificadorComandos (t_envio -> t_fin)"""
+        if fut.t_envio is None or fut.t_fin is None:
+            return
+        self.registrar(ORDEN, clave_orden(fut.linea), fut.t_fin - fut.t_envio, ok)
+
+    @contextmanager
+    def medir(self, tipo: str, nombre: str):
+        """Registra lo que tarda el bloque; si lanza excepción cuenta como fallo"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.registrar(tipo, nombre, 0.0, ok=False)
+            raise
+        self.registrar(tipo, nombre, time.perf_counter() - t0)
+
+    def resumen(self) -> list:
+        """[{'tipo', 'nombre', 'n', 'fallos', 'media', 'p50', 'p95', 'p99', 'max', 'total_s'}],
+        de mayor a menor tiempo total"""
+        with self._lock:
+            claves = set(self._anillos) | set(self._fallos)
+            filas = []
+            for clave in claves:
+                anillo = self._anillos.get(clave)
+                fila = {"tipo": clave[0], "nombre": clave[1], "n": 0,
+                        "fallos": self._fallos.get(clave, 0), "media": 0.0, "p50": 0.0,
+                        "p95": 0.0, "p99": 0.0, "max": 0.0, "total_s": 0.0}
+                if anillo is not None and anillo.total:
+                    fila["p50"], fila["p95"], fila["p99"] = anillo.percentiles(50, 95, 99)
+                    fila.update(n=anillo.total, media=anillo.suma / anillo.total,
+                                max=anillo.maximo, total_s=anillo.suma)
+                filas.append(fila)
+        filas.sort(key=lambda f: f["total_s"], reverse=True)
+        return filas
+
+    def limpiar(self):
+        with self._lock:
+            self._anillos.clear()
+            self._fallos.clear()
+            self.desde = time.time()
+
+    def exportar_csv(self, ruta: str):
+        filas = self.resumen()
+        campos = ["tipo", "nombre", "n", "fallos", "media", "p50", "p95", "p99", "max", "total_s"]
+        with open(ruta, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=campos)
+            w.writeheader()
+            for fila in filas:
+                w.writerow({k: (round(v, 4) if isinstance(v, float) else v) for k, v in fila.items()})
+
+    def exportar_json(self, ruta: str):
+        """Resumen más las muestras guardadas de cada clave"""
+        with self._lock:
+            muestras = {f"{t}:{n}": a.valores() for (t, n), a in self._anillos.items()}
+        datos = {"desde": self.desde, "hasta": time.time(),
+                 "resumen": self.resumen(), "muestras": muestras}
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+
+
+_metricas = None
+
+
+def metricas_global() -> Metricas:
+    """Métricas compartidas por la aplicación"""
+    global _metricas
+    if _metricas is None:
+        _metricas = Metricas()
+    return _metricas
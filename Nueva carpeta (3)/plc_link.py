@@ -0,0 +1,192 @@
+"""
+Enlace con el PLC de la cinta (Omron Host Link) por puerto serie.
+
+Host Link es half-duplex: el PLC contesta cada trama antes de aceptar la
+siguiente. PLCLink escribe las tramas de una en una desde una cola y
+resuelve el Future de cada una con la Respuesta del PLC (código de fin '00'
+si fue bien), así las secuencias esperan el acuse en vez de dormir un
+tiempo fijo. Cada Future lleva .latencia (envío -> acuse, en s).
+
+escribir_dm() es una transacción: junta en una sola trama WD las palabras
+de direcciones seguidas y encadena el resto, parando si el PLC devuelve un
+código de error.
+
+El puerto lo lleva un PuertoCompartido (puerto_serie): su hilo de E/S se
+queda bloqueado en read() y pasa cada lectura, en cuanto llega, a
+alimentar(), que la entrega a un hostlink.ReceptorHostLink (self.receptor).
+Los acuses y errores resuelven la trama en curso; todos los eventos (pasos
+de pallet, tramas inválidas...) van además a la cola self.eventos, que la
+interfaz vacía desde su bucle. Así el periodo con que la interfaz mira la
+cola no retrasa la detección: cada evento lleva la hora a la que llegó (.t).
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import hostlink
+import puerto_serie
+
+PLC_TIMEOUT = 1.0    # s de espera por el acuse de una trama
+EVENTOS_MAX = 500    # eventos que se guardan si nadie vacía la cola
+
+TIMEOUT = "timeout"
+CANCELADO = "cancelado"
+
+class PLCLink:
+    def __init__(self, ser, timeout: float = PLC_TIMEOUT):
+        self.ser = ser
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._cola = deque()        # Future aún no escritos
+        self._actual = None         # Future escrito y sin acuse
+        self.receptor = hostlink.ReceptorHostLink()
+        self.receptor.suscribir(lambda ev: self._acuse(ev.respuesta),
+                                tipos=(hostlink.ACUSE, hostlink.ERROR))
+        self.eventos = queue.Queue(maxsize=EVENTOS_MAX)
+        self.receptor.suscribir(self._evento)
+        self.puerto = puerto_serie.compartir(ser)
+        self._baja = self.puerto.suscribir_crudo(self.alimentar)
+
+    # ---------------- Envío ----------------
+    def send(self, trama: str, timeout: float = None) -> Future:
+        """Encola la trama; el Future se resuelve con la Respuesta, 'timeout' o '*** error'"""
+        fut = Future()
+        fut.trama = trama
+        fut.timeout = self.timeout if timeout is None else timeout
+        fut.t_envio = fut.t_fin = fut.latencia = None
+        with self._lock:
+            self._cola.append(fut)
+            if self._actual is None:
+                self._escribir_siguiente()
+        return fut
+
+    def escribir_dm(self, palabras: dict, timeout: float = None, parar_en_error: bool = True) -> Future:
+        """Escribe {dirección DM: valor} con el mínimo de tramas; el Future de la
+        transacción se resuelve con la lista de resultados (.futuros, .duracion).
+        Un código de fin de error cancela lo que falta; un timeout no (el PLC
+        puede no haber contestado y haber escrito igual)."""
+        tramas = [hostlink.wd(inicio, valores) for inicio, valores in hostlink.bloques(palabras)]
+        tx = Future()
+        tx.t_inicio = time.monotonic()
+        tx.duracion = None
+        tx.futuros = []
+        restantes = deque(tramas)
+
+        def siguiente(anterior=None):
+            if anterior is not None:
+                r = anterior.result()
+                if isinstance(r, hostlink.Respuesta):
+                    if parar_en_error and not r.ok:
+                        restantes.clear()
+                elif r != TIMEOUT:
+                    restantes.clear()   # cancelado o error de escritura
+            if not restantes:
+                tx.duracion = time.monotonic() - tx.t_inicio
+                tx.set_result([f.result() for f in tx.futuros])
+                return
+            fut = self.send(restantes.popleft(), timeout)
+            tx.futuros.append(fut)
+            fut.add_done_callback(siguiente)
+
+        siguiente()
+        return tx
+
+    def cancelar_pendientes(self):
+        with self._lock:
+            pendientes = list(self._cola)
+            self._cola.clear()
+        for fut in pendientes:
+            self._resolver(fut, CANCELADO)
+
+    @property
+    def pendientes(self) -> int:
+        with self._lock:
+            return len(self._cola) + (self._actual is not None)
+
+    def write(self, data: bytes) -> Future:
+        """Escritura directa (órdenes crudas), sin esperar acuse"""
+        return self.puerto.escribir(data)
+
+    def close(self):
+        """Deja de escuchar el puerto y cancela lo pendiente (el puerto lo cierra quien lo abrió)"""
+        self._baja()
+        self.cancelar_pendientes()
+        with self._lock:
+            fut = self._actual
+        if fut is not None:
+            self._terminar(fut, CANCELADO)
+
+    # ---------------- Recepción ----------------
+    def alimentar(self, texto: str) -> list:
+        """Texto leído del puerto (desde el hilo de E/S); devuelve los EventoPLC de las tramas completas"""
+        return self.receptor.alimentar(texto)
+
+    # ---------------- Interno ----------------
+    def _escribir_siguiente(self):
+        # Con self._lock tomado
+        while self._cola:
+            fut = self._cola.popleft()
+            if fut.done():
+                continue
+            self._actual = fut
+            fut.t_envio = time.monotonic()
+            fut.temporizador = threading.Timer(fut.timeout, self._expirar, args=(fut,))
+            fut.temporizador.daemon = True
+            fut.temporizador.start()
+            escrito = self.puerto.escribir((fut.trama + hostlink.FIN_ENVIO).encode("ascii"))
+            escrito.add_done_callback(lambda w, f=fut: self._escrito(f, w))
+            return
+
+    def _escrito(self, fut: Future, escrito: Future):
+        if escrito.exception() is not None:
+            self._terminar(fut, f"*** {escrito.exception()}")
+
+    def _terminar(self, fut: Future, resultado):
+        with self._lock:
+            if self._actual is not fut:
+                return
+            self._actual = None
+            fut.temporizador.cancel()
+            self._escribir_siguiente()
+        self._resolver(fut, resultado)
+
+    def _acuse(self, respuesta):
+        with self._lock:
+            fut = self._actual
+        if fut is not None and respuesta.cabecera == fut.trama[3:5]:
+            self._terminar(fut, respuesta)
+
+    def _evento(self, evento):
+        while True:
+            try:
+                self.eventos.put_nowait(evento)
+                return
+            except queue.Full:
+                try:
+                    self.eventos.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _expirar(self, fut: Future):
+        self._terminar(fut, TIMEOUT)
+
+    def _resolver(self, fut: Future, resultado):
+        if fut.done():
+            return
+        fut.t_fin = time.monotonic()
+        if fut.t_envio is not None:
+            fut.latencia = fut.t_fin - fut.t_envio
+        fut.set_result(resultado)
+
+
+def es_error(resultado) -> bool:
+    """True si el resultado de una trama no es un acuse con código de fin '00'"""
+    return not (isinstance(resultado, hostlink.Respuesta) and resultado.ok)
+
+
+def describir(resultado) -> str:
+    if isinstance(resultado, hostlink.Respuesta):
+        return "OK" if resultado.ok else f"error {resultado.codigo_fin} ({resultado.descripcion})"
+    return str(resultado)
@@ -0,0 +1,264 @@
+"""
+Puertos serie compartidos: un único dueño por puerto físico.
+
+abrir() devuelve siempre el mismo objeto serial para el mismo puerto dentro
+del proceso (con un contador de usuarios), así dos paneles que apuntan al
+mismo COM no se pisan al abrirlo; si el segundo pide otro formato de trama
+(baudios, bits, paridad...) se lanza ErrorConfiguracion en vez de darle un
+puerto que no habla como espera. Lo que cuelga del puerto (enlaces) se
+registra con al_cerrar() y se da de baja cuando cierra el último usuario.
+compartir() pone encima de ese objeto un
+PuertoCompartido: un solo hilo de E/S que
+  - escribe lo que los clientes dejan en su cola de salida (escribir())
+  - lee todo lo que llega y lo corta en tramas con la función de entramado
+  - entrega cada trama a todos los suscriptores (suscribir()) y el texto
+    tal como llega a los suscriptores en crudo (suscribir_crudo())
+Nadie más lee el puerto, así no se pierden respuestas ni se lee desde el hilo
+de la interfaz.
+"""
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import serial
+except Exception:
+    serial = None
+
+LECTURA_MAX = 0.1  # s máximos de bloqueo en read() (también periodo de los tick)
+
+# Ajustes que tienen que coincidir entre dos abrir() del mismo puerto
+CONFIG_TRAMA = ("baudrate", "bytesize", "parity", "stopbits", "xonxoff", "rtscts", "dsrdtr")
+
+_RE_FIN_LINEA = re.compile(r"\r\n|\r|\n")
+
+
+class ErrorConfiguracion(ValueError):
+    pass
+
+
+def tramas_lineas(buffer: str):
+    """Entramado por líneas (CR, LF o CRLF): devuelve (tramas, resto sin terminar)"""
+    *lineas, resto = _RE_FIN_LINEA.split(buffer)
+    return [l for l in lineas if l.strip()], resto
+
+
+class PuertoCompartido:
+    def __init__(self, ser, entramado=tramas_lineas, codificacion: str = "ascii"):
+        self.ser = ser
+        self.entramado = entramado
+        self.codificacion = codificacion
+        self._salida = queue.Queue()    # (bytes, Future)
+        self._subs = []                 # (función(trama), tick() o None)
+        self._crudos = []               # funciones(texto) con cada lectura sin entramar
+        self._subs_lock = threading.Lock()
+        self._resto = ""
+        self._parar = threading.Event()
+        # El hilo tiene que volver del read() para escribir y hacer los tick
+        timeout = getattr(ser, "timeout", None)
+        if timeout is None or timeout > LECTURA_MAX:
+            try:
+                ser.timeout = LECTURA_MAX
+            except Exception:
+                pass
+        self._hilo = threading.Thread(target=self._bucle, daemon=True,
+                                      name=f"puerto-{getattr(ser, 'port', '?')}")
+        self._hilo.start()
+
+    @property
+    def is_open(self) -> bool:
+        return getattr(self.ser, "is_open", False) and not self._parar.is_set()
+
+    def suscribir(self, fn, tick=None):
+        """fn(trama) por cada trama recibida; tick() en cada vuelta del hilo. Devuelve la baja."""
+        sub = (fn, tick)
+        with self._subs_lock:
+            self._subs.append(sub)
+
+        def baja():
+            with self._subs_lock:
+                if sub in self._subs:
+                    self._subs.remove(sub)
+        return baja
+
+    def suscribir_crudo(self, fn):
+        """fn(texto) con cada lectura tal como llega (las tramas pueden venir partidas). Devuelve la baja."""
+        with self._subs_lock:
+            self._crudos.append(fn)
+
+        def baja():
+            with self._subs_lock:
+                if fn in self._crudos:
+                    self._crudos.remove(fn)
+        return baja
+
+    def escribir(self, datos: bytes) -> Future:
+        """Encola datos para el hilo de E/S; el Future se resuelve al escribirlos"""
+        fut = Future()
+        self._salida.put((datos, fut))
+        # Despierta al hilo si está bloqueado en read()
+        cancelar = getattr(self.ser, "cancel_read", None)
+        if cancelar is not None:
+            try:
+                cancelar()
+            except Exception:
+                pass
+        return fut
+
+    def detener(self):
+        self._parar.set()
+
+    # ---------------- Hilo de E/S ----------------
+    def _vaciar_salida(self):
+        while True:
+            try:
+                datos, fut = self._salida.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                n = self.ser.write(datos)
+                try:
+                    self.ser.flush()
+                except Exception:
+                    pass
+                fut.set_result(n)
+            except Exception as e:
+                fut.set_exception(e)
+
+    def _entregar(self, texto: str):
+        with self._subs_lock:
+            crudos = list(self._crudos)
+        for fn in crudos:
+            try:
+                fn(texto)
+            except Exception:
+                pass
+        self._resto += texto
+        tramas, self._resto = self.entramado(self._resto)
+        if not tramas:
+            return
+        with self._subs_lock:
+            subs = list(self._subs)
+        for trama in tramas:
+            for fn, _ in subs:
+                try:
+                    fn(trama)
+                except Exception:
+                    pass
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            self._vaciar_salida()
+            try:
+                raw = self.ser.read(max(1, getattr(self.ser, "in_waiting", 0) or 0))
+            except Exception:
+                if not getattr(self.ser, "is_open", True):
+                    break  # puerto cerrado
+                time.sleep(LECTURA_MAX)
+                continue
+            if raw:
+                self._entregar(raw.decode(self.codificacion, errors="ignore"))
+            with self._subs_lock:
+                ticks = [t for _, t in self._subs if t is not None]
+            for tick in ticks:
+                try:
+                    tick()
+                except Exception:
+                    pass
+        self._parar.set()
+        # Lo que quedó en cola ya no se va a escribir
+        while True:
+            try:
+                _, fut = self._salida.get_nowait()
+            except queue.Empty:
+                break
+            fut.set_exception(OSError("puerto cerrado"))
+        with self._subs_lock:
+            subs = list(self._subs)
+        for _, tick in subs:
+            if tick is not None:
+                try:
+                    tick()
+                except Exception:
+                    pass
+
+
+_lock = threading.Lock()
+_abiertos = {}      # nombre del puerto -> [serial, usuarios]
+_compartidos = {}   # id(serial) -> PuertoCompartido
+_al_cerrar = {}     # id(serial) -> [funciones] a llamar cuando cierre el último usuario
+
+
+def abrir(port: str, **config):
+    """Abre el puerto o, si ya está abierto en este proceso, devuelve el mismo objeto"""
+    if serial is None:
+        raise RuntimeError("Falta pyserial. Instala con: pip install pyserial")
+    with _lock:
+        entrada = _abiertos.get(port)
+        if entrada and getattr(entrada[0], "is_open", False):
+            distintos = [f"{k}={config[k]!r} (abierto con {getattr(entrada[0], k, None)!r})"
+                         for k in CONFIG_TRAMA
+                         if k in config and getattr(entrada[0], k, config[k]) != config[k]]
+            if distintos:
+                raise ErrorConfiguracion(f"{port} ya está abierto con otra configuración: "
+                                         + ", ".join(distintos))
+            entrada[1] += 1
+            return entrada[0]
+        ser = serial.Serial(port=port, **config)
+        try:
+            ser.reset_input_buffer(); ser.reset_output_buffer()
+        except Exception:
+            pass
+        _abiertos[port] = [ser, 1]
+        return ser
+
+
+def compartir(ser, entramado=tramas_lineas) -> PuertoCompartido:
+    """Dueño (hilo de E/S) de ser; se crea la primera vez que alguien lo pide"""
+    if isinstance(ser, PuertoCompartido):
+        return ser
+    with _lock:
+        puerto = _compartidos.get(id(ser))
+        if puerto is None or puerto.ser is not ser or not puerto.is_open:
+            puerto = _compartidos[id(ser)] = PuertoCompartido(ser, entramado)
+        return puerto
+
+
+def usuarios(ser) -> int:
+    """Cuántos abrir() de ser siguen sin su cerrar() (0 si no se abrió con abrir())"""
+    with _lock:
+        entrada = _abiertos.get(getattr(ser, "port", None))
+        return entrada[1] if entrada and entrada[0] is ser else 0
+
+
+def al_cerrar(ser, fn):
+    """Llama fn() cuando el último usuario cierre ser (p. ej. para dar de baja su enlace)"""
+    with _lock:
+        _al_cerrar.setdefault(id(ser), []).append(fn)
+
+
+def cerrar(ser):
+    """Deja de usar ser; el último usuario detiene su hilo de E/S y cierra el puerto"""
+    with _lock:
+        port = getattr(ser, "port", None)
+        entrada = _abiertos.get(port)
+        if entrada and entrada[0] is ser:
+            entrada[1] -= 1
+            if entrada[1] > 0:
+                return
+            del _abiertos[port]
+        puerto = _compartidos.pop(id(ser), None)
+        funciones = _al_cerrar.pop(id(ser), [])
+    for fn in funciones:
+        try:
+            fn()
+        except Exception:
+            pass
+    if puerto is not None:
+        puerto.detener()
+    try:
+        ser.close()
+    except Exception:
+        pass
@@ -0,0 +1,453 @@
+"""
+Enlace con el controlador del Scorbot-ER V Plus (ACL) por puerto serie.
+
+Se suscribe al PuertoCompartido del puerto (puerto_serie), cuyo único hilo
+de E/S lee y escribe; el enlace separa lo que envía el controlador:
+  - eco de la orden               -> se descarta
+  - 'Done.' / prompt '>'          -> terminan la orden en curso
+  - '*** ...' / líneas con Error  -> terminan la orden en curso con ese texto
+  - preguntas ('(Y/N)', '12:?')   -> terminan la orden con la pregunta (editor ACL)
+  - cualquier otra línea           -> se adjunta a la orden en curso (o va a la
+                                      cola de eventos si no hay ninguna)
+
+send() devuelve un concurrent.futures.Future que se resuelve en cuanto llega
+el terminador, en lugar de esperar un tiempo fijo. Las órdenes se escriben de
+una en una (ACL no admite escribir por delante del prompt); si una no termina
+en su timeout se resuelve con 'timeout' y sale la siguiente.
+
+PlanificadorComandos pone delante del enlace una cola con prioridades y
+mide la latencia de cada orden.
+"""
+import heapq
+import itertools
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+import puerto_serie
+
+CMD_TIMEOUT = 10.0   # s de espera por defecto para una orden
+EVENTOS_MAX = 500    # líneas sin orden asociada que se guardan
+
+DONE = "Done."
+PROMPT = ">"
+TIMEOUT = "timeout"
+RESET = "reset"
+CANCELADO = "cancelado"
+ENVIADO = "enviado"
+
+PRIORIDAD_URGENTE = 0    # se escribe en el acto (abortar)
+PRIORIDAD_ALTA = 5
+PRIORIDAD_NORMAL = 10
+
+# Preguntas que deja el controlador sin salto de línea (confirmaciones y el editor EDIT)
+_RE_PREGUNTA = re.compile(r"(\(Y/N\)\s*\??|^\s*\d+\s*:\s*\?)\s*$", re.IGNORECASE)
+
+
+def es_pregunta(respuesta: str) -> bool:
+    """True si el controlador espera una contestación ('(Y/N)?') o una línea del editor"""
+    return bool(_RE_PREGUNTA.search(respuesta or ""))
+
+
+def es_error(respuesta: str) -> bool:
+    """True si la respuesta de una orden indica fallo (error ACL, timeout o puerto cerrado)"""
+    r = (respuesta or "").strip()
+    return r.startswith("***") or "ERROR" in r.upper() or r in (TIMEOUT, RESET, CANCELADO)
+
+
+def tramas_acl(buffer: str):
+    """Entramado ACL: líneas más el prompt '>', que llega sin salto de línea"""
+    tramas, resto = puerto_serie.tramas_lineas(buffer)
+    if resto.strip() == PROMPT or es_pregunta(resto):
+        tramas.append(resto.strip())
+        resto = ""
+    return tramas, resto
+
+
+def texto_respuesta(fut: Future) -> str:
+    """Salida de la orden más su terminador, en una sola cadena"""
+    partes = list(fut.lineas)
+    if fut.done() and fut.result() != PROMPT:
+        partes.append(fut.result())
+    return "\n".join(partes)
+
+
+class ScorbotLink:
+    def __init__(self, ser, eol: str = "\r", on_line=None):
+        self.ser = ser
+        self.eol = eol
+        self.on_line = on_line          # función(texto) por cada línea recibida, desde el hilo lector
+        self._oyentes = []              # más funciones(texto), ver escuchar()
+        self.eventos = queue.Queue(maxsize=EVENTOS_MAX)
+        self._lock = threading.RLock()
+        self._cola = deque()            # Future aún no escritos
+        self._actual = None             # Future escrito y sin terminar
+        self._prompt_sobrante = False   # tras 'Done.'/error puede llegar un '>' que no es de la siguiente
+        self._parar = threading.Event()
+        self.puerto = puerto_serie.compartir(ser, tramas_acl)
+        self._baja = self.puerto.suscribir(self._procesar, tick=self._revisar_timeout)
+
+    # ---------------- Envío ----------------
+    def send(self, cmd: str, timeout: float = CMD_TIMEOUT) -> Future:
+        """Encola una orden y devuelve el Future de su terminador ('Done.', '>', error o 'timeout')"""
+        fut = Future()
+        fut.linea = cmd.strip()
+        fut.lineas = []
+        fut.timeout = timeout
+        fut.t_envio = fut.t_fin = None
+        if not fut.linea:
+            fut.set_result(PROMPT)
+            return fut
+        with self._lock:
+            self._cola.append(fut)
+            if self._actual is None:
+                self._escribir_siguiente()
+        return fut
+
+    def send_cmd(self, cmd: str, timeout: float = CMD_TIMEOUT) -> str:
+        """Envía y espera el terminador (como mucho timeout segundos)"""
+        return self.send(cmd, timeout).result()
+
+    def write(self, data: bytes) -> Future:
+        """Escritura directa, sin esperar respuesta"""
+        return self.puerto.escribir(data)
+
+    def escuchar(self, fn):
+        """Llama fn(texto) por cada línea recibida; devuelve la función que lo da de baja"""
+        self._oyentes.append(fn)
+        return lambda: fn in self._oyentes and self._oyentes.remove(fn)
+
+    @property
+    def pendientes(self) -> int:
+        with self._lock:
+            return len(self._cola) + (self._actual is not None)
+
+    @property
+    def is_open(self) -> bool:
+        return self.puerto.is_open and not self._parar.is_set()
+
+    def close(self):
+        """Deja de escuchar el puerto (el puerto lo cierra quien lo abrió)"""
+        self._parar.set()
+        self._baja()
+        self._fallar_pendientes(RESET)
+
+    def _escribir_siguiente(self):
+        # Con self._lock tomado
+        while self._cola:
+            fut = self._cola.popleft()
+            if fut.done():
+                continue
+            fut.t_envio = time.monotonic()
+            self._actual = fut
+            escrito = self.puerto.escribir((fut.linea + self.eol).encode("ascii", errors="ignore"))
+            escrito.add_done_callback(lambda w, f=fut: self._escrito(f, w))
+            return
+
+    def _escrito(self, fut: Future, escrito: Future):
+        if escrito.exception() is not None:
+            with self._lock:
+                actual = self._actual is fut
+            if actual:
+                self._terminar(f"*** {escrito.exception()}")
+
+    def _terminar(self, respuesta: str):
+        with self._lock:
+            fut, self._actual = self._actual, None
+            self._prompt_sobrante = respuesta != PROMPT
+            self._escribir_siguiente()
+        if fut is not None and not fut.done():
+            fut.t_fin = time.monotonic()
+            fut.set_result(respuesta)
+
+    def _fallar_pendientes(self, respuesta: str):
+        with self._lock:
+            pendientes = list(self._cola)
+            if self._actual is not None:
+                pendientes.insert(0, self._actual)
+            self._cola.clear()
+            self._actual = None
+        for fut in pendientes:
+            if not fut.done():
+                fut.set_result(respuesta)
+
+    # ---------------- Desde el hilo de E/S del puerto ----------------
+    def _revisar_timeout(self):
+        if not self.puerto.is_open:
+            self._fallar_pendientes(RESET)
+            return
+        with self._lock:
+            fut = self._actual
+        if fut is not None and fut.timeout is not None \
+                and time.monotonic() - fut.t_envio > fut.timeout:
+            self._terminar(TIMEOUT)
+
+    def _prompt(self):
+        with self._lock:
+            sobrante, self._prompt_sobrante = self._prompt_sobrante, False
+            hay_orden = self._actual is not None
+        if hay_orden and not sobrante:
+            self._terminar(PROMPT)
+
+    def _procesar(self, linea: str):
+        linea = linea.strip()
+        if linea == PROMPT:
+            self._prompt()
+            return
+        if linea.startswith(PROMPT):
+            # '>' seguido del eco de la orden siguiente en la misma línea
+            resto = linea.lstrip(PROMPT).strip()
+            self._prompt()
+            linea = resto
+        if not linea:
+            return
+        with self._lock:
+            self._prompt_sobrante = False
+            fut = self._actual
+        if fut is not None and linea.upper() == fut.linea.upper():
+            return  # eco
+        if self.on_line:
+            self.on_line(linea)
+        for fn in list(self._oyentes):
+            try:
+                fn(linea)
+            except Exception:
+                pass
+        if fut is None:
+            self._evento(linea)
+            return
+        if linea == DONE or es_error(linea) or es_pregunta(linea):
+            self._terminar(linea)
+        else:
+            fut.lineas.append(linea)
+
+    def _evento(self, texto: str):
+        while True:
+            try:
+                self.eventos.put_nowait(texto)
+                return
+            except queue.Full:
+                try:
+                    self.eventos.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+class PlanificadorComandos:
+    """Cola con prioridad delante de un ScorbotLink.
+
+    Da las órdenes al enlace de una en una y saca la siguiente desde el
+    callback del Future de la anterior: sin hilo propio ni sondeo. Cada Future
+    devuelto lleva .espera (en cola), .servicio (envío -> terminador) y
+    .latencia (total), en segundos. Las órdenes urgentes (abortar) no esperan
+    al prompt: se escriben en el acto y vacían la cola.
+    """
+
+    def __init__(self, obtener_enlace, al_terminar=None, maxsize: int = 100,
+                 timeout: float = CMD_TIMEOUT):
+        self.obtener_enlace = obtener_enlace  # función() -> ScorbotLink, o None sin conexión
+        self.al_terminar = al_terminar        # función(fut) por cada orden terminada (hilo de E/S)
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._libre = threading.Condition(self._lock)
+        self._cola = []                       # heap de (prioridad, nº, Future)
+        self._orden = itertools.count()
+        self._en_curso = None
+        self._retenido = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cola) + (self._en_curso is not None)
+
+    @property
+    def ocupado(self) -> bool:
+        return len(self) > 0
+
+    def _nuevo(self, cmd: str, prioridad: int, timeout) -> Future:
+        fut = Future()
+        fut.linea = cmd.strip()
+        fut.lineas = []
+        fut.prioridad = prioridad
+        fut.timeout = self.timeout if timeout is None else timeout
+        fut.t_encolado = time.monotonic()
+        fut.t_envio = fut.t_fin = None
+        fut.espera = fut.servicio = fut.latencia = None
+        return fut
+
+    def encolar(self, cmd: str, prioridad: int = PRIORIDAD_NORMAL, timeout: float = None) -> Future:
+        """Future con la respuesta de cmd; lanza queue.Full si la cola está llena"""
+        fut = self._nuevo(cmd, prioridad, timeout)
+        if prioridad <= PRIORIDAD_URGENTE:
+            self._urgente(fut)
+            return fut
+        with self._lock:
+            if len(self._cola) >= self.maxsize:
+                raise queue.Full
+            heapq.heappush(self._cola, (prioridad, next(self._orden), fut))
+        self._despachar()
+        return fut
+
+    def encolar_lote(self, cmds, prioridad: int = PRIORIDAD_NORMAL, timeout: float = None,
+                     parar_en_error: bool = True) -> Future:
+        """Encola todas las órdenes seguidas; el Future del lote se resuelve con la
+        lista de respuestas cuando terminan todas (.futuros, .duracion).
+        Con parar_en_error, un fallo cancela los pasos que quedan."""
+        cmds = [c for c in cmds if c and c.strip()]
+        lote = Future()
+        lote.t_inicio = time.monotonic()
+        lote.duracion = None
+        lote.futuros = [self._nuevo(c, prioridad, timeout) for c in cmds]
+        with self._lock:
+            if len(self._cola) + len(cmds) > self.maxsize:
+                raise queue.Full
+            for fut in lote.futuros:
+                heapq.heappush(self._cola, (prioridad, next(self._orden), fut))
+        restantes = [len(lote.futuros)]
+        lock = threading.Lock()
+
+        def paso(fut):
+            if parar_en_error and es_error(fut.result()):
+                for otro in lote.futuros:
+                    if not otro.done():
+                        self._resolver(otro, CANCELADO)
+            with lock:
+                restantes[0] -= 1
+                ultimo = restantes[0] == 0
+            if ultimo:
+                lote.duracion = time.monotonic() - lote.t_inicio
+                lote.set_result([f.result() for f in lote.futuros])
+
+        if not lote.futuros:
+            lote.duracion = 0.0
+            lote.set_result([])
+        for fut in lote.futuros:
+            fut.add_done_callback(paso)
+        self._despachar()
+        return lote
+
+    @contextmanager
+    def exclusivo(self, timeout: float = None):
+        """Para el despacho mientras dura el bloque, tras terminar la orden en curso
+        (p. ej. para hablar con el editor ACL sin que se cuele otra orden)"""
+        with self._libre:
+            self._retenido += 1
+            if not self._libre.wait_for(lambda: self._en_curso is None, timeout):
+                self._retenido -= 1
+                raise TimeoutError("el robot sigue ocupado con otra orden")
+        try:
+            yield
+        finally:
+            with self._libre:
+                self._retenido -= 1
+            self._despachar()
+
+    def cancelar_pendientes(self):
+        """Resuelve con 'cancelado' todo lo que aún no se envió"""
+        with self._lock:
+            pendientes = [f for _, _, f in self._cola]
+            self._cola.clear()
+        for fut in pendientes:
+            if not fut.done():
+                self._resolver(fut, CANCELADO)
+
+    # ---------------- Interno ----------------
+    def _resolver(self, fut: Future, respuesta: str):
+        if fut.done():
+            return  # ya resuelto (p. ej. cancelado por su lote)
+        fut.t_fin = time.monotonic()
+        fut.latencia = fut.t_fin - fut.t_encolado
+        if fut.t_envio is not None:
+            fut.servicio = fut.t_fin - fut.t_envio
+        try:
+            fut.set_result(respuesta)
+        except Exception:
+            return  # otro hilo lo resolvió a la vez
+        if self.al_terminar:
+            try:
+                self.al_terminar(fut)
+            except Exception:
+                pass
+
+    def _urgente(self, fut: Future):
+        self.cancelar_pendientes()
+        link = self.obtener_enlace()
+        if link is None:
+            self._resolver(fut, "*** Robot no conectado")
+            return
+        fut.t_envio = time.monotonic()
+        fut.espera = 0.0
+        escrito = link.write((fut.linea + link.eol).encode("ascii", errors="ignore"))
+        escrito.add_done_callback(
+            lambda w: self._resolver(fut, ENVIADO if w.exception() is None else f"*** {w.exception()}"))
+
+    def _despachar(self):
+        with self._lock:
+            if self._en_curso is not None or self._retenido:
+                return
+            fut = None
+            while self._cola:
+                _, _, candidato = heapq.heappop(self._cola)
+                if not candidato.done():
+                    fut = candidato
+                    break
+            if fut is None:
+                return
+            self._en_curso = fut
+        fut.t_envio = time.monotonic()
+        fut.espera = fut.t_envio - fut.t_encolado
+        link = self.obtener_enlace()
+        if link is None:
+            self._terminado(fut, None)
+            return
+        enviado = link.send(fut.linea, fut.timeout)
+        enviado.add_done_callback(lambda f, mio=fut: self._terminado(mio, f))
+
+    def _terminado(self, fut: Future, enviado):
+        if enviado is not None:
+            fut.lineas = enviado.lineas
+        with self._libre:
+            if self._en_curso is fut:
+                self._en_curso = None
+            self._libre.notify_all()
+        if not fut.done():
+            self._resolver(fut, enviado.result() if enviado is not None else "*** Robot no conectado")
+        self._despachar()
+
+
+_enlaces = {}
+_enlaces_lock = threading.Lock()
+
+
+def enlace(ser, **kwargs) -> ScorbotLink:
+    """ScorbotLink del puerto (se crea la primera vez; uno por puerto abierto)"""
+    if isinstance(ser, ScorbotLink):
+        return ser
+    with _enlaces_lock:
+        link = _enlaces.get(id(ser))
+        if link is None or link.ser is not ser or not link.is_open:
+            link = _enlaces[id(ser)] = ScorbotLink(ser, **kwargs)
+            puerto_serie.al_cerrar(ser, lambda: _dar_de_baja(ser, link))
+        return link
+
+
+def cerrar_enlace(ser):
+    """Da de baja el enlace de ser, salvo que otro usuario de puerto_serie.abrir()
+    siga con el puerto abierto: entonces el enlace vive hasta el último cerrar()"""
+    if puerto_serie.usuarios(ser) > 1:
+        return
+    with _enlaces_lock:
+        link = _enlaces.get(id(ser))
+    if link is not None:
+        _dar_de_baja(ser, link)
+
+
+def _dar_de_baja(ser, link: ScorbotLink):
+    with _enlaces_lock:
+        if _enlaces.get(id(ser)) is link:
+            del _enlaces[id(ser)]
+    link.close()
@@ -0,0 +1,209 @@
+"""
+Secuencias de órdenes ACL del Scorbot (las que se graban con los botones de ejes).
+
+optimizar_secuencia() fusiona los 'MJ <eje> <incremento>' seguidos sobre el
+mismo eje ('MJ 1 10', 'MJ 1 10', 'MJ 1 -5' -> 'MJ 1 15') y quita los que se
+anulan. Con multi_eje=True, si el controlador acepta varios ejes en una
+misma orden, junta además cada tramo de MJ sobre ejes distintos en un solo
+'MJ 1 15 2 -5'. OPEN, CLOSE, MOVE, etc. cortan siempre el tramo: el orden
+respecto a la pinza no cambia.
+
+compilar_acl() convierte una secuencia en un programa ACL con el hash de su
+contenido en un comentario; ejecutar_en_controlador() lo sube con el editor
+(EDIT ... EXIT) sólo si el controlador no tiene ya esa versión, lo verifica
+con LIST y lo lanza con un único RUN.
+"""
+import hashlib
+import re
+import threading
+
+from scorbot_link import CMD_TIMEOUT, es_error, es_pregunta
+
+# True si el controlador acepta varios ejes en una misma orden MJ
+MJ_MULTI_EJE = False
+
+PROGRAMA_MAX = 5                 # caracteres de un nombre de programa ACL
+MARCA_HASH = "* SEQ "            # comentario con el hash dentro del programa
+FIN_PROGRAMA = "SEQ FIN"         # lo imprime el programa al terminar
+
+_RE_MARCA = re.compile(r"\*\s*SEQ\s+([0-9a-f]+)", re.IGNORECASE)
+_RE_NUM_LINEA = re.compile(r"^\s*\d+\s*:?\s*")
+_RE_MJ = re.compile(r"^\s*MJ((?:\s+\d+\s+[-+]?\d+(?:\.\d+)?)+)\s*$", re.IGNORECASE)
+_RE_PAR = re.compile(r"(\d+)\s+([-+]?\d+(?:\.\d+)?)")
+
+
+def parse_mj(cmd: str):
+    """[(eje, incremento), ...] de una orden MJ, o None si no es un MJ"""
+    m = _RE_MJ.match(cmd or "")
+    if not m:
+        return None
+    return [(int(e), float(v)) for e, v in _RE_PAR.findall(m.group(1))]
+
+
+def formatear_mj(pares) -> str:
+    """'MJ 1 15' / 'MJ 1 15 2 -5' (enteros sin decimales)"""
+    return "MJ " + " ".join(f"{e} {v:g}" for e, v in pares)
+
+
+def agregar_paso(secuencia: list, cmd: str) -> list:
+    """Añade cmd a una secuencia en grabación fusionándolo con el MJ anterior del mismo eje"""
+    nuevo = parse_mj(cmd)
+    previo = parse_mj(secuencia[-1]) if secuencia else None
+    if nuevo and previo and len(nuevo) == len(previo) == 1 and nuevo[0][0] == previo[0][0]:
+        eje = nuevo[0][0]
+        total = previo[0][1] + nuevo[0][1]
+        secuencia.pop()
+        if total:
+            secuencia.append(formatear_mj([(eje, total)]))
+        return secuencia
+    if nuevo is not None and all(v == 0 for _, v in nuevo):
+        return secuencia
+    secuencia.append(formatear_mj(nuevo) if nuevo else cmd)
+    return secuencia
+
+
+def optimizar_secuencia(cmds, multi_eje: bool = None) -> list:
+    """Secuencia equivalente con menos órdenes (ver docstring del módulo)"""
+    if multi_eje is None:
+        multi_eje = MJ_MULTI_EJE
+    salida = []
+    tramo = []  # MJ seguidos: [(eje, incremento), ...] en orden
+
+    def cerrar_tramo():
+        if not tramo:
+            return
+        if multi_eje:
+            # Un solo MJ con el neto de cada eje, en el orden en que aparecen
+            netos = {}
+            for eje, v in tramo:
+                netos[eje] = netos.get(eje, 0.0) + v
+            pares = [(e, v) for e, v in netos.items() if v]
+            if pares:
+                salida.append(formatear_mj(pares))
+        else:
+            # Sólo se fusionan movimientos consecutivos del mismo eje
+            for eje, v in tramo:
+                agregar_paso(salida, formatear_mj([(eje, v)]))
+        tramo.clear()
+
+    for cmd in cmds:
+        cmd = (cmd or "").strip()
+        if not cmd:
+            continue
+        pares = parse_mj(cmd)
+        if pares is None:
+            cerrar_tramo()
+            salida.append(cmd)
+            continue
+        if not multi_eje and len(pares) > 1:
+            # Un MJ de varios ejes ya grabado se mantiene tal cual
+            cerrar_tramo()
+            salida.append(formatear_mj(pares))
+            continue
+        tramo.extend(pares)
+    cerrar_tramo()
+    return salida
+
+
+def leer_seq(ruta: str) -> list:
+    """Pasos de un archivo .seq (una orden por línea; se ignoran vacías y '#')"""
+    with open(ruta, "r", encoding="utf-8", errors="ignore") as f:
+        return [l.strip() for l in f if l.strip() and not l.lstrip().startswith("#")]
+
+
+def escribir_seq(ruta: str, pasos):
+    with open(ruta, "w", encoding="utf-8") as f:
+        for cmd in pasos:
+            f.write(cmd + "\n")
+
+
+# ---------------------------------------------------------------------------
+# Programas ACL en el controlador
+# ---------------------------------------------------------------------------
+def nombre_programa(nombre: str) -> str:
+    """Nombre válido de programa ACL (mayúsculas y dígitos, como mucho 5)"""
+    limpio = re.sub(r"[^A-Z0-9]", "", (nombre or "").upper())
+    return (limpio or "SEQ")[:PROGRAMA_MAX]
+
+
+def compilar_acl(pasos, multi_eje: bool = None):
+    """(líneas del programa, hash) para la secuencia ya optimizada"""
+    cuerpo = [p.upper() for p in optimizar_secuencia(pasos, multi_eje)]
+    h = hashlib.sha256("\n".join(cuerpo).encode()).hexdigest()[:12]
+    return [MARCA_HASH + h, *cuerpo, f'PRINTLN "{FIN_PROGRAMA}"'], h
+
+
+def _listar(link, nombre: str, timeout: float):
+    """Líneas del programa según LIST (sin numerar), o None si no existe"""
+    fut = link.send(f"LIST {nombre}", timeout)
+    if es_error(fut.result()):
+        return None
+    return [_RE_NUM_LINEA.sub("", l).strip() for l in fut.lineas]
+
+
+def hash_en_controlador(link, nombre: str, timeout: float = CMD_TIMEOUT):
+    """Hash de la secuencia que tiene guardada el programa nombre, o None"""
+    lineas = _listar(link, nombre, timeout)
+    for linea in lineas or ():
+        m = _RE_MARCA.search(linea)
+        if m:
+            return m.group(1).lower()
+    return None
+
+
+def _orden(link, cmd: str, timeout: float) -> str:
+    r = link.send(cmd, timeout).result()
+    if es_error(r):
+        raise RuntimeError(f"{cmd}: {r}")
+    return r
+
+
+def subir_programa(link, nombre: str, lineas, timeout: float = CMD_TIMEOUT):
+    """Escribe el programa con el editor ACL y comprueba con LIST que quedó igual"""
+    if _listar(link, nombre, timeout) is not None:
+        if es_pregunta(_orden(link, f"REMOVE {nombre}", timeout)):
+            _orden(link, "Y", timeout)
+    if "Y/N" in _orden(link, f"EDIT {nombre}", timeout).upper():
+        _orden(link, "Y", timeout)  # '¿crearlo?'
+    try:
+        for linea in lineas:
+            _orden(link, linea, timeout)
+    finally:
+        link.send("EXIT", timeout).result()
+    # Verificación: todas las líneas, en orden, en el listado del controlador
+    listado = _listar(link, nombre, timeout) or []
+    i = 0
+    for linea in listado:
+        if i < len(lineas) and linea.upper() == lineas[i].upper():
+            i += 1
+    if i != len(lineas):
+        raise RuntimeError(f"verificación de {nombre} fallida: faltan líneas desde '{lineas[i]}'")
+
+
+def ejecutar_en_controlador(link, nombre: str, pasos, timeout: float = CMD_TIMEOUT,
+                            timeout_programa: float = 300.0, log=None) -> dict:
+    """Sube (si hace falta) y ejecuta la secuencia como programa; bloquea hasta que termina.
+
+    Devuelve {'programa', 'hash', 'subido', 'pasos'}. Lanza RuntimeError o
+    TimeoutError si algo falla.
+    """
+    log = log or (lambda m: None)
+    nombre = nombre_programa(nombre)
+    lineas, h = compilar_acl(pasos)
+    subido = False
+    if hash_en_controlador(link, nombre, timeout) == h:
+        log(f"{nombre}: el controlador ya tiene esta versión ({h})")
+    else:
+        log(f"{nombre}: subiendo {len(lineas)} líneas ({h})")
+        subir_programa(link, nombre, lineas, timeout)
+        subido = True
+
+    fin = threading.Event()
+    baja = link.escuchar(lambda l: FIN_PROGRAMA in l.upper() and fin.set())
+    try:
+        _orden(link, f"RUN {nombre}", timeout)
+        if not fin.wait(timeout_programa):
+            raise TimeoutError(f"{nombre} no terminó en {timeout_programa:.0f} s")
+    finally:
+        baja()
+    return {"programa": nombre, "hash": h, "subido": subido, "pasos": len(lineas) - 2}
@@ -0,0 +1,237 @@
+"""
+GRBL simulado para medir el envío de G-code sin hardware.
+
+GrblSimulado se comporta como un serial.Serial (write / readline / read /
+in_waiting) y modela lo que importa para el streaming:
+  - buffer RX de 127 bytes (los bytes que no caben se pierden y se cuentan)
+  - latencia del enlace serie en cada sentido
+  - planificador de movimientos con N bloques; cada G0/G1 tarda un tiempo fijo
+  - 'ok' en cuanto la línea entra al planificador, 'error:N' en líneas elegidas
+  - órdenes de tiempo real: '?' estado, '!' feed-hold, '~' reanudar, Ctrl-X reset
+
+Ejecutar este archivo compara el protocolo 'sync' con 'char-count'.
+"""
+import threading
+import time
+from collections import deque
+
+RX_BUFFER = 127
+PLANNER_BLOCKS = 15
+REALTIME = {ord("?"), ord("!"), ord("~"), 0x18}
+
+
+class GrblSimulado:
+    def __init__(self, latencia=0.002, tiempo_bloque=0.003, rx_buffer=RX_BUFFER,
+                 planner_blocks=PLANNER_BLOCKS, errores=None, timeout=1.0):
+        self.latencia = latencia              # s por sentido del enlace
+        self.tiempo_bloque = tiempo_bloque    # s que tarda cada movimiento
+        self.rx_buffer = rx_buffer
+        self.planner_blocks = planner_blocks
+        self.errores = dict(errores or {})    # {nº de línea: código de error}
+        self.timeout = timeout
+        self.port = "sim://grbl"
+        self.is_open = True
+
+        self._cond = threading.Condition()
+        self._rx = bytearray()
+        self._llegadas = deque()   # instante en que cada '\n' termina de llegar
+        self._tx = deque()         # (instante de entrega, bytes)
+        self._planner = deque()    # instantes de fin de cada bloque
+        self._fin_planner = 0.0
+        self._t_hold = None        # instante del feed-hold activo
+
+        # Estadísticas
+        self.lineas = 0
+        self.desbordes = 0
+        self.tiempo_sin_bloques = 0.0
+        self.t_inicio = None
+        self.t_fin = None
+
+        self._hilo = threading.Thread(target=self._procesar, daemon=True)
+        self._hilo.start()
+
+    # ------------------------------------------------------------------
+    # Interfaz tipo serial.Serial
+    # ------------------------------------------------------------------
+    def write(self, data: bytes) -> int:
+        with self._cond:
+            ahora = time.perf_counter()
+            for b in data:
+                if b in REALTIME:
+                    self._tiempo_real(b, ahora)
+                    continue
+                if len(self._rx) >= self.rx_buffer:
+                    self.desbordes += 1
+                    continue
+                self._rx.append(b)
+                if b == ord("\n"):
+                    self._llegadas.append(ahora + self.latencia)
+            self._cond.notify_all()
+        return len(data)
+
+    def readline(self) -> bytes:
+        limite = time.perf_counter() + (self.timeout if self.timeout is not None else 1e9)
+        with self._cond:
+            while True:
+                linea = self._sacar_linea()
+                if linea is not None:
+                    return linea
+                ahora = time.perf_counter()
+                if ahora >= limite or not self.is_open:
+                    return b""
+                espera = limite - ahora
+                if self._tx:
+                    espera = min(espera, max(0.0, self._tx[0][0] - ahora))
+                self._cond.wait(espera)
+
+    def read(self, n: int = 1) -> bytes:
+        with self._cond:
+            datos = bytearray()
+            ahora = time.perf_counter()
+            while self._tx and self._tx[0][0] <= ahora and len(datos) < n:
+                datos += self._tx.popleft()[1]
+            return bytes(datos)
+
+    @property
+    def in_waiting(self) -> int:
+        with self._cond:
+            ahora = time.perf_counter()
+            return sum(len(d) for t, d in self._tx if t <= ahora)
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._tx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Simulación
+    # ------------------------------------------------------------------
+    def _responder(self, texto: str, ahora: float):
+        self._tx.append((ahora + self.latencia, (texto + "\r\n").encode()))
+
+    def _sacar_linea(self):
+        ahora = time.perf_counter()
+        if not self._tx or self._tx[0][0] > ahora:
+            return None
+        return self._tx.popleft()[1]
+
+    def _tiempo_real(self, b: int, ahora: float):
+        if b == ord("?"):
+            estado = "Run" if self._planner and self._planner[-1] > ahora else "Idle"
+            if self._t_hold is not None:
+                estado = "Hold:0"
+            libres = self.planner_blocks - len(self._planner)
+            self._responder(f"<{estado}|MPos:0.000,0.000,0.000|Bf:{libres},{self.rx_buffer - len(self._rx)}|FS:0,0>", ahora)
+        elif b == ord("!"):
+            if self._t_hold is None:
+                self._t_hold = ahora
+        elif b == ord("~"):
+            if self._t_hold is not None:
+                # El planificador queda congelado: se desplaza lo que faltaba
+                delta = ahora - self._t_hold
+                self._planner = deque(t + delta for t in self._planner)
+                if self._fin_planner:
+                    self._fin_planner += delta
+                self._t_hold = None
+        elif b == 0x18:
+            en_movimiento = bool(self._planner and self._planner[-1] > ahora)
+            self._rx.clear()
+            self._llegadas.clear()
+            self._planner.clear()
+            self._fin_planner = 0.0
+            self._t_hold = None
+            if en_movimiento:
+                self._responder("ALARM:3", ahora)
+            self._responder("Grbl 1.1h ['$' for help]", ahora)
+
+    def _procesar(self):
+        with self._cond:
+            while self.is_open:
+                if self._t_hold is not None:
+                    self._cond.wait(0.05)
+                    continue
+                ahora = time.perf_counter()
+                while self._planner and self._planner[0] <= ahora:
+                    self._planner.popleft()
+
+                if not self._llegadas:
+                    self._cond.wait(0.05)
+                    continue
+                if self._llegadas[0] > ahora:
+                    self._cond.wait(self._llegadas[0] - ahora)
+                    continue
+
+                fin = self._rx.index(b"\n")
+                linea = self._rx[:fin].decode(errors="ignore").strip().upper()
+                es_movimiento = linea.startswith(("G0", "G1", "G2", "G3"))
+                if es_movimiento and len(self._planner) >= self.planner_blocks:
+                    # Planificador lleno: la línea espera en el buffer RX
+                    self._cond.wait(max(0.0, self._planner[0] - ahora))
+                    continue
+
+                del self._rx[:fin + 1]
+                self._llegadas.popleft()
+                self.lineas += 1
+                if self.t_inicio is None:
+                    self.t_inicio = ahora
+
+                if es_movimiento:
+                    inicio = ahora
+                    if self._fin_planner and self._fin_planner < ahora:
+                        # El planificador se vació: el láser se detiene
+                        self.tiempo_sin_bloques += ahora - self._fin_planner
+                    elif self._fin_planner:
+                        inicio = self._fin_planner
+                    self._fin_planner = inicio + self.tiempo_bloque
+                    self._planner.append(self._fin_planner)
+
+                codigo = self.errores.get(self.lineas)
+                self._responder(f"error:{codigo}" if codigo else "ok", ahora)
+                self.t_fin = max(ahora, self._fin_planner)
+                self._cond.notify_all()
+
+
+def medir(gcode_text: str, protocol: str, **kwargs):
+    """Envía gcode_text a un GrblSimulado y devuelve estadísticas del envío"""
+    from ArucoProyectoBloqueo import stream_to_grbl
+
+    sim = GrblSimulado(**kwargs)
+    t0 = time.perf_counter()
+    resultado = stream_to_grbl(sim, gcode_text, protocol=protocol)
+    enviado = time.perf_counter() - t0
+    sim.close()
+    return {
+        "protocolo": protocol,
+        "resultado": resultado,
+        "lineas": sim.lineas,
+        "segundos": enviado,
+        "lineas_s": sim.lineas / enviado if enviado else 0.0,
+        "planificador_vacio_s": sim.tiempo_sin_bloques,
+        "desbordes": sim.desbordes,
+    }
+
+
+if __name__ == "__main__":
+    import os
+    from ArucoProyectoBloqueo import generate_gcode_text
+
+    imagen = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aruco_DICT_4X4_100_0_200px.png")
+    gcode = generate_gcode_text(image_path=imagen, size_mm=(20, 20), ppmm=5, mode="graysc",
+                                invert=False, gamma_val=0.6, origin_xy=(0.0, 0.0),
+                                f_engrave=1000, f_travel=1000, s_max=600)
+    print(f"G-code de prueba: {len(gcode.splitlines())} líneas")
+    for protocolo in ("sync", "char-count"):
+        r = medir(gcode, protocolo)
+        print(f"{r['protocolo']:>10}: {r['lineas_s']:8.0f} líneas/s  "
+              f"{r['segundos']:6.2f} s  planificador vacío {r['planificador_vacio_s']:5.2f} s  "
+              f"desbordes {r['desbordes']}  resultado {r['resultado']}")
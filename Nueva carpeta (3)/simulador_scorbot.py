@@ -0,0 +1,428 @@
+"""
+Controlador del Scorbot-ER V Plus (ACL) simulado, para medir sin el robot.
+
+ScorbotSimulado se comporta como un serial.Serial (write / read / readline /
+in_waiting / cancel_read) y modela lo que ven los programas:
+  - eco de cada orden y, tras el tiempo que tarda, 'Done.' + prompt '>'
+    (o sólo '>' / 'ok' + '>', según terminador)
+  - tiempo por orden configurable por prefijo ('MJ', 'OPEN', 'HOME', ...)
+  - errores ('*** ...') y órdenes que nunca contestan, para probar timeouts
+  - editor de programas (EDIT / EXIT / LIST / REMOVE) y RUN, que devuelve el
+    prompt en el acto y ejecuta el programa aparte (PRINTLN imprime)
+  - 'A' (abortar) detiene el programa en curso
+
+abrir_pty() lo publica en un pseudo-terminal (/dev/pts/N) para abrirlo como
+un puerto real con pyserial. El 'loop://' de pyserial sólo devuelve lo que
+se escribe, así que para pruebas en proceso se usa el objeto directamente
+(tiene la misma interfaz).
+
+Ejecutar este archivo mide órdenes/s y tiempo de una secuencia grabada en
+cada camino de envío de la aplicación.
+"""
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+
+DONE = "Done."
+PROMPT = ">"
+
+# s que tarda cada orden según su prefijo (el resto usa tiempo_orden)
+TIEMPOS = {"MJ": 0.02, "MOVE": 0.05, "OPEN": 0.03, "CLOSE": 0.03, "HOME": 0.2}
+
+_RE_PRINTLN = re.compile(r'^PRINTLN\s+"(.*)"\s*$', re.IGNORECASE)
+
+
+class ScorbotSimulado:
+    def __init__(self, latencia=0.001, tiempo_orden=0.01, tiempos=None, eco=True,
+                 terminador=DONE, errores=None, sin_respuesta=(), programas=None, timeout=1.0):
+        self.latencia = latencia              # s por sentido del enlace
+        self.tiempo_orden = tiempo_orden      # s por orden sin prefijo en tiempos
+        self.tiempos = dict(TIEMPOS if tiempos is None else tiempos)
+        self.eco = eco
+        self.terminador = terminador          # 'Done.', '>' u 'ok'
+        self.errores = dict(errores or {})    # {prefijo: texto de error}
+        self.sin_respuesta = tuple(p.upper() for p in sin_respuesta)
+        self.programas = {n.upper(): list(l) for n, l in (programas or {}).items()}
+        self.timeout = timeout
+        self.port = "sim://scorbot"
+        self.is_open = True
+
+        self._cond = threading.Condition()
+        self._rx = bytearray()
+        self._tx = []                  # heap de (instante de entrega, nº, bytes)
+        self._n = itertools.count()
+        self._cancelar = False
+        self._editando = None          # programa abierto con EDIT
+        self._confirmar = None         # función que ejecuta un 'Y'
+        self._abortar = threading.Event()
+
+        # Estadísticas
+        self.recibidas = []            # órdenes en el orden en que llegaron
+        self.ocupado = 0.0             # s ejecutando órdenes
+        self.t_inicio = None
+        self.t_fin = None
+
+        self._hilo = threading.Thread(target=self._procesar, daemon=True)
+        self._hilo.start()
+
+    # ------------------------------------------------------------------
+    # Interfaz tipo serial.Serial
+    # ------------------------------------------------------------------
+    def write(self, data: bytes) -> int:
+        with self._cond:
+            self._rx += data.replace(b"\n", b"\r")
+            self._cond.notify_all()
+        return len(data)
+
+    def read(self, n: int = 1) -> bytes:
+        """Hasta n bytes; bloquea como mucho timeout s si no hay nada (o hasta cancel_read)"""
+        limite = time.perf_counter() + (self.timeout if self.timeout is not None else 1e9)
+        with self._cond:
+            self._cancelar = False
+            while True:
+                datos = self._sacar(n)
+                ahora = time.perf_counter()
+                if datos or ahora >= limite or not self.is_open or self._cancelar:
+                    self._cancelar = False
+                    return datos
+                espera = limite - ahora
+                if self._tx:
+                    espera = min(espera, max(0.0, self._tx[0][0] - ahora))
+                self._cond.wait(espera)
+
+    def readline(self) -> bytes:
+        linea = bytearray()
+        while not linea.endswith(b"\n"):
+            b = self.read(1)
+            if not b:
+                break
+            linea += b
+        return bytes(linea)
+
+    @property
+    def in_waiting(self) -> int:
+        with self._cond:
+            ahora = time.perf_counter()
+            return sum(len(d) for t, _, d in self._tx if t <= ahora)
+
+    def cancel_read(self):
+        with self._cond:
+            self._cancelar = True
+            self._cond.notify_all()
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._tx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._abortar.set()
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Simulación
+    # ------------------------------------------------------------------
+    def _sacar(self, n: int) -> bytes:
+        datos = bytearray()
+        ahora = time.perf_counter()
+        while self._tx and self._tx[0][0] <= ahora and len(datos) < n:
+            t, i, trozo = heapq.heappop(self._tx)
+            falta = n - len(datos)
+            datos += trozo[:falta]
+            if len(trozo) > falta:
+                heapq.heappush(self._tx, (t, i, trozo[falta:]))
+        return bytes(datos)
+
+    def _responder(self, texto: str):
+        with self._cond:
+            heapq.heappush(self._tx, (time.perf_counter() + self.latencia, next(self._n),
+                                      texto.encode("ascii", errors="ignore")))
+            self._cond.notify_all()
+
+    def _fin(self, salida: str = ""):
+        if self.terminador == DONE:
+            self._responder(salida + DONE + "\r\n" + PROMPT)
+        elif self.terminador == PROMPT:
+            self._responder(salida + PROMPT)
+        else:
+            self._responder(salida + f"{self.terminador}\r\n" + PROMPT)
+
+    def _duracion(self, cmd: str) -> float:
+        u = cmd.upper()
+        for prefijo, t in self.tiempos.items():
+            if u.startswith(prefijo):
+                return t
+        return self.tiempo_orden
+
+    def _procesar(self):
+        while True:
+            with self._cond:
+                while self.is_open and b"\r" not in self._rx:
+                    self._cond.wait(0.05)
+                if not self.is_open:
+                    return
+                fin = self._rx.index(b"\r")
+                cmd = self._rx[:fin].decode(errors="ignore").strip()
+                del self._rx[:fin + 1]
+            if not cmd:
+                continue
+            time.sleep(self.latencia)   # llegada por el enlace
+            t0 = time.perf_counter()
+            if self.t_inicio is None:
+                self.t_inicio = t0
+            self.recibidas.append(cmd)
+            if self.eco:
+                self._responder(cmd + "\r\n")
+            self._orden(cmd)
+            self.t_fin = time.perf_counter()
+            self.ocupado += self.t_fin - t0
+
+    def _orden(self, cmd: str):
+        u = cmd.upper()
+        if self._editando is not None:
+            self._editar(cmd, u)
+            return
+        for prefijo, texto in self.errores.items():
+            if u.startswith(prefijo.upper()):
+                self._responder(texto + "\r\n" + PROMPT)
+                return
+        if self.sin_respuesta and u.startswith(self.sin_respuesta):
+            return  # se queda callado: el que envía tiene que agotar su timeout
+        if u == "A":
+            self._abortar.set()
+            self._fin()
+            return
+        if u == "Y" and self._confirmar is not None:
+            confirmar, self._confirmar = self._confirmar, None
+            confirmar()
+            return
+        if u == "N" and self._confirmar is not None:
+            self._confirmar = None
+            self._fin()
+            return
+        partes = u.split()
+        if partes[0] == "EDIT" and len(partes) > 1:
+            self._editando = partes[1]
+            if partes[1] not in self.programas:
+                self.programas[partes[1]] = []
+                self._responder(f"{partes[1]} NOT FOUND. CREATE IT (Y/N)?")
+            else:
+                self._responder(f"{len(self.programas[partes[1]]) + 1}:?")
+        elif partes[0] == "LIST" and len(partes) > 1:
+            lineas = self.programas.get(partes[1])
+            if lineas is None:
+                self._responder("*** PROGRAM NOT FOUND\r\n" + PROMPT)
+                return
+            listado = "".join(f" {i}: {l}\r\n" for i, l in enumerate(lineas, 1))
+            self._responder(listado + "  END\r\n" + PROMPT)
+        elif partes[0] == "REMOVE" and len(partes) > 1:
+            if partes[1] not in self.programas:
+                self._responder("*** PROGRAM NOT FOUND\r\n" + PROMPT)
+                return
+            self._confirmar = lambda n=partes[1]: (self.programas.pop(n, None), self._fin())
+            self._responder("ARE YOU SURE (Y/N)?")
+        elif partes[0] == "RUN" and len(partes) > 1:
+            lineas = self.programas.get(partes[1])
+            if lineas is None:
+                self._responder("*** PROGRAM NOT FOUND\r\n" + PROMPT)
+                return
+            self._responder(PROMPT)
+            self._abortar.clear()
+            threading.Thread(target=self._ejecutar, args=(list(lineas),), daemon=True).start()
+        else:
+            time.sleep(self._duracion(cmd))
+            self._fin()
+
+    def _editar(self, cmd: str, u: str):
+        lineas = self.programas[self._editando]
+        if u == "EXIT":
+            self._editando = None
+            self._fin()
+            return
+        if not (u == "Y" and not lineas):   # el 'Y' de '¿crearlo?' no es una línea
+            lineas.append(cmd)
+        self._responder(f"{len(lineas) + 1}:?")
+
+    def _ejecutar(self, lineas):
+        for linea in lineas:
+            if self._abortar.is_set():
+                return
+            m = _RE_PRINTLN.match(linea)
+            if m:
+                self._responder(m.group(1) + "\r\n")
+            elif not linea.lstrip().startswith("*"):
+                time.sleep(self._duracion(linea))
+
+
+def abrir_pty(sim: ScorbotSimulado) -> str:
+    """Conecta sim a un pseudo-terminal y devuelve la ruta para abrirlo con pyserial"""
+    if os.name != "posix":
+        raise RuntimeError("pty sólo disponible en Linux/macOS; usa el ScorbotSimulado directamente")
+    import select
+    import tty
+
+    maestro, esclavo = os.openpty()
+    tty.setraw(esclavo)
+    ruta = os.ttyname(esclavo)
+
+    def hacia_sim():
+        while sim.is_open:
+            listos, _, _ = select.select([maestro], [], [], 0.1)
+            if listos:
+                try:
+                    sim.write(os.read(maestro, 1024))
+                except OSError:
+                    break
+
+    def desde_sim():
+        while sim.is_open:
+            datos = sim.read(1024)
+            if datos:
+                try:
+                    os.write(maestro, datos)
+                except OSError:
+                    break
+        os.close(maestro)
+        os.close(esclavo)
+
+    sim.port = ruta
+    threading.Thread(target=hacia_sim, daemon=True).start()
+    threading.Thread(target=desde_sim, daemon=True).start()
+    return ruta
+
+
+# ----------------------------------------------------------------------
+# Medición de los caminos de envío de la aplicación
+# ----------------------------------------------------------------------
+# Secuencia típica grabada con los botones de ejes: pulsaciones de 5 en 5
+SECUENCIA_PRUEBA = (["MJ 1 5"] * 10 + ["CLOSE"] + ["MJ 2 -5"] * 8 + ["MJ 3 5"] * 6
+                    + ["OPEN"] + ["MJ 1 -5"] * 10 + ["MJ 2 5"] * 8 + ["HOME"])
+
+# Programas que lanza conect.py al detectar CMG/CHG
+PROGRAMAS_CONECT = {
+    "GP": ["MOVE P1"], "DP": ["MOVE P2", "OPEN", 'PRINTLN "complete"'], "INITC": ["HOME"],
+    "GPV": ["MOVE P3", 'PRINTLN "ok2"'], "GF": ["CLOSE", 'PRINTLN "ok3"'],
+}
+
+
+def ruta_espera_fija(ser, pasos, espera=0.5):
+    """Como comun.py antes del enlace: escribir y dormir un tiempo fijo por orden"""
+    for cmd in pasos:
+        ser.write((cmd.upper() + "\r").encode())
+        time.sleep(espera)
+        ser.read(max(1, ser.in_waiting))
+    return len(pasos)
+
+
+def ruta_comun(ser, pasos):
+    """comun.execute_sequence: secuencia optimizada, orden a orden, para en el primer error"""
+    from scorbot_link import enlace, es_error
+    from secuencias import optimizar_secuencia
+
+    pasos = optimizar_secuencia(pasos)
+    link = enlace(ser)
+    for cmd in pasos:
+        if es_error(link.send(cmd.upper()).result()):
+            break
+    return len(pasos)
+
+
+def ruta_usuario(ser, pasos):
+    """usuario.robot_send: cada pulsación encola en el enlace sin esperar"""
+    from scorbot_link import enlace
+
+    link = enlace(ser)
+    futuros = [link.send(cmd) for cmd in pasos]
+    for fut in futuros:
+        fut.result()
+    return len(pasos)
+
+
+def ruta_panel(ser, pasos):
+    """integrated_panel: secuencia optimizada como lote del PlanificadorComandos"""
+    from scorbot_link import PlanificadorComandos, enlace
+    from secuencias import optimizar_secuencia
+
+    pasos = optimizar_secuencia(pasos)
+    planificador = PlanificadorComandos(lambda: enlace(ser))
+    planificador.encolar_lote(pasos).result()
+    return len(pasos)
+
+
+def ruta_programa(ser, pasos):
+    """integrated_panel 'Ejecutar como programa ACL': subir (si cambió) y un único RUN"""
+    from scorbot_link import enlace
+    from secuencias import ejecutar_en_controlador
+
+    r = ejecutar_en_controlador(enlace(ser), "BENCH", pasos)
+    return r["pasos"]
+
+
+def ruta_conect(ser, pasos=None):
+    """conect.enviar_comandos_automatically: ciclo de la celda esperando el fin de cada programa"""
+    from ciclo_automatico import PASOS_CELDA, ejecutar_pasos
+    from scorbot_link import enlace
+
+    return len(ejecutar_pasos(enlace(ser), PASOS_CELDA))
+
+
+RUTAS = {
+    "espera fija": ruta_espera_fija,
+    "comun": ruta_comun,
+    "usuario": ruta_usuario,
+    "panel (lote)": ruta_panel,
+    "panel (programa)": ruta_programa,
+    "conect": ruta_conect,
+}
+
+def medir(ruta: str, pasos=SECUENCIA_PRUEBA, pty: bool = False, **kwargs):
+    """Ejecuta un camino de envío contra un ScorbotSimulado y devuelve estadísticas"""
+    import puerto_serie
+    from scorbot_link import cerrar_enlace
+
+    kwargs.setdefault("programas", PROGRAMAS_CONECT)
+    sim = ScorbotSimulado(**kwargs)
+    if pty:
+        ser = puerto_serie.abrir(abrir_pty(sim), baudrate=9600, timeout=puerto_serie.LECTURA_MAX)
+    else:
+        ser = sim
+    t0 = time.perf_counter()
+    try:
+        ordenes = RUTAS[ruta](ser, list(pasos))
+        segundos = time.perf_counter() - t0
+    finally:
+        cerrar_enlace(ser)
+        puerto_serie.cerrar(ser)
+        sim.close()
+    return {
+        "ruta": ruta,
+        "pasos": len(pasos),
+        "ordenes": ordenes,
+        "recibidas": len(sim.recibidas),
+        "segundos": segundos,
+        "ordenes_s": len(sim.recibidas) / segundos if segundos else 0.0,
+        "controlador_ocupado_s": sim.ocupado,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    pty = "--pty" in sys.argv
+    print(f"Secuencia de prueba: {len(SECUENCIA_PRUEBA)} pulsaciones"
+          + (" (por pty)" if pty else ""))
+    for nombre in RUTAS:
+        r = medir(nombre, pty=pty)
+        print(f"{r['ruta']:>17}: {r['ordenes_s']:7.1f} órdenes/s  {r['segundos']:6.2f} s  "
+              f"{r['recibidas']:3d} órdenes al controlador  "
+              f"ocupado {r['controlador_ocupado_s']:5.2f} s")
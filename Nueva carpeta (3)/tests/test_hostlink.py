@@ -0,0 +1,194 @@
+"""
+Pruebas de hostlink: las tramas calculadas son las mismas que se escribían a
+mano, el parser acepta / rechaza lo que debe y ReceptorHostLink da los mismos
+eventos sin importar cómo llegue partido el texto.
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hostlink  # noqa: E402
+
+# Tramas que estaban escritas a mano en cinta.send_deliver / send_free (y en
+# DELIVER_COMMANDS de integrated_panel) antes de calcularlas con hostlink
+DELIVER_ORIGINAL = {
+    (1, 1): "@00WD000900015B*",
+    (1, 2): "@00WD0010000153*",
+    (1, 3): "@00WD0011000152*",
+    (1, 5): "@00WD0013000150*",
+    (1, 6): "@00WD0014000157*",
+    (2, 1): "@00WD0009000258*",
+    (2, 2): "@00WD0010000250*",
+    (2, 3): "@00WD0011000251*",
+    (2, 5): "@00WD0013000253*",
+    (2, 6): "@00WD0014000254*",
+    (3, 1): "@00WD0009000359*",
+    (3, 2): "@00WD0010000351*",
+    (3, 3): "@00WD0011000350*",
+    (3, 5): "@00WD0013000352*",
+    (3, 6): "@00WD0014000355*",
+    (5, 1): "@00WD000900055F*",
+    (5, 2): "@00WD0010000557*",
+    (5, 3): "@00WD0011000556*",
+    (5, 5): "@00WD0013000554*",
+    (5, 6): "@00WD0014000553*",
+    (6, 1): "@00WD000900065C*",
+    (6, 2): "@00WD0010000654*",
+    (6, 3): "@00WD0011000655*",
+    (6, 5): "@00WD0013000657*",
+    (6, 6): "@00WD0014000650*",
+}
+FREE_ESTACION_ORIGINAL = {
+    1: "@00WD004800015E*",
+    2: "@00WD004900015F*",
+    3: "@00WD0050000157*",
+    5: "@00WD0052000155*",
+    6: "@00WD0053000154*",
+}
+FREE_PALLET_ORIGINAL = {
+    1: "@00WD000900995A*",
+    2: "@00WD0010009952*",
+    3: "@00WD0011009953*",
+    5: "@00WD0013009951*",
+    6: "@00WD0014009956*",
+}
+
+
+class TestTramasOriginales(unittest.TestCase):
+    def test_deliver(self):
+        self.assertEqual(hostlink.DELIVER, DELIVER_ORIGINAL)
+
+    def test_free_estacion(self):
+        self.assertEqual(hostlink.FREE_ESTACION, FREE_ESTACION_ORIGINAL)
+
+    def test_free_pallet(self):
+        self.assertEqual(hostlink.FREE_PALLET, FREE_PALLET_ORIGINAL)
+
+    def test_fcs_de_las_originales(self):
+        originales = (list(DELIVER_ORIGINAL.values()) + list(FREE_ESTACION_ORIGINAL.values())
+                      + list(FREE_PALLET_ORIGINAL.values()))
+        self.assertEqual(len(originales), 35)
+        for t in originales:
+            self.assertTrue(hostlink.verificar_fcs(t), t)
+
+    def test_free_en_una_transaccion(self):
+        # Las dos tramas de Free, en el orden en que se enviaban (estación, luego pallet)
+        palabras = {hostlink.DM_ESTACION + 2: 1, hostlink.DM_PALLET + 3: hostlink.LIBERAR_PALLET}
+        tramas = [hostlink.wd(inicio, valores) for inicio, valores in hostlink.bloques(palabras)]
+        self.assertEqual(tramas, [FREE_ESTACION_ORIGINAL[2], FREE_PALLET_ORIGINAL[3]])
+
+
+class TestParsear(unittest.TestCase):
+    def test_ida_y_vuelta(self):
+        for cabecera, texto in [("WD", "00"), ("WD", "13"), ("RD", "00" + "0001009900020003")]:
+            t = hostlink.trama(cabecera, texto)
+            r = hostlink.parsear(t + "\r")
+            self.assertEqual((r.unidad, r.cabecera, r.codigo_fin), (0, cabecera, texto[:2]))
+            self.assertEqual(r.ok, texto[:2] == "00")
+            self.assertEqual(r.texto, t)
+        r = hostlink.parsear(hostlink.trama("RD", "00" + "0001009900020003"))
+        self.assertEqual(r.palabras(), [1, 0x99, 2, 3])
+
+    def test_originales_como_respuesta(self):
+        for t in DELIVER_ORIGINAL.values():
+            r = hostlink.parsear(t)
+            self.assertEqual(r.cabecera, "WD")
+
+    def test_fcs_erroneo(self):
+        t = hostlink.trama("WD", "00")
+        malo = t[:-3] + ("00" if t[-3:-1] != "00" else "01") + "*"
+        self.assertFalse(hostlink.verificar_fcs(malo))
+        with self.assertRaises(hostlink.ErrorHostLink):
+            hostlink.parsear(malo)
+
+    def test_trama_incompleta(self):
+        with self.assertRaises(hostlink.ErrorHostLink):
+            hostlink.parsear("@00WD0053")
+
+
+
+def _mensaje(rnd):
+    """Texto que podría mandar el PLC y lo que se espera de él: (texto, [(tipo, estación, pallet)])"""
+    k = rnd.randrange(6)
+    e, p = rnd.choice(hostlink.ESTACIONES), rnd.choice(hostlink.PALLETS)
+    if k == 0:
+        return hostlink.trama("WD", "00") + "\r", [(hostlink.ACUSE, None, None)]
+    if k == 1:
+        codigo = rnd.choice(["01", "13", "14", "15", "23"])
+        return hostlink.trama("WD", codigo) + "\r", [(hostlink.ERROR, None, None)]
+    if k == 2:
+        datos = "".join("%04X" % rnd.randrange(0x10000) for _ in range(rnd.randrange(1, 7)))
+        return hostlink.trama("RD", "00" + datos) + "\r", [(hostlink.ACUSE, None, None)]
+    if k == 3:
+        return hostlink.trama("EX", "%04d%04d" % (e, p)) + "\r", [(hostlink.PASO, e, p)]
+    if k == 4:
+        return "EX%04d%04d\r\n" % (e, p), [(hostlink.PASO, e, p)]
+    return "EX%04d%04d" % (e, p), [(hostlink.PASO, e, p)]   # sin fin de línea
+
+
+def _firma(eventos):
+    return [(ev.tipo, ev.estacion, ev.pallet) for ev in eventos]
+
+
+def _alimentar_partido(texto, rnd, maximo):
+    receptor = hostlink.ReceptorHostLink()
+    eventos = []
+    i = 0
+    while i < len(texto):
+        n = rnd.randrange(1, maximo + 1)
+        eventos += receptor.alimentar(texto[i:i + n])
+        i += n
+    return eventos
+
+
+class TestReceptor(unittest.TestCase):
+    def test_trozos_aleatorios(self):
+        rnd = random.Random(2024)
+        for ronda in range(2000):
+            mensajes = [_mensaje(rnd) for _ in range(rnd.randrange(1, 15))]
+            texto = "".join(t for t, _ in mensajes)
+            esperado = [x for _, eventos in mensajes for x in eventos]
+            de_una_vez = _firma(hostlink.ReceptorHostLink().alimentar(texto))
+            self.assertEqual(de_una_vez, esperado, texto)
+            partido = _firma(_alimentar_partido(texto, rnd, rnd.choice((1, 3, 12, 40))))
+            self.assertEqual(partido, de_una_vez, (ronda, texto))
+
+    def test_caracter_a_caracter(self):
+        rnd = random.Random(7)
+        texto = "".join(_mensaje(rnd)[0] for _ in range(200))
+        self.assertEqual(_firma(_alimentar_partido(texto, rnd, 1)),
+                         _firma(hostlink.ReceptorHostLink().alimentar(texto)))
+
+    def test_ex_suelto_sin_esperar_fin_de_linea(self):
+        receptor = hostlink.ReceptorHostLink()
+        self.assertEqual(receptor.alimentar("EX0001"), [])
+        self.assertEqual(_firma(receptor.alimentar("0002")), [(hostlink.PASO, 1, 2)])
+        self.assertEqual(receptor.alimentar("\r\n"), [])
+
+    def test_trama_corrupta_no_afecta_a_las_demas(self):
+        buena = hostlink.trama("WD", "00")
+        mala = buena[:5] + "1" + buena[6:]
+        eventos = hostlink.ReceptorHostLink().alimentar(mala + "\r" + buena + "\r")
+        self.assertEqual([ev.tipo for ev in eventos], [hostlink.INVALIDA, hostlink.ACUSE])
+
+    def test_suscriptores_por_tipo(self):
+        receptor = hostlink.ReceptorHostLink()
+        pasos, todos = [], []
+        receptor.suscribir(pasos.append, tipos=(hostlink.PASO,))
+        baja = receptor.suscribir(todos.append)
+        receptor.alimentar(hostlink.trama("WD", "00") + "\rEX00020003\r\n")
+        self.assertEqual(_firma(pasos), [(hostlink.PASO, 2, 3)])
+        self.assertEqual(len(todos), 2)
+        baja()
+        receptor.alimentar("EX00010001")
+        self.assertEqual(len(todos), 2)
+        self.assertEqual(len(pasos), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Prueba de oro de la generación de G-code: el motor vectorizado (numpy) da el
+mismo texto, byte a byte, que el generador original (python) para varias
+imágenes, modos, inversión y gamma.
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ArucoProyectoBloqueo as apb  # noqa: E402
+
+PARAMS = dict(size_mm=(12, 8), ppmm=5, origin_xy=(1.5, -2.0), f_engrave=1200,
+              f_travel=3000, s_max=1000)
+
+
+def _imagenes():
+    """Imágenes fijas (nombre, Image en escala de grises)"""
+    rnd = np.random.RandomState(1234)
+    degradado = np.tile(np.linspace(0, 255, 90).astype(np.uint8), (60, 1))
+    ruido = rnd.randint(0, 256, (60, 90)).astype(np.uint8)
+    bloques = np.full((60, 90), 255, np.uint8)
+    bloques[10:25, 5:40] = 0
+    bloques[30:55, 50:85] = 90
+    bloques[:, 44] = 0                       # tramo de un solo píxel
+    bloques[0, :] = 0                        # fila entera (tramo hasta el borde)
+    return [("degradado", Image.fromarray(degradado)),
+            ("ruido", Image.fromarray(ruido)),
+            ("bloques", Image.fromarray(bloques)),
+            ("blanco", Image.fromarray(np.full((60, 90), 255, np.uint8))),
+            ("negro", Image.fromarray(np.zeros((60, 90), np.uint8)))]
+
+
+class TestMotoresRaster(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.rutas = []
+        for nombre, img in _imagenes():
+            ruta = os.path.join(cls.dir, nombre + ".png")
+            img.save(ruta)
+            cls.rutas.append(ruta)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir, ignore_errors=True)
+
+    def _comparar(self, **kw):
+        textos = {motor: apb.generate_gcode_text(engine=motor, **PARAMS, **kw)
+                  for motor in apb.RASTER_ENGINES}
+        self.assertEqual(textos["numpy"], textos["python"], kw)
+        return textos["python"]
+
+    def test_graysc_con_gamma(self):
+        for ruta in self.rutas:
+            for invert in (False, True):
+                for gamma_val in (1.0, 0.6, 2.2):
+                    self._comparar(image_path=ruta, mode="graysc", invert=invert, gamma_val=gamma_val)
+
+    def test_grayscale(self):
+        for ruta in self.rutas:
+            for invert in (False, True):
+                self._comparar(image_path=ruta, mode="grayscale", invert=invert, gamma_val=0.6)
+
+    def test_umbral(self):
+        for ruta in self.rutas:
+            for invert in (False, True):
+                self._comparar(image_path=ruta, mode="threshold", invert=invert, gamma_val=1.0)
+
+    def test_imagen_binaria(self):
+        # Imágenes en modo '1' (blanco y negro) van directas a los motores
+        _, img = _imagenes()[2]
+        bn = img.point(lambda p: 0 if p < 128 else 255, "1")
+        for mode in ("graysc", "threshold"):
+            kw = dict(ppmm=5, origin=(0, 0), f_engrave=800, f_travel=2000, s_max=255,
+                      mode=mode, gamma_val=0.6)
+            self.assertEqual(list(apb.raster_to_gcode_np(bn, **kw)), list(apb.raster_to_gcode(bn, **kw)))
+
+    def test_hay_grabado(self):
+        # Que la comparación no pase por ser dos textos vacíos
+        texto = self._comparar(image_path=self.rutas[2], mode="graysc", invert=False, gamma_val=0.6)
+        self.assertIn("M4 S", texto)
+        self.assertTrue(texto.startswith(";; --- BEGIN ---"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+Pruebas del envío de G-code contra simulador_grbl.GrblSimulado: una pausa
+(feed-hold) más larga que STREAM_TIMEOUT no aborta el trabajo, y un GRBL que
+deja de contestar sí. Un trabajo que no está en la caché se genera a la vez
+que se envía y sólo queda en la caché si se envió entero.
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ArucoProyectoBloqueo as apb  # noqa: E402
+from gcode_cache import GcodeCache  # noqa: E402
+from simulador_grbl import GrblSimulado  # noqa: E402
+
+GCODE = "\n".join(f"G1 X{i % 50} Y{i // 50} F1000" for i in range(400)) + "\n"
+
+
+class TestPausaDelEnvio(unittest.TestCase):
+    def setUp(self):
+        self._timeout = apb.STREAM_TIMEOUT
+        apb.STREAM_TIMEOUT = 0.5
+
+    def tearDown(self):
+        apb.STREAM_TIMEOUT = self._timeout
+
+    def _esperar(self, evento, condicion, timeout=10.0):
+        limite = time.monotonic() + timeout
+        while not condicion() and time.monotonic() < limite:
+            evento.wait(0.01)
+
+    def test_pausa_mas_larga_que_el_timeout(self):
+        eventos = []
+        cambio = threading.Event()
+
+        def on_event(ev):
+            eventos.append(ev)
+            cambio.set()
+
+        sim = GrblSimulado(tiempo_bloque=0.004)
+        runner = apb.LaserJobRunner(on_event=on_event)
+        try:
+            runner.submit(sim, GCODE, nombre="pausa")
+            self._esperar(cambio, lambda: any(e.get("enviadas", 0) > 20 for e in eventos))
+            runner.pause()
+            time.sleep(apb.STREAM_TIMEOUT * 3)
+            runner.resume()
+            self._esperar(cambio, lambda: eventos[-1]["tipo"] in ("fin", "error", "cancelado"))
+        finally:
+            runner.stop()
+            sim.close()
+        tipos = [e["tipo"] for e in eventos]
+        self.assertIn("pausa", tipos)
+        self.assertIn("reanudar", tipos)
+        self.assertEqual(eventos[-1]["tipo"], "fin", [e for e in eventos if e["tipo"] == "log"])
+        self.assertEqual(eventos[-1]["resultado"], 0)
+
+    def test_sin_respuesta_aborta(self):
+        # Un feed-hold que el envío no conoce (sin pause) es, para él, un GRBL callado
+        sim = GrblSimulado(tiempo_bloque=0.004)
+        mensajes = []
+        pausar = threading.Timer(0.2, sim.write, args=(b"!",))
+        # Se reanuda después del timeout para que el M5 final tenga respuesta
+        reanudar = threading.Timer(0.2 + apb.STREAM_TIMEOUT * 2, sim.write, args=(b"~",))
+        pausar.start()
+        reanudar.start()
+        try:
+            resultado = apb.stream_to_grbl(sim, GCODE, log=mensajes.append)
+        finally:
+            pausar.cancel()
+            reanudar.cancel()
+            sim.close()
+        self.assertEqual(resultado, 2)
+        self.assertTrue(any("sin respuesta" in m for m in mensajes), mensajes)
+
+
+class TestTrabajoAlVuelo(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.imagen = os.path.join(self.dir, "degradado.png")
+        Image.fromarray(np.tile(np.linspace(0, 255, 60).astype(np.uint8), (40, 1))).save(self.imagen)
+        self.params = dict(image_path=self.imagen, size_mm=(12, 8), ppmm=5, mode="graysc",
+                           invert=False, gamma_val=1.0, origin_xy=(0.0, 0.0),
+                           f_engrave=1200, f_travel=3000, s_max=1000)
+        self.cache = GcodeCache(os.path.join(self.dir, "cache"))
+        parche = mock.patch.object(apb, "cache_global", lambda: self.cache)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _grabar(self, sim):
+        terminado = threading.Event()
+        eventos = []
+
+        def on_event(ev):
+            eventos.append(ev)
+            if ev["tipo"] in ("fin", "error", "cancelado"):
+                terminado.set()
+
+        runner = apb.LaserJobRunner(on_event=on_event)
+        try:
+            runner.submit(sim, lambda: apb.gcode_trabajo(**self.params), nombre="al vuelo")
+            self.assertTrue(terminado.wait(30), eventos[-3:])
+        finally:
+            runner.stop()
+            sim.close()
+        return eventos[-1]
+
+    def _en_cache(self):
+        return [n for n in os.listdir(self.cache.directorio) if not n.startswith(".")]
+
+    def test_fallo_se_envia_y_queda_en_cache(self):
+        self.assertNotIsInstance(apb.gcode_trabajo(**self.params), str)
+        fin = self._grabar(GrblSimulado(tiempo_bloque=0.0005))
+        self.assertEqual(fin["tipo"], "fin", fin)
+        self.assertIsNone(fin["total"])   # no se sabía el total al empezar
+        texto = apb.gcode_trabajo(**self.params)
+        self.assertEqual(texto, apb.generate_gcode_text(**self.params))
+        self.assertEqual(fin["enviadas"], apb.contar_lineas_gcode(texto))
+
+    def test_envio_cortado_no_deja_cache(self):
+        fin = self._grabar(GrblSimulado(tiempo_bloque=0.0005, errores={40: 20}))
+        self.assertEqual(fin["tipo"], "error", fin)
+        self.assertEqual(self._en_cache(), [])
+        self.assertNotIsInstance(apb.gcode_trabajo(**self.params), str)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 import os, time, socket, threading, tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+from gcode_cache import cache_global, PrecalentadorCatalogo
+from estimador_gcode import estimar_tiempo, leer_ajustes_grbl
+import scorbot_link
+import puerto_serie
 
 # ===== Serial para el ROBOT (7E1 + XON/XOFF) =====
 try:
@@ -11,8 +15,9 @@ except Exception:
 def open_robot_serial(port: str, baud: int):
     if serial is None:
         raise RuntimeError("Falta pyserial. Instala con: pip install pyserial")
-    ser = serial.Serial(
-        port=port,
+    # Un solo objeto (y un solo hilo de E/S) por puerto aunque lo abran varios paneles
+    return puerto_serie.abrir(
+        port,
         baudrate=baud,
         bytesize=serial.SEVENBITS,     # 7 bits
         parity=serial.PARITY_EVEN,     # paridad par
@@ -23,8 +28,6 @@ def open_robot_serial(port: str, baud: int):
         rtscts=False,
         dsrdtr=False,
     )
-    ser.reset_input_buffer(); ser.reset_output_buffer()
-    return ser
 
 # ===== Utilidades LÁSER (tus funciones existentes) =====
 try:
@@ -33,12 +36,23 @@ try:
         move_to_offset_and_set_origin, move_back_to_machine_origin, send_cmd,
     )
 except Exception:
-    def open_serial(*a, **k): raise RuntimeError("open_serial() no disponible.")
-    def generate_gcode_text(*a, **k): return ""
-    def stream_to_grbl(*a, **k): return 0
-    def move_to_offset_and_set_origin(*a, **k): pass
-    def move_back_to_machine_origin(*a, **k): pass
-    def send_cmd(*a, **k): pass
+    try:
+        from ArucoProyectoBloqueo import (
+            open_serial, generate_gcode_text, stream_to_grbl,
+            move_to_offset_and_set_origin, move_back_to_machine_origin, send_cmd,
+        )
+    except Exception:
+        def open_serial(*a, **k): raise RuntimeError("open_serial() no disponible.")
+        def generate_gcode_text(*a, **k): return ""
+        def stream_to_grbl(*a, **k): return 0
+        def move_to_offset_and_set_origin(*a, **k): pass
+        def move_back_to_machine_origin(*a, **k): pass
+        def send_cmd(*a, **k): pass
+
+try:
+    from ArucoProyectoBloqueo import LaserJobRunner, gcode_trabajo
+except Exception:
+    LaserJobRunner = None
 
 HOST, PORT = "10.4.3.76", 8888
 SCORBOT_EOL_DEFAULT = "\r"
@@ -46,6 +60,8 @@ SCORBOT_EOL_DEFAULT = "\r"
 PROFILE="photo"; F_TRAVEL=1000; SIZE_MM=(20,20); OFFSET_DX,OFFSET_DY,OFFSET_FEED=270,-170,1000
 RUTAS_IMAGENES = {f"Opción {i}": rf"C:\Users\cimla\Pictures\Camera Roll\aruco_{i}.png" for i in range(1,16)}
 OPCIONES = list(RUTAS_IMAGENES.keys())
+PARAMS_GCODE = dict(size_mm=SIZE_MM, ppmm=5, mode="grayscale", invert=False, gamma_val=0.6,
+                    origin_xy=(0.0,0.0), f_engrave=1000, f_travel=F_TRAVEL, s_max=600)
 
 # ===================== Cliente TCP =====================
 class ClientGUI:
@@ -133,8 +149,20 @@ class ClientGUI:
                 if self.socket: self.socket.close()
                 self.append_message(" Error al recibir. Conexión cerrada.\n"); break
 
+    def _reply_estimate(self, n:int):
+        # Responde 'Laser,Tiempo,N,<segundos>' para que el PLC planifique el pallet
+        def worker():
+            seg = self.laser_panel.estimate_option(n)
+            if seg is None: return
+            try:
+                self.socket.sendall(f"Laser,Tiempo,{n},{seg:.1f}\n".encode())
+                self.append_message(f" Tiempo estimado opción {n}: {seg:.1f} s\n")
+            except Exception:
+                pass
+        threading.Thread(target=worker, daemon=True).start()
+
     def _try_handle_server_line(self, line: str):
-        # Acepta: 'Laser,1,Imprimir' | 'Laser,Imprimir,1' | 'Laser,PosicionarLaser'
+        # Acepta: 'Laser,1,Imprimir' | 'Laser,Imprimir,1' | 'Laser,Estimar,1' | 'Laser,PosicionarLaser'
         txt = line.strip()
         if txt.lower().startswith("server:"):
             txt = txt.split(":",1)[1].strip()
@@ -143,15 +171,21 @@ class ClientGUI:
         if not parts or parts[0].lower()!="laser": return
 
         tokens = [parts[0]] + ["".join(ch for ch in p.lower() if ch not in (" ","_")) for p in parts[1:]]
+        if "tiempo" in tokens:
+            return  # respuesta de _reply_estimate (propia o reenviada): no es una orden
         accion=None; numero=None
         for p in tokens[1:]:
             if p.isdigit(): numero=int(p)
             elif p in ("imprimir","imprime","print"): accion="imprimir"
             elif p in ("posicionarlaser","poslaser","posicionar"): accion="posicionarlaser"
+            elif p=="estimar": accion="estimar"
 
         if accion=="imprimir" and numero is not None and self.laser_panel:
+            self._reply_estimate(numero)
             self.master.after(0, self.laser_panel.print_option, numero)
             self.append_message(f" Orden LÁSER: imprimir opción {numero}\n")
+        elif accion=="estimar" and numero is not None and self.laser_panel:
+            self._reply_estimate(numero)
         elif accion=="PosicionarLaser" and self.laser_panel:
             self.master.after(0, self.laser_panel.robot_run_pos1)
             self.append_message(" Orden ROBOT: run POS1\n")
@@ -201,6 +235,7 @@ class SerialPanel(tk.Frame):
         self.laser_baud=tk.StringVar(value="115200")
         self.selected_option=tk.StringVar(value="Elegir opción…")
         self._last_image_path=None
+        self.ajustes_grbl=None   # '$$' del láser (None = valores por defecto de GRBL)
 
         laser=tk.LabelFrame(self, text="🔦 LÁSER (opcional)")
         laser.place(x=10, y=340, width=420, height=230)
@@ -224,6 +259,14 @@ class SerialPanel(tk.Frame):
         self.menu.add_separator(); self.menu.add_command(label="Elegir archivo…", command=self.pick_file)
         tk.Button(laser, text="Imprimir", command=self.on_print).place(x=340,y=160,width=50,height=26)
 
+        # Progreso y control del trabajo en curso
+        self.laser_progress=tk.StringVar(value="Sin trabajo")
+        tk.Label(laser, textvariable=self.laser_progress, anchor="w").place(x=8,y=192,width=200)
+        tk.Button(laser, text="Pausa", command=self.laser_pause).place(x=215,y=190,width=55,height=24)
+        tk.Button(laser, text="Seguir", command=self.laser_resume).place(x=275,y=190,width=55,height=24)
+        tk.Button(laser, text="Cancelar", command=self.laser_cancel).place(x=335,y=190,width=55,height=24)
+        self.laser_runner=LaserJobRunner(self, self._on_laser_event) if LaserJobRunner else None
+
         self.config(width=440, height=580)
 
     # -------- Utils de log --------
@@ -246,7 +289,8 @@ class SerialPanel(tk.Frame):
     def robot_disconnect(self):
         try:
             if self.ser_robot and getattr(self.ser_robot,"is_open",False):
-                self.ser_robot.close(); self.rlog("🔌 ROBOT desconectado.")
+                scorbot_link.cerrar_enlace(self.ser_robot)
+                puerto_serie.cerrar(self.ser_robot); self.rlog("🔌 ROBOT desconectado.")
         except Exception as e:
             messagebox.showerror("ROBOT", str(e))
 
@@ -265,17 +309,16 @@ class SerialPanel(tk.Frame):
             if not (self.ser_robot and getattr(self.ser_robot,"is_open",False)):
                 self.robot_connect()
             eol=self._robot_eol(); cmd=self._robot_format(raw)
-            payload=(cmd+eol).encode("ascii", errors="ignore")
-            self.ser_robot.write(payload); self.ser_robot.flush()   # << asegura envío
-            hexs=" ".join(f"{b:02X}" for b in payload)
+            link=scorbot_link.enlace(self.ser_robot); link.eol=eol
+            fut=link.send(cmd)
+            hexs=" ".join(f"{b:02X}" for b in (cmd+eol).encode("ascii", errors="ignore"))
             self.rlog(f"[ROBOT >>] {cmd}  (hex: {hexs})")
-            time.sleep(0.1)
-            try:
-                n=self.ser_robot.in_waiting if hasattr(self.ser_robot,"in_waiting") else 0
-                if n:
-                    resp=self.ser_robot.read(n).decode(errors="ignore").strip()
-                    if resp: self.rlog(f"[<< ROBOT] {resp}")
-            except Exception: pass
+            # La respuesta se muestra al llegar su terminador ('Done.', '>' o error), sin bloquear la UI
+            def _resp(f):
+                resp=scorbot_link.texto_respuesta(f)
+                if resp: self.after(0, lambda: self.rlog(f"[<< ROBOT] {resp}"))
+            fut.add_done_callback(_resp)
+            return fut
         except Exception as e:
             messagebox.showerror("ROBOT", f"No se pudo enviar '{raw}': {e}")
 
@@ -296,12 +339,15 @@ class SerialPanel(tk.Frame):
             port=self.laser_port.get(); baud=int(self.laser_baud.get())
             self.ser_laser=open_serial(port, baud)
             self.llog(f"✅ Conectado LÁSER {port} @ {baud}")
+            try: self.ajustes_grbl=leer_ajustes_grbl(self.ser_laser)
+            except Exception as e: self.llog(f"[GRBL] No se pudieron leer los ajustes $$: {e}")
         except Exception as e:
             messagebox.showerror("LÁSER", f"No se pudo abrir {self.laser_port.get()}\n{e}")
 
     def laser_disconnect(self):
         try:
             if self.ser_laser and getattr(self.ser_laser,"is_open",False):
+                if self.laser_runner: self.laser_runner.cancel(todos=True)
                 try: send_cmd(self.ser_laser,"M5")
                 except Exception: pass
                 self.ser_laser.close(); self.llog("🔌 LÁSER desconectado.")
@@ -314,6 +360,16 @@ class SerialPanel(tk.Frame):
         self.selected_option.set(nombre); self._last_image_path=path
         self.llog(f"[SERVER] Imprimir {nombre}"); self.on_print()
 
+    def estimate_option(self, n:int):
+        # Segundos estimados del grabado de la opción n (None si no existe); seguro desde otros hilos
+        path=RUTAS_IMAGENES.get(f"Opción {n}")
+        if not path: return None
+        try:
+            gcode=cache_global().obtener(generate_gcode_text, image_path=path, **PARAMS_GCODE)
+            return estimar_tiempo(gcode, self.ajustes_grbl) if gcode else None
+        except Exception:
+            return None
+
     def on_select(self, nombre):
         self.selected_option.set(nombre); self._last_image_path=RUTAS_IMAGENES.get(nombre)
 
@@ -326,15 +382,44 @@ class SerialPanel(tk.Frame):
         if not self._last_image_path:
             messagebox.showwarning("Falta selección","Elige una imagen antes de imprimir."); return
         self.laser_connect()
-        self.llog("[GCODE] Generando…")
-        gcode=generate_gcode_text(image_path=self._last_image_path, size_mm=SIZE_MM, ppmm=5,
-                                  mode="grayscale", invert=False, gamma_val=0.6, origin_xy=(0.0,0.0),
-                                  f_engrave=1000, f_travel=F_TRAVEL, s_max=600)
+        if not (self.ser_laser and getattr(self.ser_laser,"is_open",False)): return
+        path=self._last_image_path
+        gcode=lambda: cache_global().obtener(generate_gcode_text, image_path=path, **PARAMS_GCODE)
+        if self.laser_runner:
+            # Se ejecuta en el hilo del láser: la ventana sigue respondiendo; si no
+            # está en la caché se genera a la vez que se envía
+            self.laser_runner.submit(self.ser_laser, lambda: gcode_trabajo(image_path=path, **PARAMS_GCODE),
+                nombre=self.selected_option.get(),
+                antes=lambda ser: move_to_offset_and_set_origin(ser, dx=OFFSET_DX, dy=OFFSET_DY, feed=OFFSET_FEED),
+                despues=move_back_to_machine_origin)
+            self.llog(f"[COLA] {self.selected_option.get()} en cola.")
+            return
+        self.llog("[GCODE] Generando…"); gcode=gcode()
         self.llog("[POSICIÓN] Moviendo a offset…"); move_to_offset_and_set_origin(self.ser_laser, dx=OFFSET_DX, dy=OFFSET_DY, feed=OFFSET_FEED)
         self.llog("[ENVÍO] Enviando trabajo…"); stream_to_grbl(self.ser_laser, gcode)
         self.llog("Regresando a origen…"); move_back_to_machine_origin(self.ser_laser)
         self.llog("✅ Grabado finalizado.")
 
+    def laser_pause(self):
+        if self.laser_runner: self.laser_runner.pause()
+    def laser_resume(self):
+        if self.laser_runner: self.laser_runner.resume()
+    def laser_cancel(self):
+        if self.laser_runner: self.laser_runner.cancel()
+
+    def _on_laser_event(self, ev):
+        tipo=ev["tipo"]; nombre=ev["nombre"]
+        if tipo=="inicio": self.llog(f"[ENVÍO] {nombre}: enviando trabajo…")
+        elif tipo=="progreso":
+            eta=f" · ETA {ev['eta']:.0f} s" if ev.get("eta") is not None else ""
+            self.laser_progress.set(f"{ev['enviadas']}/{ev['total'] or '?'} líneas{eta}")
+        elif tipo=="pausa": self.llog("⏸ Pausa (feed-hold)"); self.laser_progress.set("En pausa")
+        elif tipo=="reanudar": self.llog("▶ Reanudado")
+        elif tipo=="log": self.llog(ev["mensaje"])
+        elif tipo=="fin": self.llog(f"✅ Grabado finalizado ({ev['duracion']:.0f} s)."); self.laser_progress.set("Sin trabajo")
+        elif tipo=="cancelado": self.llog("⛔ Grabado cancelado (soft-reset)."); self.laser_progress.set("Cancelado")
+        elif tipo=="error": self.llog(f"❌ Error en el grabado {ev.get('mensaje','')}"); self.laser_progress.set("Error")
+
 # ===================== Main =====================
 def main():
     root=tk.Tk(); root.geometry("1050x620"); root.resizable(0,0); root.title("Comunicacion Serial")
@@ -343,7 +428,13 @@ def main():
 
     panel=SerialPanel(frame_serial); panel.pack(fill="both", expand=True, padx=8, pady=8)
     ClientGUI(frame_cliente, laser_panel=panel)
+
+    # G-code de todo el catálogo generado en segundo plano (se rehace si cambia un PNG)
+    precalentador=PrecalentadorCatalogo(cache_global(), generate_gcode_text, RUTAS_IMAGENES, PARAMS_GCODE,
+                                        log=lambda s: root.after(0, panel.llog, s))
+    precalentador.iniciar()
     root.mainloop()
+    precalentador.detener()
 
 if __name__=="__main__":
     main()